@@ -5,15 +5,37 @@ Math Worksheet Generator - Maths Worksheet (ttkbootstrap style)
 Function: Generates an 18x5 math problems worksheet, supporting PDF export and printing.
 """
 
+import time
+
+# Start of the start-up clock (see --startup-timing)
+_process_start = time.perf_counter()
+
 import tkinter as tk
 from tkinter import filedialog
 import random
 import json
+import html
+import hashlib
+import math
 import os
 import sys
+import csv
+import sqlite3
+import zlib
+import mmap
+import struct
+import re
+import operator
+import argparse
 import subprocess
 import platform
-from datetime import datetime
+import multiprocessing
+import threading
+import queue
+from collections import Counter, deque
+from datetime import datetime, timezone
+from fractions import Fraction
+from itertools import compress
 from typing import List, Tuple, Dict, Any
 
 # ttkbootstrap UI library
@@ -24,30 +46,1576 @@ except ImportError:
     print("Please install ttkbootstrap: pip install ttkbootstrap")
     sys.exit(1)
 
-# PDF generation library
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm, inch
-    from reportlab.lib.colors import black, gray, darkgray, lightgrey
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-except ImportError:
-    print("Please install reportlab: pip install reportlab")
-    sys.exit(1)
+# PDF generation library, imported by load_reportlab() on the first export or print
+# so that it does not slow down showing the window
+rl_config = canvas = A4 = A3 = mm = HexColor = pdfmetrics = TTFont = UnicodeCIDFont = None
+
+
+def load_reportlab():
+    """Import the reportlab modules used for PDF output (once)"""
+    global rl_config, canvas, A4, A3, mm, HexColor, pdfmetrics, TTFont, UnicodeCIDFont
+    if canvas is not None:
+        return
+    try:
+        from reportlab import rl_config
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4, A3
+        from reportlab.lib.units import mm
+        from reportlab.lib.colors import HexColor
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+        from reportlab.pdfbase import cidfonts
+    except ImportError:
+        raise ImportError("Please install reportlab: pip install reportlab")
+    cidfonts.defaultUnicodeEncodings.update(PDF_CID_ENCODINGS)
+
+
+# PDF fonts per language: TrueType candidates (file name, subfont index for .ttc),
+# searched in the bundled "fonts" folder first and then in the system font folders.
+# reportlab embeds TrueType fonts as subsets, so only the glyphs used are written.
+PDF_FONT_FILES = {
+    'zh-tw': [('msjh.ttc', 0), ('mingliu.ttc', 0), ('wqy-microhei.ttc', 0), ('wqy-zenhei.ttc', 0),
+              ('uming.ttc', 0)],
+    'zh-cn': [('msyh.ttc', 0), ('simhei.ttf', 0), ('simsun.ttc', 0), ('wqy-microhei.ttc', 0),
+              ('wqy-zenhei.ttc', 0)],
+    'ja': [('meiryo.ttc', 0), ('msgothic.ttc', 0), ('fonts-japanese-gothic.ttf', 0), ('TakaoPGothic.ttf', 0)],
+    'ko': [('malgun.ttf', 0), ('gulim.ttc', 0), ('AppleGothic.ttf', 0), ('NanumGothic.ttf', 0)],
+    'hi': [('Nirmala.ttf', 0), ('mangal.ttf', 0), ('NotoSansDevanagari-Regular.ttf', 0),
+           ('Lohit-Devanagari.ttf', 0)],
+}
+
+# Built-in CID fonts used when no CJK TrueType font is installed (not embedded, nothing to subset)
+PDF_CID_FONTS = {
+    'zh-tw': 'MSung-Light',
+    'zh-cn': 'STSong-Light',
+    'ja': 'HeiseiKakuGo-W5',
+    'ko': 'HYGothic-Medium',
+}
+# reportlab pairs MSung-Light with the Simplified Chinese character map (UniGB), which turns
+# Traditional Chinese text into the wrong characters; it needs the Traditional one (UniCNS)
+PDF_CID_ENCODINGS = {
+    'MSung-Light': ('cht', 'UniCNS-UCS2-H'),
+}
+# Scripts a typed title may be written in that Helvetica cannot draw, and the languages whose
+# PDF fonts can, in order of preference
+TITLE_SCRIPTS = [
+    (re.compile(r"[\u1100-\u11ff\u3130-\u318f\uac00-\ud7af]"), ('ko',)),
+    (re.compile(r"[\u3040-\u30ff]"), ('ja',)),
+    (re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]"), ('zh-cn', 'zh-tw', 'ja', 'ko')),
+    (re.compile(r"[\u0900-\u097f]"), ('hi',)),
+]
+
+PDF_FONT_DIRS = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts'),
+    os.path.join(os.environ.get('WINDIR', 'C:\\Windows'), 'Fonts'),
+    '/System/Library/Fonts',
+    '/System/Library/Fonts/Supplemental',
+    '/Library/Fonts',
+    os.path.expanduser('~/.fonts'),
+    os.path.expanduser('~/.local/share/fonts'),
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+]
+
+# Process-wide caches: font file lookup and registered fonts per language
+_font_file_index: Dict[str, str] = {}
+_pdf_fonts_cache: Dict[str, Tuple[str, str, str]] = {}
+# Text widths per font at size 1000, memoized per space-separated token (numbers, operators, words)
+# and, within CJK text, which has no spaces to split at, per character
+_text_width_cache: Dict[str, Dict[str, float]] = {}
+# Characters text may wrap between without a space: CJK punctuation, kana, ideographs and full-width forms
+CJK_CHAR_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+# Line breaking rules of CJK text: punctuation that ends a phrase (the best places to wrap), the
+# characters a line may not start with, and those it may not end with
+CJK_PHRASE_END = frozenset("、。，：；？！）」』】")
+NO_LINE_START = CJK_PHRASE_END | frozenset("．ーぁぃぅぇぉっゃゅょァィゥェォッャュョ")
+NO_LINE_END = frozenset("（「『【")
+
+
+def text_width(text: str, font_name: str, size: float) -> float:
+    """Width of text in points, summed from memoized token widths (reportlab does not kern,
+    so this equals stringWidth) instead of measuring every glyph of every cell"""
+    widths = _text_width_cache.get(font_name)
+    if widths is None:
+        widths = _text_width_cache[font_name] = {' ': pdfmetrics.stringWidth(' ', font_name, 1000)}
+    tokens = text.split(' ')
+    total = widths[' '] * (len(tokens) - 1)
+    for token in tokens:
+        width = widths.get(token)
+        if width is None:
+            if len(token) > 1 and CJK_CHAR_PATTERN.search(token):
+                # A whole CJK sentence is rarely measured twice, so it is summed per character
+                width = sum(text_width(char, font_name, 1000) for char in token)
+            else:
+                width = widths[token] = pdfmetrics.stringWidth(token, font_name, 1000)
+        total += width
+    return total * size / 1000
+
+
+def fit_font_size(text: str, font_name: str, size: float, max_width: float) -> float:
+    """The largest font size up to size, in half points, at which text fits on one line of max_width"""
+    width = text_width(text, font_name, 1)
+    if width * size <= max_width:
+        return size
+    return max(0.5, math.floor(max_width / width * 2) / 2)
+
+
+def line_breaks(text: str) -> List[Tuple[int, int]]:
+    """Where text may wrap, as (end of the first line, start of the second): at a space, or between
+    two characters either of which is CJK, unless a line would then start with closing or end
+    with opening punctuation"""
+    breaks = []
+    for i in range(1, len(text)):
+        if text[i] == ' ':
+            breaks.append((i, i + 1))
+        elif (text[i - 1] != ' ' and (CJK_CHAR_PATTERN.match(text[i - 1]) or CJK_CHAR_PATTERN.match(text[i]))
+              and text[i] not in NO_LINE_START and text[i - 1] not in NO_LINE_END):
+            breaks.append((i, i))
+    return breaks
+
+
+def fit_text(text: str, font_name: str, size: float, max_width: float, min_size: float) -> Tuple[List[str], float]:
+    """Fit text into max_width as (lines, font size): one line, shrunk down to min_size if needed,
+    else two lines at the size both fit. The split is the most balanced one outside brackets
+    whose lines fit at min_size, or failing that the most balanced one; CJK text is split after
+    phrase-ending punctuation in preference to inside a phrase."""
+    fitted = fit_font_size(text, font_name, size, max_width)
+    stripped = text.rstrip()
+    breaks = line_breaks(stripped)
+    if fitted >= min_size or not breaks:
+        return [text], fitted
+
+    splits = []
+    for end, start in breaks:
+        depth = stripped.count('(', 0, end) - stripped.count(')', 0, end)
+        lines = [stripped[:end], stripped[start:]]
+        widest = max(text_width(line, font_name, 1) for line in lines)
+        inside_phrase = end == start and stripped[end - 1] not in CJK_PHRASE_END
+        splits.append((depth > 0 or widest * min_size > max_width, inside_phrase, widest, lines))
+    lines = min(splits, key=lambda split: split[:3])[3]
+    return lines, min(fit_font_size(line, font_name, size, max_width) for line in lines)
+
+# Worksheet IDs: a version symbol, then each field of that version as a base-32 varint
+# (4 data bits + 1 continuation bit per symbol), then a check symbol (see
+# worksheet_id_check). Both lists are
+# append-only: a new config key gets a new version, so old IDs keep decoding. An ID uses
+# the oldest version that holds every config key its problem type reads with a non-default
+# value; fields missing from an older version decode to their defaults.
+WORKSHEET_ID_FIELDS = {
+    1: ['mode', 'add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'rows', 'cols', 'seed'],
+    2: ['mode', 'add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'rows', 'cols', 'seed',
+        'frac_range', 'dec_range', 'dec_places'],
+    3: ['mode', 'add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'rows', 'cols', 'seed',
+        'frac_range', 'dec_range', 'dec_places', 'long_div_range', 'long_div_digits'],
+    4: ['mode', 'add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'rows', 'cols', 'seed',
+        'frac_range', 'dec_range', 'dec_places', 'long_div_range', 'long_div_digits', 'expr_operands', 'expr_max'],
+    5: ['mode', 'add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'rows', 'cols', 'seed',
+        'frac_range', 'dec_range', 'dec_places', 'long_div_range', 'long_div_digits', 'expr_operands', 'expr_max',
+        'difficulty'],
+    6: ['mode', 'add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'rows', 'cols', 'seed',
+        'frac_range', 'dec_range', 'dec_places', 'long_div_range', 'long_div_digits', 'expr_operands', 'expr_max',
+        'difficulty', 'bank'],
+    7: ['mode', 'add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'rows', 'cols', 'seed',
+        'frac_range', 'dec_range', 'dec_places', 'long_div_range', 'long_div_digits', 'expr_operands', 'expr_max',
+        'difficulty', 'bank', 'word_lang'],
+}
+WORKSHEET_ID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+def worksheet_id_check(symbols: List[int]) -> int:
+    """Fold worksheet ID symbols into a check value: check = check * x + symbol in GF(32), with the
+    field built on x^5 + x^2 + 1. A valid ID, check symbol included, folds to 0.
+
+    Every position has a different nonzero weight (a power of x, the position's distance from the
+    end), so any single wrong symbol and any swap of two neighbouring different symbols is caught,
+    for all 32 symbols of the alphabet.
+    """
+    check = 0
+    for symbol in symbols:
+        check = ((check << 1) ^ (0x25 if check & 0x10 else 0)) ^ symbol
+    return check
+
+# Columns of a row of student answers (mark command)
+SUBMISSION_COLUMNS = ('student', 'worksheet_id', 'cell', 'answer')
+
+# Preview canvas pixels per PDF point
+PREVIEW_SCALE = 1.0
+# Live preview: quiet time after the last settings edit before regenerating, and how often
+# the window checks for the worker thread's result
+LIVE_PREVIEW_DELAY_MS = 300
+LIVE_PREVIEW_POLL_MS = 30
+
+# Problem banks: the problems of one problem type and its settings, precomputed into a fixed-width
+# binary file (header, then records of NUL-padded UTF-8 problem text and type-tagged answer) that
+# worker processes memory-map, so every process shares one page-cached copy
+BANK_DIR = os.environ.get('MATHS_WORKSHEET_BANKS') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'banks')
+BANK_MAGIC = b"MWSBANK1"
+BANK_HEADER = struct.Struct('<8sIHH16s')
+
+_problem_banks: Dict[str, 'ProblemBank'] = {}
+
+
+class ProblemBank:
+    """A memory-mapped problem bank; a record is only decoded when it is looked up"""
+
+    def __init__(self, filepath: str, key: str):
+        with open(filepath, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.text_width, self.answer_width, file_key = BANK_HEADER.unpack_from(self.data)
+        if magic != BANK_MAGIC or file_key != key.encode('ascii'):
+            raise ValueError(f"Not the problem bank for these settings: {filepath}")
+        self.record_size = self.text_width + self.answer_width
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> Tuple[str, Any]:
+        start = BANK_HEADER.size + index * self.record_size
+        middle = start + self.text_width
+        problem_text = self.data[start:middle].rstrip(b'\0').decode('utf-8')
+        answer = self.data[middle:middle + self.answer_width].rstrip(b'\0').decode('utf-8')
+        return problem_text, int(answer[1:]) if answer[0] == 'i' else answer[1:]
+
+
+# Redraws allowed per sheet when a batch caps the problems any two sheets share
+OVERLAP_ATTEMPTS = 200
+
+
+class OverlapIndex:
+    """Fact index of the sheets of a batch, to cap how many problems any two sheets share.
+
+    Each problem text maps to a bitset (an int) of the accepted sheets containing it. A candidate
+    sheet is scored by adding those bitsets into bit-sliced counters (bit plane k holds bit k of
+    every accepted sheet's shared count), so the cost per problem is a few big-int operations
+    however large the class, never a comparison with every other sheet.
+    """
+
+    def __init__(self):
+        self.sheets = 0
+        self.index: Dict[str, int] = {}
+
+    def max_shared(self, problems: List[Tuple[str, Any]]) -> int:
+        """The most problems a sheet shares with any one accepted sheet"""
+        facts = {problem_text for problem_text, _ in problems}
+        planes = [0] * len(facts).bit_length()
+        index = self.index
+        for problem_text in facts:
+            carry = index.get(problem_text, 0)
+            bit = 0
+            while carry:
+                plane = planes[bit]
+                planes[bit] = plane ^ carry
+                carry &= plane
+                bit += 1
+
+        # Read the largest counter from the top plane down
+        candidates = (1 << self.sheets) - 1
+        shared = 0
+        for bit in reversed(range(len(planes))):
+            if candidates & planes[bit]:
+                candidates &= planes[bit]
+                shared |= 1 << bit
+        return shared
+
+    def add(self, problems: List[Tuple[str, Any]]):
+        """Accept a sheet into the index"""
+        sheet = 1 << self.sheets
+        index = self.index
+        for problem_text in {problem_text for problem_text, _ in problems}:
+            index[problem_text] = index.get(problem_text, 0) | sheet
+        self.sheets += 1
+
+
+# Session history: the most recent worksheets, oldest dropped first past either limit
+HISTORY_MAX_ENTRIES = 50
+HISTORY_MAX_BYTES = 1 << 20
+# Live previews less than this many seconds apart are one burst of edits and share one entry
+HISTORY_MERGE_SECONDS = 10
+
+
+class WorksheetHistory:
+    """Ring buffer of the worksheets generated this session, oldest first.
+
+    Each entry is its time plus one zlib-compressed JSON record of its config and problems
+    (about 400 bytes for 90 problems), so recalling it is a decompress rather than a
+    regeneration, and the buffer's size is the sum of its records.
+    """
+
+    def __init__(self, max_entries: int = HISTORY_MAX_ENTRIES, max_bytes: int = HISTORY_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = deque()
+        self.size = 0
+        self.merge_until = 0.0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def push(self, config: Dict[str, Any], problems: List[Tuple[str, Any]], merge: bool = False):
+        """Add a worksheet (unless it repeats the newest), dropping the oldest past either limit.
+
+        merge: replace the newest entry if it was pushed with merge too, less than
+        HISTORY_MERGE_SECONDS ago, so a burst of live previews keeps only its last worksheet.
+        """
+        record = zlib.compress(json.dumps([config, problems], ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        if self.entries and self.entries[-1][1] == record:
+            return
+        now = time.monotonic()
+        if merge and self.entries and now < self.merge_until:
+            self.size -= len(self.entries.pop()[1])
+        self.merge_until = now + HISTORY_MERGE_SECONDS if merge else 0.0
+        self.entries.append((datetime.now().strftime('%H:%M:%S'), record))
+        self.size += len(record)
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            self.size -= len(self.entries.popleft()[1])
+
+    def get(self, index: int) -> Tuple[str, Dict[str, Any], List[Tuple[str, Any]]]:
+        """Unpack entry index (0 = oldest, -1 = newest) as (time, config, problems)"""
+        created, record = self.entries[index]
+        config, problems = json.loads(zlib.decompress(record))
+        return created, config, [tuple(problem) for problem in problems]
+
+
+# Worksheet archive: one row per handed-out worksheet, indexed for lookups by ID, class, date and mode
+ARCHIVE_PATH = os.path.join(os.path.expanduser('~'), 'maths_worksheets.sqlite3')
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS worksheets (
+    worksheet_id TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    class_name TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL,
+    config TEXT NOT NULL,
+    problems BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS worksheets_by_id ON worksheets (worksheet_id);
+CREATE INDEX IF NOT EXISTS worksheets_by_class ON worksheets (class_name, created_at);
+CREATE INDEX IF NOT EXISTS worksheets_by_date ON worksheets (created_at);
+CREATE INDEX IF NOT EXISTS worksheets_by_mode ON worksheets (mode, created_at);
+"""
+ARCHIVE_INSERT = ("INSERT INTO worksheets (worksheet_id, config_hash, mode, seed, lang, class_name, created_at, "
+                  "config, problems) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+# Difficulty: operand pairs of the four basic operations are scored, ranked into easy / medium /
+# hard thirds, and sheets draw a target share of problems from each third.
+# DIFFICULTY_TARGETS is indexed by the 'difficulty' config value; 0 means plain uniform draws.
+DIFFICULTY_TARGETS = [
+    None,
+    (0.6, 0.3, 0.1),
+    (0.2, 0.6, 0.2),
+    (0.1, 0.3, 0.6),
+    (1 / 3, 1 / 3, 1 / 3),
+]
+DIFFICULTY_OPERAND_RANGES = {'add': 'add_range', 'sub': 'sub_range', 'mul': 'mul_range', 'div': 'div_range'}
+# Operand spaces larger than this are indexed from a fixed sample of pairs instead of in full
+DIFFICULTY_INDEX_LIMIT = 200_000
+# How hard each times-table fact is to recall, by factor 0..12
+TIMES_TABLE_HARDNESS = [0, 0, 1, 2, 2, 1, 3, 4, 4, 3, 1, 2, 3]
+
+_difficulty_buckets_cache: Dict[Tuple[Any, ...], List[List[Tuple[int, int]]]] = {}
+
+
+def difficulty_scores(op: str, firsts: List[int], seconds: List[int]) -> List[int]:
+    """Score many operand pairs at once, column by column: digit counts plus carries for '+' or
+    borrows for '-', times-table hardness for 'x' and '÷' (pairs are quotient, divisor for '÷')"""
+    if op in ('x', '÷'):
+        hardness = {v: TIMES_TABLE_HARDNESS[v] if 0 <= v <= 12 else 3 * len(str(abs(v)))
+                    for v in set(firsts) | set(seconds)}
+        scores = list(map(operator.add, map(hardness.get, firsts), map(hardness.get, seconds)))
+        if op == '÷':
+            scores = list(map(operator.add, scores, (len(str(a * b)) - 1 for a, b in zip(firsts, seconds))))
+        return scores
+
+    count = len(firsts)
+    tops = list(map(abs, firsts))
+    bottoms = list(map(abs, seconds))
+    scores = [len(str(a)) + len(str(b)) for a, b in zip(tops, bottoms)]
+    # A borrow out of a negative difference's top digit is not one more borrow
+    longest = list(map(max, tops, bottoms))
+    carry = [0] * count
+    place = 1
+    while place <= max(tops + bottoms + [0]):
+        top_digits = [a // place % 10 for a in tops]
+        bottom_digits = [b // place % 10 for b in bottoms]
+        if op == '+':
+            carry = [int(a + b + c >= 10) for a, b, c in zip(top_digits, bottom_digits, carry)]
+        else:
+            carry = [int(a - b - c < 0 and place <= top)
+                     for a, b, c, top in zip(top_digits, bottom_digits, carry, longest)]
+        scores = list(map(operator.add, scores, (2 * c for c in carry)))
+        place *= 10
+    if op == '-':
+        scores = [s + 2 if a < b else s for s, a, b in zip(scores, firsts, seconds)]
+    return scores
+
+
+def get_difficulty_buckets(key: str, operand_range: Tuple[int, int], no_negative: bool) -> List[List[Tuple[int, int]]]:
+    """Get the (cached) easy / medium / hard thirds of the operand pairs of a basic problem type"""
+    cache_key = (key, tuple(operand_range), no_negative and key == 'sub')
+    if cache_key in _difficulty_buckets_cache:
+        return _difficulty_buckets_cache[cache_key]
+
+    min_val, max_val = operand_range
+    size = max_val - min_val + 1
+    if size * size <= DIFFICULTY_INDEX_LIMIT:
+        pairs = [(a, b) for a in range(min_val, max_val + 1) for b in range(min_val, max_val + 1)]
+    else:
+        sampler = random.Random(0)
+        pairs = [(sampler.randint(min_val, max_val), sampler.randint(min_val, max_val))
+                 for _ in range(DIFFICULTY_INDEX_LIMIT)]
+    if cache_key[2]:
+        pairs = [(b, a) if a < b else (a, b) for a, b in pairs]
+
+    op = {'add': '+', 'sub': '-', 'mul': 'x', 'div': '÷'}[key]
+    scores = difficulty_scores(op, [a for a, _ in pairs], [b for _, b in pairs])
+    # Shuffle before the stable sort so pairs with equal scores fall either side of a cut by
+    # chance, not by their position in the pair list (which favours small first operands)
+    ranked = list(range(len(pairs)))
+    random.Random(repr(cache_key)).shuffle(ranked)
+    ranked.sort(key=scores.__getitem__)
+    buckets = [[pairs[i] for i in ranked[len(ranked) * level // 3:len(ranked) * (level + 1) // 3]]
+               for level in range(3)]
+    _difficulty_buckets_cache[cache_key] = buckets
+    return buckets
+
+
+def stratified_sample(buckets: List[List[Tuple[int, int]]], weights: Tuple[float, ...], n: int,
+                      rng: random.Random) -> List[Tuple[int, int]]:
+    """Draw n items with the given share from each bucket (empty buckets pass their share on)"""
+    weights = [weight if bucket else 0 for bucket, weight in zip(buckets, weights)]
+    total = sum(weights) or 1
+    shares = [n * weight / total for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[:n - sum(counts)]:
+        counts[i] += 1
+
+    choice = rng.choice
+    sample = []
+    for bucket, count in zip(buckets, counts):
+        sample.extend(choice(bucket) for _ in range(count))
+    return sample
+
+
+def sample_by_difficulty(key: str, n: int, rng: random.Random, config: Dict[str, Any]) -> List[Tuple[int, int]]:
+    """Draw n operand pairs for a basic problem type to match the configured difficulty target"""
+    if not 0 <= config['difficulty'] < len(DIFFICULTY_TARGETS):
+        raise ValueError(f"Unknown difficulty: {config['difficulty']}")
+    buckets = get_difficulty_buckets(key, config[DIFFICULTY_OPERAND_RANGES[key]], config.get('no_negative', False))
+    return stratified_sample(buckets, DIFFICULTY_TARGETS[config['difficulty']], n, rng)
+
+
+# Exact checking of generated problems: problem texts are tokenised, evaluated with ints and
+# Fractions (never floats) the way a pupil works them, and each step is recorded for the checks
+PROBLEM_TOKEN_PATTERN = re.compile(r"\d+/\d+|\d+\.\d+|\d+|__|\S")
+EXACT_OPERATORS = {'+': operator.add, '-': operator.sub, 'x': operator.mul}
+BASIC_OPERATOR_TYPES = {'+': 'add', '-': 'sub', 'x': 'mul', '÷': 'div'}
+
+
+def parse_number(token: str) -> Any:
+    """Parse a number token of a problem: "7" -> 7, "3/4" and "2.5" -> Fraction"""
+    if '/' in token:
+        numerator, denominator = token.split('/')
+        return Fraction(int(numerator), int(denominator))
+    if '.' in token:
+        whole, _, part = token.partition('.')
+        return Fraction(int(whole + part), 10 ** len(part))
+    return int(token)
+
+
+def evaluate_tokens(tokens: List[str]) -> Tuple[Any, List[Any], List[Tuple[str, Any, Any, Any]]]:
+    """Evaluate the tokens of one side of a problem with the usual precedence, left to right.
+
+    Returns (value, numbers, steps): the exact value, every number in order and each operation
+    as (operator, left, right, result). Raises ValueError on malformed text or division by zero.
+    """
+    numbers = []
+    steps = []
+    position = 0
+
+    def factor():
+        nonlocal position
+        token = tokens[position] if position < len(tokens) else ''
+        position += 1
+        if token == '(':
+            value = expression()
+            if position >= len(tokens) or tokens[position] != ')':
+                raise ValueError("unbalanced brackets")
+            position += 1
+            return value
+        if token == '-' and position < len(tokens):  # a negative number
+            token += tokens[position]
+            position += 1
+        if not token.lstrip('-')[:1].isdigit():
+            raise ValueError(f"unexpected {token!r}" if token else "missing number")
+        value = parse_number(token)
+        numbers.append(value)
+        return value
+
+    def apply(op, left, right):
+        if op in EXACT_OPERATORS:
+            result = EXACT_OPERATORS[op](left, right)
+        elif right == 0:
+            raise ValueError("division by zero")
+        elif type(left) is int and type(right) is int and left % right == 0:
+            result = left // right
+        else:
+            result = Fraction(left, right)
+        steps.append((op, left, right, result))
+        return result
+
+    def term():
+        nonlocal position
+        value = factor()
+        while position < len(tokens) and tokens[position] in ('x', '÷'):
+            position += 1
+            value = apply(tokens[position - 1], value, factor())
+        return value
+
+    def expression():
+        nonlocal position
+        value = term()
+        while position < len(tokens) and tokens[position] in ('+', '-'):
+            position += 1
+            value = apply(tokens[position - 1], value, term())
+        return value
+
+    value = expression()
+    if position != len(tokens):
+        raise ValueError(f"unexpected {tokens[position]!r}")
+    return value, numbers, steps
+
+
+def parse_answer(answer: Any) -> Tuple[Any, bool]:
+    """Parse an answer key entry into an exact value; also tells whether it is written the
+    canonical way (fractions in lowest terms, decimals without trailing zeros)"""
+    if type(answer) is int:
+        return answer, True
+    text = str(answer)
+    if '/' in text:
+        value = Fraction(text)
+        return value, str(value) == text
+    if '.' in text:
+        return parse_number(text), not text.endswith('0') and not text.endswith('.')
+    return int(text), True
+
+
+def check_problem(problem_text: str, answer: Any, integer_only: bool = True,
+                  no_negative: bool = False) -> Tuple[List[str], List[Any], List[Tuple[str, Any, Any, Any]]]:
+    """Evaluate a generated (problem text, answer) pair exactly and check it.
+
+    Handles "expression = " problems, "__" blanks (the answer is filled in and both sides must
+    agree) and "dividend ÷ divisor = __ r __" with "q r r" answers. Returns (errors, numbers, steps)
+    as for evaluate_tokens; errors lists every broken invariant and is empty for a valid problem.
+    """
+    errors = []
+    label = f"{problem_text}{answer}" if problem_text.endswith('= ') else f"{problem_text} ({answer})"
+    left_text, _, right_text = problem_text.partition('=')
+    right_text = right_text.strip()
+    try:
+        if right_text == '__ r __':
+            value, numbers, steps = evaluate_tokens(PROBLEM_TOKEN_PATTERN.findall(left_text))
+            quotient, _, remainder = str(answer).partition(' r ')
+            quotient, remainder = int(quotient), int(remainder)
+            dividend, divisor = numbers
+            numbers += [quotient, remainder]
+            if quotient * divisor + remainder != dividend or not 0 <= remainder < divisor:
+                errors.append(f"{label}: not the quotient and remainder")
+            steps = []
+        elif '__' in problem_text:
+            filled = problem_text.replace('__', str(answer), 1)
+            left_text, _, right_text = filled.partition('=')
+            value, numbers, steps = evaluate_tokens(PROBLEM_TOKEN_PATTERN.findall(left_text))
+            expected, right_numbers, right_steps = evaluate_tokens(PROBLEM_TOKEN_PATTERN.findall(right_text))
+            numbers += right_numbers
+            steps += right_steps
+            if value != expected:
+                errors.append(f"{label}: the sides differ ({value} and {expected})")
+        else:
+            value, numbers, steps = evaluate_tokens(PROBLEM_TOKEN_PATTERN.findall(left_text))
+            expected, canonical = parse_answer(answer)
+            if value != expected:
+                errors.append(f"{label}: the answer is {value}")
+            elif not canonical:
+                errors.append(f"{label}: the answer is not written in simplest form")
+    except (ValueError, ZeroDivisionError) as e:
+        return [f"{label}: {e}"], [], []
+
+    if integer_only:
+        if type(answer) is not int and right_text != '__ r __':
+            errors.append(f"{label}: the answer is not an integer")
+        if any(type(result) is not int for op, _, _, result in steps):
+            errors.append(f"{label}: a division is not exact")
+    if no_negative and (any(result < 0 for _, _, _, result in steps) or any(number < 0 for number in numbers)):
+        errors.append(f"{label}: a step goes below zero")
+    return errors, numbers, steps
+
+
+def check_range(problem_text: str, values: List[Any], value_range: Tuple[int, int]) -> List[str]:
+    """Report the values of a problem that lie outside a configured (min, max) range"""
+    low, high = value_range
+    return [f"{problem_text.strip()}: {value} is outside {low}..{high}" for value in values if not low <= value <= high]
+
+
+class ProblemType:
+    """A problem type plugin.
+
+    key: the config 'mode' value; id_code: its permanent number in worksheet IDs;
+    label_key: translation key of its button; style: bootstyle colour of its button;
+    config_keys: the config entries it reads; grid: (rows, cols) of its sheets, if it
+    needs fewer, larger cells than the configured grid; settings: the number settings it
+    introduces, as config key -> {'default': value or (min, max), 'limits': (lowest, highest),
+    'width': Spinbox width (default 8), 'unit': translation key of a label after it (optional)}.
+    """
+    key = ''
+    id_code = -1
+    label_key = ''
+    style = 'primary'
+    config_keys: Tuple[str, ...] = ()
+    grid: Tuple[int, int] = None
+    settings: Dict[str, Dict[str, Any]] = {}
+
+    def generate_batch(self, n: int, rng: random.Random, config: Dict[str, Any]) -> List[Tuple[str, int]]:
+        """Generate n (problem text, answer) pairs drawing only from rng"""
+        raise NotImplementedError
+
+    def verify(self, problem_text: str, answer: Any, config: Dict[str, Any]) -> List[str]:
+        """Check one (problem text, answer) pair of this type exactly; returns the broken invariants"""
+        errors, _, _ = check_problem(problem_text, answer,
+                                     no_negative='no_negative' in self.config_keys and config['no_negative'])
+        return errors
+
+
+# Registered problem types, in button order, and by worksheet ID code
+PROBLEM_TYPES: Dict[str, ProblemType] = {}
+PROBLEM_TYPE_CODES: Dict[int, str] = {}
+
+
+def register_problem_type(problem_type_class):
+    """Class decorator that registers a problem type"""
+    if problem_type_class.id_code in PROBLEM_TYPE_CODES:
+        raise ValueError(f"Duplicate problem type ID code {problem_type_class.id_code}")
+    PROBLEM_TYPES[problem_type_class.key] = problem_type_class()
+    PROBLEM_TYPE_CODES[problem_type_class.id_code] = problem_type_class.key
+    return problem_type_class
+
+
+def problem_settings() -> Dict[str, Dict[str, Any]]:
+    """Every number setting declared by the registered problem types, by config key, in button order"""
+    return {key: setting for problem_type in PROBLEM_TYPES.values() for key, setting in problem_type.settings.items()}
+
+
+@register_problem_type
+class AdditionProblems(ProblemType):
+    key, id_code, label_key, style = 'add', 0, 'add', 'success'
+    config_keys = ('add_range', 'difficulty')
+    settings = {'add_range': {'default': (0, 50), 'limits': (0, 999)}}
+
+    def generate_batch(self, n, rng, config):
+        return [(f"{a} + {b} = ", a + b) for a, b in self.draw_operands(n, rng, config)]
+
+    def draw_operands(self, n: int, rng: random.Random, config: Dict[str, Any]) -> List[Tuple[int, int]]:
+        """Draw the (a, b) operands of n problems a + b"""
+        if config.get('difficulty'):
+            return sample_by_difficulty('add', n, rng, config)
+        min_val, max_val = config['add_range']
+        randint = rng.randint
+        operands = []
+        for _ in range(n):
+            a = randint(min_val, max_val)
+            b = randint(min_val, max_val)
+            operands.append((a, b))
+        return operands
+
+    def verify(self, problem_text, answer, config):
+        errors, numbers, _ = check_problem(problem_text, answer)
+        return errors + check_range(problem_text, numbers, config['add_range'])
+
+
+@register_problem_type
+class SubtractionProblems(ProblemType):
+    key, id_code, label_key, style = 'sub', 1, 'sub', 'warning'
+    config_keys = ('sub_range', 'no_negative', 'difficulty')
+    settings = {'sub_range': {'default': (0, 50), 'limits': (0, 999)}}
+
+    def generate_batch(self, n, rng, config):
+        return [(f"{a} - {b} = ", a - b) for a, b in self.draw_operands(n, rng, config)]
+
+    def draw_operands(self, n: int, rng: random.Random, config: Dict[str, Any]) -> List[Tuple[int, int]]:
+        """Draw the (a, b) operands of n problems a - b"""
+        if config.get('difficulty'):
+            return sample_by_difficulty('sub', n, rng, config)
+        min_val, max_val = config['sub_range']
+        no_negative = config['no_negative']
+        randint = rng.randint
+        operands = []
+        for _ in range(n):
+            a = randint(min_val, max_val)
+            b = randint(min_val, max_val)
+            if no_negative and a < b:
+                a, b = b, a
+            operands.append((a, b))
+        return operands
+
+    def verify(self, problem_text, answer, config):
+        errors, numbers, _ = check_problem(problem_text, answer, no_negative=config['no_negative'])
+        return errors + check_range(problem_text, numbers, config['sub_range'])
+
+
+@register_problem_type
+class MultiplicationProblems(ProblemType):
+    key, id_code, label_key, style = 'mul', 2, 'mul', 'info'
+    config_keys = ('mul_range', 'difficulty')
+    settings = {'mul_range': {'default': (1, 12), 'limits': (1, 99)}}
+
+    def generate_batch(self, n, rng, config):
+        return [(f"{a} x {b} = ", a * b) for a, b in self.draw_operands(n, rng, config)]
+
+    def draw_operands(self, n: int, rng: random.Random, config: Dict[str, Any]) -> List[Tuple[int, int]]:
+        """Draw the (a, b) operands of n problems a x b"""
+        if config.get('difficulty'):
+            return sample_by_difficulty('mul', n, rng, config)
+        min_val, max_val = config['mul_range']
+        randint = rng.randint
+        operands = []
+        for _ in range(n):
+            a = randint(min_val, max_val)
+            b = randint(min_val, max_val)
+            operands.append((a, b))
+        return operands
+
+    def verify(self, problem_text, answer, config):
+        errors, numbers, _ = check_problem(problem_text, answer)
+        return errors + check_range(problem_text, numbers, config['mul_range'])
+
+
+@register_problem_type
+class DivisionProblems(ProblemType):
+    key, id_code, label_key, style = 'div', 3, 'div', 'danger'
+    config_keys = ('div_range', 'difficulty')
+    settings = {'div_range': {'default': (1, 12), 'limits': (1, 99)}}
+
+    def generate_batch(self, n, rng, config):
+        return [(f"{a} ÷ {b} = ", a // b) for a, b in self.draw_operands(n, rng, config)]
+
+    def draw_operands(self, n: int, rng: random.Random, config: Dict[str, Any]) -> List[Tuple[int, int]]:
+        """Draw the (a, b) operands of n exact divisions a ÷ b (quotient and divisor in div_range)"""
+        if config.get('difficulty'):
+            return [(quotient * divisor, divisor) for quotient, divisor in sample_by_difficulty('div', n, rng, config)]
+        min_val, max_val = config['div_range']
+        randint = rng.randint
+        operands = []
+        for _ in range(n):
+            quotient = randint(min_val, max_val)
+            divisor = randint(min_val, max_val)
+            operands.append((quotient * divisor, divisor))
+        return operands
+
+    def verify(self, problem_text, answer, config):
+        errors, numbers, _ = check_problem(problem_text, answer)
+        return errors + check_range(problem_text, numbers[1:] + [answer], config['div_range'])
+
+
+@register_problem_type
+class MixedProblems(ProblemType):
+    key, id_code, label_key, style = 'mixed', 4, 'mixed', 'primary'
+    config_keys = ('add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative', 'difficulty')
+
+    def generate_batch(self, n, rng, config):
+        per_type = n // 4
+        problems = []
+        for key in ('add', 'sub', 'mul', 'div'):
+            problems.extend(PROBLEM_TYPES[key].generate_batch(per_type, rng, config))
+        problems.extend(PROBLEM_TYPES['add'].generate_batch(n - len(problems), rng, config))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        op = problem_text.split()[1:2]
+        if not op or op[0] not in BASIC_OPERATOR_TYPES:
+            return [f"{problem_text.strip()}: not a basic problem"]
+        return PROBLEM_TYPES[BASIC_OPERATOR_TYPES[op[0]]].verify(problem_text, answer, config)
+
+
+@register_problem_type
+class ParenthesesProblems(ProblemType):
+    key, id_code, label_key, style = 'parens', 5, 'parens', 'dark'
+    config_keys = ('add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative')
+
+    def generate_batch(self, n, rng, config):
+        return [self.generate_one(rng, config) for _ in range(n)]
+
+    def generate_one(self, rng: random.Random, config: Dict[str, Any]) -> Tuple[str, int]:
+        """Generate an order of operations problem with parentheses, retrying draws that divide
+        inexactly or (with no_negative) go below zero"""
+        while True:
+            ops = ['+', '-', 'x', '÷']
+            op1 = rng.choice(ops)
+            op2 = rng.choice(ops)
+
+            if op1 == '+':
+                a = rng.randint(*config['add_range'])
+                b = rng.randint(*config['add_range'])
+            elif op1 == '-':
+                a = rng.randint(*config['sub_range'])
+                b = rng.randint(*config['sub_range'])
+                if config['no_negative'] and a < b:
+                    a, b = b, a
+            elif op1 == 'x':
+                a = rng.randint(*config['mul_range'])
+                b = rng.randint(*config['mul_range'])
+            else:
+                quotient = rng.randint(*config['div_range'])
+                divisor = rng.randint(*config['div_range'])
+                a = quotient * divisor
+                b = divisor
+
+            c = rng.choice([rng.randint(*config['add_range']), rng.randint(*config['mul_range'])])
+
+            if rng.choice([True, False]):
+                paren_text = f"({a} {op1} {b})"
+                if op1 == '+':
+                    paren_result = a + b
+                elif op1 == '-':
+                    paren_result = a - b
+                elif op1 == 'x':
+                    paren_result = a * b
+                else:
+                    if b == 0 or a % b != 0: continue
+                    paren_result = a // b
+
+                if op2 == '+':
+                    return f"{paren_text} + {c} = ", paren_result + c
+                elif op2 == '-':
+                    if paren_result < c and config['no_negative']: continue
+                    return f"{paren_text} - {c} = ", paren_result - c
+                elif op2 == 'x':
+                    return f"{paren_text} x {c} = ", paren_result * c
+                else:
+                    if c == 0: continue
+                    if paren_result % c != 0: continue
+                    return f"{paren_text} ÷ {c} = ", paren_result // c
+            else:
+                paren_text = f"({b} {op1} {c})"
+                if op1 == '+':
+                    paren_result = b + c
+                elif op1 == '-':
+                    paren_result = b - c
+                elif op1 == 'x':
+                    paren_result = b * c
+                else:
+                    if c == 0 or b % c != 0: continue
+                    paren_result = b // c
+                if paren_result < 0 and config['no_negative']: continue
+
+                if op2 == '+':
+                    return f"{a} + {paren_text} = ", a + paren_result
+                elif op2 == '-':
+                    if a < paren_result and config['no_negative']: continue
+                    return f"{a} - {paren_text} = ", a - paren_result
+                elif op2 == 'x':
+                    return f"{a} x {paren_text} = ", a * paren_result
+                else:
+                    if paren_result == 0: continue
+                    if a % paren_result != 0: continue
+                    return f"{a} ÷ {paren_text} = ", a // paren_result
+
+
+@register_problem_type
+class FillBlankProblems(ProblemType):
+    key, id_code, label_key, style = 'fill_blank', 6, 'fill_blank', 'secondary'
+    config_keys = ('add_range', 'sub_range', 'mul_range', 'div_range', 'no_negative')
+
+    def generate_batch(self, n, rng, config):
+        return [self.generate_one(rng, config) for _ in range(n)]
+
+    def generate_one(self, rng: random.Random, config: Dict[str, Any]) -> Tuple[str, int]:
+        """Generate a fill-in-the-blank problem"""
+        op = rng.choice(['+', '-', 'x', '÷'])
+
+        if op == '+':
+            a = rng.randint(*config['add_range'])
+            b = rng.randint(*config['add_range'])
+            result = a + b
+            if rng.choice([0, 1]) == 0:
+                return f"__ + {b} = {result}", a
+            return f"{a} + __ = {result}", b
+
+        elif op == '-':
+            a = rng.randint(*config['sub_range'])
+            b = rng.randint(*config['sub_range'])
+            if config['no_negative'] and a < b:
+                a, b = b, a
+            result = a - b
+            if rng.choice([0, 1]) == 0:
+                return f"__ - {b} = {result}", a
+            return f"{a} - __ = {result}", b
+
+        elif op == 'x':
+            a = rng.randint(*config['mul_range'])
+            b = rng.randint(*config['mul_range'])
+            result = a * b
+            if rng.choice([0, 1]) == 0:
+                return f"__ x {b} = {result}", a
+            return f"{a} x __ = {result}", b
+
+        else:  # '÷'
+            divisor = rng.randint(*config['div_range'])
+            quotient = rng.randint(*config['div_range'])
+            dividend = divisor * quotient
+            if rng.choice([0, 1]) == 0:
+                return f"__ ÷ {divisor} = {quotient}", dividend
+            return f"{dividend} ÷ __ = {quotient}", divisor
+
+    def verify(self, problem_text, answer, config):
+        # Once filled in, a blank problem must also be a valid plain problem of its operation
+        errors, _, steps = check_problem(problem_text, answer, no_negative=config['no_negative'])
+        if errors or len(steps) != 1:
+            return errors or [f"{problem_text.strip()}: not a single operation"]
+        op, a, b, result = steps[0]
+        return PROBLEM_TYPES[BASIC_OPERATOR_TYPES[op]].verify(f"{a} {op} {b} = ", result, config)
+
+
+class FractionTables:
+    """Lookup tables for fractions whose denominators lie in one range.
+
+    proper: every proper fraction in lowest terms as (text, numerator, denominator);
+    lcm[b][d]: the common denominator of b and d; reduced(l)[n]: n/l in lowest terms as text.
+    Draws then need only table lookups and integer arithmetic, never a gcd or Fraction.
+    """
+
+    def __init__(self, low: int, high: int):
+        low, high = max(2, low), max(2, low, high)
+        self.low, self.high = low, high
+        self.proper = [(f"{n}/{d}", n, d) for d in range(low, high + 1)
+                       for n in range(1, d) if math.gcd(n, d) == 1]
+        self.lcm = [[0] * (high + 1) for _ in range(high + 1)]
+        for b in range(low, high + 1):
+            for d in range(low, high + 1):
+                self.lcm[b][d] = b * d // math.gcd(b, d)
+        self.reduced_rows: Dict[int, List[str]] = {}
+
+    def reduced(self, denominator: int) -> List[str]:
+        """Texts of 0/l .. 2l/l in lowest terms (whole numbers without "/1"), built once per l"""
+        row = self.reduced_rows.get(denominator)
+        if row is None:
+            row = []
+            for n in range(2 * denominator + 1):
+                g = math.gcd(n, denominator)
+                row.append(str(n // g) if g == denominator else f"{n // g}/{denominator // g}")
+            self.reduced_rows[denominator] = row
+        return row
+
+
+# Fraction tables per denominator range, shared by every worksheet in the process
+_fraction_tables_cache: Dict[Tuple[int, int], FractionTables] = {}
+
+
+def get_fraction_tables(frac_range: Tuple[int, int]) -> FractionTables:
+    """Get the (cached) fraction tables for a denominator range"""
+    key = tuple(frac_range)
+    if key not in _fraction_tables_cache:
+        _fraction_tables_cache[key] = FractionTables(*key)
+    return _fraction_tables_cache[key]
+
+
+@register_problem_type
+class FractionAddSubProblems(ProblemType):
+    key, id_code, label_key, style = 'frac_add', 7, 'frac_add', 'success'
+    config_keys = ('frac_range', 'no_negative')
+    settings = {'frac_range': {'default': (2, 12), 'limits': (2, 50)}}
+
+    def generate_batch(self, n, rng, config):
+        tables = get_fraction_tables(config['frac_range'])
+        proper, lcm, reduced = tables.proper, tables.lcm, tables.reduced
+        no_negative = config['no_negative']
+        choice = rng.choice
+        problems = []
+        for _ in range(n):
+            left, a, b = choice(proper)
+            right, c, d = choice(proper)
+            common = lcm[b][d]
+            if choice((True, False)):
+                problems.append((f"{left} + {right} = ", reduced(common)[a * (common // b) + c * (common // d)]))
+                continue
+            if no_negative and a * d < c * b:
+                left, a, b, right, c, d = right, c, d, left, a, b
+            numerator = a * (common // b) - c * (common // d)
+            answer = reduced(common)[numerator] if numerator >= 0 else "-" + reduced(common)[-numerator]
+            problems.append((f"{left} - {right} = ", answer))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        tables = get_fraction_tables(config['frac_range'])
+        errors, numbers, _ = check_problem(problem_text, answer, integer_only=False, no_negative=config['no_negative'])
+        return errors + [f"{problem_text.strip()}: {number} is not a proper fraction with a denominator in "
+                         f"{tables.low}..{tables.high}" for number in numbers
+                         if not (0 < number < 1 and tables.low <= number.denominator <= tables.high)]
+
+
+@register_problem_type
+class FractionSimplifyProblems(ProblemType):
+    key, id_code, label_key, style = 'frac_simplify', 8, 'frac_simplify', 'info'
+    config_keys = ('frac_range',)
+
+    def generate_batch(self, n, rng, config):
+        tables = get_fraction_tables(config['frac_range'])
+        proper, high = tables.proper, tables.high
+        choice, randint = rng.choice, rng.randint
+        problems = []
+        for _ in range(n):
+            text, a, b = choice(proper)
+            factor = randint(2, max(2, high // b))
+            problems.append((f"{a * factor}/{b * factor} = ", text))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        tables = get_fraction_tables(config['frac_range'])
+        errors, numbers, _ = check_problem(problem_text, answer, integer_only=False)
+        numerator, _, denominator = problem_text.split()[0].partition('/')
+        if not denominator.isdigit() or math.gcd(int(numerator), int(denominator)) == 1:
+            errors.append(f"{problem_text.strip()}: nothing to simplify")
+        return errors + [f"{problem_text.strip()}: {number} is not a proper fraction with a denominator in "
+                         f"{tables.low}..{tables.high}" for number in numbers
+                         if not (0 < number < 1 and tables.low <= number.denominator <= tables.high)]
+
+
+@register_problem_type
+class DecimalProblems(ProblemType):
+    key, id_code, label_key, style = 'decimal', 9, 'decimal', 'warning'
+    config_keys = ('dec_range', 'dec_places', 'no_negative')
+    settings = {'dec_range': {'default': (0, 20), 'limits': (0, 999)},
+                'dec_places': {'default': 1, 'limits': (1, 3), 'width': 3, 'unit': 'dec_places'}}
+
+    def generate_batch(self, n, rng, config):
+        # Exact arithmetic on integers counted in units of the last decimal place
+        places = max(1, config['dec_places'])
+        scale = 10 ** places
+        min_val, max_val = config['dec_range'][0] * scale, config['dec_range'][1] * scale
+        no_negative = config['no_negative']
+        choice, randint = rng.choice, rng.randint
+
+        def text(value: int, digits: int) -> str:
+            whole, part = divmod(abs(value), 10 ** digits)
+            return f"{'-' if value < 0 else ''}{whole}.{part:0{digits}d}"
+
+        def answer(value: int, digits: int) -> str:
+            return text(value, digits).rstrip('0').rstrip('.')
+
+        problems = []
+        for _ in range(n):
+            a = randint(min_val, max_val)
+            op = choice(('+', '-', 'x'))
+            if op == 'x':
+                b = randint(2, 9)
+                problems.append((f"{text(a, places)} x {b} = ", answer(a * b, places)))
+                continue
+            b = randint(min_val, max_val)
+            if op == '+':
+                problems.append((f"{text(a, places)} + {text(b, places)} = ", answer(a + b, places)))
+            else:
+                if no_negative and a < b:
+                    a, b = b, a
+                problems.append((f"{text(a, places)} - {text(b, places)} = ", answer(a - b, places)))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        places = max(1, config['dec_places'])
+        errors, numbers, _ = check_problem(problem_text, answer, integer_only=False, no_negative=config['no_negative'])
+        if any(len(digits) != places for digits in re.findall(r"\.(\d+)", problem_text)):
+            errors.append(f"{problem_text.strip()}: operands do not have {places} decimal places")
+        decimals = [number for number in numbers if type(number) is not int]
+        factors = [number for number in numbers if type(number) is int]
+        return (errors + check_range(problem_text, decimals, config['dec_range'])
+                + check_range(problem_text, factors, (2, 9)))
+
+
+@register_problem_type
+class RemainderDivisionProblems(ProblemType):
+    key, id_code, label_key, style = 'div_rem', 10, 'div_rem', 'danger'
+    config_keys = ('div_range',)
+
+    def generate_batch(self, n, rng, config):
+        # Sample (quotient, divisor, remainder) directly; the dividend follows, so nothing is rejected
+        min_val, max_val = config['div_range']
+        min_divisor, max_divisor = max(2, min_val), max(2, max_val)
+        randint = rng.randint
+        problems = []
+        for _ in range(n):
+            quotient = randint(min_val, max_val)
+            divisor = randint(min_divisor, max_divisor)
+            remainder = randint(1, divisor - 1)
+            problems.append((f"{quotient * divisor + remainder} ÷ {divisor} = __ r __", f"{quotient} r {remainder}"))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        errors, numbers, _ = check_problem(problem_text, answer)
+        if errors:
+            return errors
+        _, divisor, quotient, remainder = numbers
+        min_val, max_val = config['div_range']
+        return (check_range(problem_text, [quotient], (min_val, max_val))
+                + check_range(problem_text, [divisor], (max(2, min_val), max(2, max_val)))
+                + check_range(problem_text, [remainder], (1, divisor - 1)))
+
+
+@register_problem_type
+class LongDivisionProblems(ProblemType):
+    key, id_code, label_key, style = 'long_div', 11, 'long_div', 'dark'
+    config_keys = ('long_div_range', 'long_div_digits')
+    settings = {'long_div_range': {'default': (2, 12), 'limits': (2, 99)},
+                'long_div_digits': {'default': 3, 'limits': (2, 5), 'width': 3, 'unit': 'dividend_digits'}}
+
+    def generate_batch(self, n, rng, config):
+        # Pick the divisor and remainder first, then the quotient from exactly the range that
+        # gives a dividend with the configured number of digits
+        digits = max(2, config['long_div_digits'])
+        low, high = 10 ** (digits - 1), 10 ** digits - 1
+        min_divisor = min(max(2, config['long_div_range'][0]), low)
+        max_divisor = min(max(min_divisor, config['long_div_range'][1]), low)
+        randint = rng.randint
+        problems = []
+        for _ in range(n):
+            divisor = randint(min_divisor, max_divisor)
+            remainder = randint(0, divisor - 1)
+            quotient = randint(-((remainder - low) // divisor), (high - remainder) // divisor)
+            problems.append((f"{quotient * divisor + remainder} ÷ {divisor} = __ r __", f"{quotient} r {remainder}"))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        errors, numbers, _ = check_problem(problem_text, answer)
+        if errors:
+            return errors
+        digits = max(2, config['long_div_digits'])
+        min_divisor = min(max(2, config['long_div_range'][0]), 10 ** (digits - 1))
+        max_divisor = min(max(min_divisor, config['long_div_range'][1]), 10 ** (digits - 1))
+        return (check_range(problem_text, numbers[:1], (10 ** (digits - 1), 10 ** digits - 1))
+                + check_range(problem_text, numbers[1:2], (min_divisor, max_divisor)))
+
+
+# Binding strength of each operator when deciding where brackets are needed ('' = a number)
+OPERATOR_PRECEDENCE = {'+': 1, '-': 1, 'x': 2, '÷': 2, '': 3}
+
+# Factor pairs (a, b) with a, b >= 2 of every value up to an answer bound, per bound
+_factor_pairs_cache: Dict[int, List[List[Tuple[int, int]]]] = {}
+
+
+def get_factor_pairs(high: int) -> List[List[Tuple[int, int]]]:
+    """Get the (cached) factor pairs of 0..high, built with a sieve"""
+    if high not in _factor_pairs_cache:
+        pairs = [[] for _ in range(high + 1)]
+        for a in range(2, high // 2 + 1):
+            for multiple in range(2 * a, high + 1, a):
+                pairs[multiple].append((a, multiple // a))
+        _factor_pairs_cache[high] = pairs
+    return _factor_pairs_cache[high]
+
+
+@register_problem_type
+class MultiStepProblems(ProblemType):
+    key, id_code, label_key, style = 'multi_step', 12, 'multi_step', 'primary'
+    config_keys = ('expr_operands', 'expr_max')
+    settings = {'expr_operands': {'default': (3, 4), 'limits': (2, 5), 'width': 3, 'unit': 'operands'},
+                'expr_max': {'default': 100, 'limits': (10, 999), 'width': 5, 'unit': 'answer_max'}}
+
+    def generate_batch(self, n, rng, config):
+        high = max(10, config['expr_max'])
+        min_operands = max(2, config['expr_operands'][0])
+        max_operands = max(min_operands, config['expr_operands'][1])
+        factor_pairs = get_factor_pairs(high)
+        randint = rng.randint
+        problems = []
+        for _ in range(n):
+            answer = randint(1, high)
+            text, _ = self.build(rng, answer, randint(min_operands, max_operands), high, factor_pairs)
+            problems.append((f"{text} = ", answer))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        high = max(10, config['expr_max'])
+        min_operands = max(2, config['expr_operands'][0])
+        errors, numbers, steps = check_problem(problem_text, answer, no_negative=True)
+        if not min_operands <= len(numbers) <= max(min_operands, config['expr_operands'][1]):
+            errors.append(f"{problem_text.strip()}: {len(numbers)} operands")
+        return errors + check_range(problem_text, numbers + [result for _, _, _, result in steps], (1, high))
+
+    def build(self, rng: random.Random, value: int, operands: int, high: int,
+              factor_pairs: List[List[Tuple[int, int]]]) -> Tuple[str, str]:
+        """Build an expression worth value from the top down; returns (text, top operator).
+
+        Every subexpression value stays in 1..high, so each division is exact and no
+        intermediate result is negative. Only operators that can still reach value within
+        those bounds are offered, and with high >= 3 one always can, so nothing is retried.
+        A right operand of equal precedence is always bracketed, so working left to right
+        follows the tree and stays within the same bounds.
+        """
+        if operands == 1:
+            return str(value), ''
+
+        ops = []
+        if value >= 2:
+            ops.append('+')
+        if value < high:
+            ops.append('-')
+        if factor_pairs[value]:
+            ops.append('x')
+        if 2 * value <= high:
+            ops.append('÷')
+        op = rng.choice(ops)
+
+        if op == '+':
+            left = rng.randint(1, value - 1)
+            right = value - left
+        elif op == '-':
+            left = rng.randint(value + 1, high)
+            right = left - value
+        elif op == 'x':
+            left, right = rng.choice(factor_pairs[value])
+        else:
+            right = rng.randint(2, high // value)
+            left = value * right
+
+        left_operands = rng.randint(1, operands - 1)
+        left_text, left_op = self.build(rng, left, left_operands, high, factor_pairs)
+        right_text, right_op = self.build(rng, right, operands - left_operands, high, factor_pairs)
+
+        precedence = OPERATOR_PRECEDENCE[op]
+        if OPERATOR_PRECEDENCE[left_op] < precedence:
+            left_text = f"({left_text})"
+        if OPERATOR_PRECEDENCE[right_op] <= precedence:
+            right_text = f"({right_text})"
+        return f"{left_text} {op} {right_text}", op
+
+
+# Word problems. Each language has templates per operation and tables of people, things and
+# containers to fill them with. A template is parsed once into a format string, one reader per
+# slot and a regex for the verifier, so filling it is a str.format call. Slots:
+#   {a}, {b}            the operands
+#   {name}, {item}, {box}   the problem's person, thing and container; {item.other} is a named
+#                       form, and {box#b} (or {box.obl#b}) the form agreeing with number b
+#   {He}, {is#a}, ...   a word of the language's table, agreeing with a number after '#', else
+#                       in gender with the thing after '@' (default: the person)
+WORD_LANGUAGES = ('en', 'zh-tw', 'zh-cn', 'ja', 'ko', 'fr', 'hi')  # index = config 'word_lang', permanent
+WORD_ROLES = ('a', 'b', 'name', 'item', 'box')
+WORD_TABLES = {'name': 'names', 'item': 'items', 'box': 'boxes'}
+WORD_SLOT_PATTERN = re.compile(r"\{([^{}.#@]+)(?:\.([^{}.#@]+))?(?:#([ab]))?(?:@(name|item|box))?\}")
+WORD_OPERATIONS = {'add': operator.add, 'sub': operator.sub, 'mul': operator.mul, 'div': operator.floordiv}
+
+WORD_VOCABULARY = {
+    'en': {
+        'singular': (1,),
+        'names': [{'one': 'Sam', 'gender': 'm'}, {'one': 'Mia', 'gender': 'f'}, {'one': 'Leo', 'gender': 'm'},
+                  {'one': 'Ava', 'gender': 'f'}, {'one': 'Noah', 'gender': 'm'}, {'one': 'Zoe', 'gender': 'f'}],
+        'items': [{'one': 'apple', 'other': 'apples'}, {'one': 'pencil', 'other': 'pencils'},
+                  {'one': 'marble', 'other': 'marbles'}, {'one': 'sticker', 'other': 'stickers'},
+                  {'one': 'cookie', 'other': 'cookies'}, {'one': 'shell', 'other': 'shells'}],
+        'boxes': [{'one': 'bag', 'other': 'bags'}, {'one': 'box', 'other': 'boxes'},
+                  {'one': 'basket', 'other': 'baskets'}, {'one': 'jar', 'other': 'jars'}],
+        'words': {'He': {'m': 'He', 'f': 'She'}, 'is': {'one': 'is', 'other': 'are'}},
+        'templates': {
+            'add': ["{name} has {a} {item#a}. {He} gets {b} more. How many {item.other} does {name} have now?",
+                    "There {is#a} {a} {item#a} in a {box} and {b} more on the table. "
+                    "How many {item.other} are there altogether?"],
+            'sub': ["{name} has {a} {item#a} and gives {b} away. How many {item.other} does {name} have left?",
+                    "There {is#a} {a} {item#a} in a {box}. {name} takes {b} out. "
+                    "How many {item.other} are left in the {box}?"],
+            'mul': ["{name} has {a} {box#a} with {b} {item#b} in each. How many {item.other} is that altogether?"],
+            'div': ["{name} puts {a} {item#a} into {b} {box#b}, the same number in each. "
+                    "How many {item.other} go in each {box}?"],
+        },
+    },
+    'zh-tw': {
+        'singular': (),
+        'names': [{'one': '小明', 'gender': 'm'}, {'one': '小美', 'gender': 'f'}, {'one': '小華', 'gender': 'm'},
+                  {'one': '小芳', 'gender': 'f'}],
+        'items': [{'one': '蘋果', 'counter': '個'}, {'one': '鉛筆', 'counter': '枝'}, {'one': '彈珠', 'counter': '顆'},
+                  {'one': '貼紙', 'counter': '張'}, {'one': '餅乾', 'counter': '塊'}],
+        'boxes': [{'one': '袋子', 'counter': '個'}, {'one': '盒子', 'counter': '個'}, {'one': '籃子', 'counter': '個'}],
+        'words': {'他': {'m': '他', 'f': '她'}},
+        'templates': {
+            'add': ["{name}有{a}{item.counter}{item}。{他}又得到{b}{item.counter}。{name}現在一共有多少{item.counter}{item}？",
+                    "{box}裡有{a}{item.counter}{item}。桌子上還有{b}{item.counter}。一共有多少{item.counter}{item}？"],
+            'sub': ["{name}有{a}{item.counter}{item}。{他}送給同學{b}{item.counter}，還剩多少{item.counter}？"],
+            'mul': ["{name}有{a}{box.counter}{box}，每{box.counter}{box}裡有{b}{item.counter}{item}。一共有多少{item.counter}{item}？"],
+            'div': ["{name}把{a}{item.counter}{item}平均放進{b}{box.counter}{box}裡。每{box.counter}{box}裡放多少{item.counter}？"],
+        },
+    },
+    'zh-cn': {
+        'singular': (),
+        'names': [{'one': '小明', 'gender': 'm'}, {'one': '小红', 'gender': 'f'}, {'one': '小刚', 'gender': 'm'},
+                  {'one': '小丽', 'gender': 'f'}],
+        'items': [{'one': '苹果', 'counter': '个'}, {'one': '铅笔', 'counter': '支'}, {'one': '弹珠', 'counter': '颗'},
+                  {'one': '贴纸', 'counter': '张'}, {'one': '饼干', 'counter': '块'}],
+        'boxes': [{'one': '袋子', 'counter': '个'}, {'one': '盒子', 'counter': '个'}, {'one': '篮子', 'counter': '个'}],
+        'words': {'他': {'m': '他', 'f': '她'}},
+        'templates': {
+            'add': ["{name}有{a}{item.counter}{item}。{他}又得到{b}{item.counter}。{name}现在一共有多少{item.counter}{item}？",
+                    "{box}里有{a}{item.counter}{item}。桌子上还有{b}{item.counter}。一共有多少{item.counter}{item}？"],
+            'sub': ["{name}有{a}{item.counter}{item}。{他}送给同学{b}{item.counter}，还剩多少{item.counter}？"],
+            'mul': ["{name}有{a}{box.counter}{box}，每{box.counter}{box}里有{b}{item.counter}{item}。一共有多少{item.counter}{item}？"],
+            'div': ["{name}把{a}{item.counter}{item}平均放进{b}{box.counter}{box}里。每{box.counter}{box}里放多少{item.counter}？"],
+        },
+    },
+    'ja': {
+        'singular': (),
+        'names': [{'one': 'はると', 'gender': 'm'}, {'one': 'ゆい', 'gender': 'f'}, {'one': 'そうた', 'gender': 'm'},
+                  {'one': 'さくら', 'gender': 'f'}],
+        'items': [{'one': 'りんご', 'counter': '個'}, {'one': 'えんぴつ', 'counter': '本'}, {'one': 'ビー玉', 'counter': '個'},
+                  {'one': 'シール', 'counter': '枚'}, {'one': 'クッキー', 'counter': '枚'}],
+        'boxes': [{'one': 'ふくろ', 'counter': '個'}, {'one': 'はこ', 'counter': '箱'}, {'one': 'かご', 'counter': '個'}],
+        'words': {},
+        'templates': {
+            'add': ["{name}さんは{item}を{a}{item.counter}持っています。{b}{item.counter}もらうと、全部で何{item.counter}になりますか？",
+                    "{box}に{item}が{a}{item.counter}、つくえに{b}{item.counter}あります。{item}は全部で何{item.counter}ありますか？"],
+            'sub': ["{name}さんは{item}を{a}{item.counter}持っています。{b}{item.counter}あげると、何{item.counter}残りますか？"],
+            'mul': ["{item}が{b}{item.counter}ずつ入った{box}が{a}{box.counter}あります。{item}は全部で何{item.counter}ありますか？"],
+            'div': ["{item}{a}{item.counter}を{box}{b}{box.counter}に同じ数ずつ入れます。1つの{box}に何{item.counter}入りますか？"],
+        },
+    },
+    'ko': {
+        'singular': (),
+        'names': [{'one': '민준', 'gender': 'm'}, {'one': '서연', 'gender': 'f'}, {'one': '지호', 'gender': 'm'},
+                  {'one': '하은', 'gender': 'f'}],
+        'items': [{'one': '사과', 'counter': '개'}, {'one': '연필', 'counter': '자루'}, {'one': '구슬', 'counter': '개'},
+                  {'one': '스티커', 'counter': '장'}, {'one': '쿠키', 'counter': '개'}],
+        'boxes': [{'one': '상자', 'counter': '개'}, {'one': '바구니', 'counter': '개'}, {'one': '봉투', 'counter': '개'}],
+        'words': {},
+        'templates': {
+            'add': ["{name.topic} {item} {a}{item.counter_object} 가지고 있습니다. "
+                    "{b}{item.counter_object} 더 받으면 모두 몇 {item.counter_subject} 될까요?",
+                    "{box}에 {item.subject} {a}{item.counter}, 책상 위에 {b}{item.counter} 있습니다. "
+                    "{item.subject} 모두 몇 {item.counter}일까요?"],
+            'sub': ["{name.topic} {item} {a}{item.counter_object} 가지고 있습니다. "
+                    "친구에게 {b}{item.counter_object} 주면 몇 {item.counter_subject} 남을까요?"],
+            'mul': ["{box} {a}{box.counter}에 {item.subject} {b}{item.counter}씩 들어 있습니다. "
+                    "{item.subject} 모두 몇 {item.counter}일까요?"],
+            'div': ["{name.topic} {item} {a}{item.counter_object} {box} {b}{box.counter}에 똑같이 나누어 담았습니다. "
+                    "{box} 한 {box.counter}에 몇 {item.counter_subject} 들어 있을까요?"],
+        },
+    },
+    'fr': {
+        'singular': (0, 1),
+        'names': [{'one': 'Lucas', 'gender': 'm'}, {'one': 'Emma', 'gender': 'f'}, {'one': 'Hugo', 'gender': 'm'},
+                  {'one': 'Léa', 'gender': 'f'}, {'one': 'Louis', 'gender': 'm'}, {'one': 'Chloé', 'gender': 'f'}],
+        'items': [{'one': 'pomme', 'other': 'pommes', 'gender': 'f'}, {'one': 'crayon', 'other': 'crayons', 'gender': 'm'},
+                  {'one': 'bille', 'other': 'billes', 'gender': 'f'},
+                  {'one': 'autocollant', 'other': 'autocollants', 'gender': 'm'},
+                  {'one': 'biscuit', 'other': 'biscuits', 'gender': 'm'},
+                  {'one': 'coquillage', 'other': 'coquillages', 'gender': 'm'}],
+        'boxes': [{'one': 'sac', 'other': 'sacs', 'gender': 'm'}, {'one': 'boîte', 'other': 'boîtes', 'gender': 'f'},
+                  {'one': 'panier', 'other': 'paniers', 'gender': 'm'}, {'one': 'bocal', 'other': 'bocaux', 'gender': 'm'}],
+        'words': {'Il': {'m': 'Il', 'f': 'Elle'}, 'il': {'m': 'il', 'f': 'elle'}, 'un': {'m': 'un', 'f': 'une'},
+                  'le': {'m': 'le', 'f': 'la'}, 'chacun': {'m': 'chacun', 'f': 'chacune'}},
+        'templates': {
+            'add': ["{name} a {a} {item#a}. {Il} en reçoit {b} de plus. "
+                    "Combien {item.de} {name} a-t-{il} maintenant\u00a0?",
+                    "Il y a {a} {item#a} dans {un@box} {box} et {b} sur la table. "
+                    "Combien {item.de} y a-t-il en tout\u00a0?"],
+            'sub': ["{name} a {a} {item#a} et en donne {b}. Combien {item.de} lui reste-t-il\u00a0?",
+                    "Il y a {a} {item#a} dans {un@box} {box}. {name} en sort {b}. "
+                    "Combien {item.de} reste-t-il dans {le@box} {box}\u00a0?"],
+            'mul': ["{name} a {a} {box#a} de {b} {item#b}. Combien {item.de} cela fait-il en tout\u00a0?"],
+            'div': ["{name} range {a} {item#a} dans {b} {box#b}, autant dans {chacun@box}. "
+                    "Combien {item.de} y a-t-il dans chaque {box}\u00a0?"],
+        },
+    },
+    'hi': {
+        'singular': (1,),
+        'names': [{'one': 'राहुल', 'gender': 'm'}, {'one': 'प्रिया', 'gender': 'f'}, {'one': 'अमन', 'gender': 'm'},
+                  {'one': 'नेहा', 'gender': 'f'}],
+        'items': [{'one': 'सेब', 'other': 'सेब', 'gender': 'm'}, {'one': 'पेंसिल', 'other': 'पेंसिलें', 'gender': 'f'},
+                  {'one': 'कंचा', 'other': 'कंचे', 'gender': 'm'}, {'one': 'टॉफ़ी', 'other': 'टॉफ़ियाँ', 'gender': 'f'},
+                  {'one': 'बिस्कुट', 'other': 'बिस्कुट', 'gender': 'm'}],
+        'boxes': [{'one': 'डिब्बा', 'other': 'डिब्बे', 'obl': 'डिब्बे', 'obl_other': 'डिब्बों', 'gender': 'm'},
+                  {'one': 'थैला', 'other': 'थैले', 'obl': 'थैले', 'obl_other': 'थैलों', 'gender': 'm'},
+                  {'one': 'टोकरी', 'other': 'टोकरियाँ', 'obl': 'टोकरी', 'obl_other': 'टोकरियों', 'gender': 'f'}],
+        'words': {'है': {'one': 'है', 'other': 'हैं'}, 'कितने': {'m': 'कितने', 'f': 'कितनी'},
+                  'होंगे': {'m': 'होंगे', 'f': 'होंगी'}, 'बचे': {'m': 'बचे', 'f': 'बचीं'},
+                  'देता': {'m': 'देता', 'f': 'देती'}, 'रखता': {'m': 'रखता', 'f': 'रखती'}},
+        'templates': {
+            'add': ["{name} के पास {a} {item#a} {है#a}। {b} और {item#b} मिलने पर {name} के पास "
+                    "कुल {कितने@item} {item.other} {होंगे@item}?"],
+            'sub': ["{name} के पास {a} {item#a} {है#a}। {name} अपने दोस्त को {b} {item#b} {देता} है। "
+                    "अब {name} के पास {कितने@item} {item.other} {बचे@item}?"],
+            'mul': ["{name} के पास {a} {box#a} {है#a} और हर {box.obl} में {b} {item#b} {है#b}। "
+                    "कुल {कितने@item} {item.other} हैं?"],
+            'div': ["{name} {a} {item#a} {b} {box.obl#b} में बराबर-बराबर {रखता} है। "
+                    "हर {box.obl} में {कितने@item} {item.other} {होंगे@item}?"],
+        },
+    },
+}
+
+
+def korean_particle_forms(entry: Dict[str, str]) -> Dict[str, str]:
+    """Topic, subject and object forms of a Korean word and its counter: the particle depends on
+    whether the last syllable ends in a consonant (은/이/을) or not (는/가/를)"""
+    forms = {}
+    for key, prefix in (('one', ''), ('counter', 'counter_')):
+        if key in entry:
+            word = entry[key]
+            final = 0xAC00 <= ord(word[-1]) <= 0xD7A3 and (ord(word[-1]) - 0xAC00) % 28 != 0
+            forms[prefix + 'topic'] = word + ('은' if final else '는')
+            forms[prefix + 'subject'] = word + ('이' if final else '가')
+            forms[prefix + 'object'] = word + ('을' if final else '를')
+    return forms
+
+
+def french_elision_forms(entry: Dict[str, str]) -> Dict[str, str]:
+    """The plural of a French noun after "de", elided before a vowel (de pommes, d'autocollants)"""
+    if 'other' not in entry:
+        return {}
+    word = entry['other']
+    return {'de': ("d'" if word[0] in 'aeiouéèêAEIOUÉ' else "de ") + word}
+
+
+# Forms derived from a language's table entries instead of listed by hand
+WORD_FORM_RULES = {'ko': korean_particle_forms, 'fr': french_elision_forms}
+
+
+class WordTemplate:
+    """A word-problem template compiled into a format string, one reader per slot and a regex.
+
+    fill() takes a record (a, b, name, item, box), where the last three are table entries.
+    """
+
+    def __init__(self, operation: str, text: str, language: Dict[str, Any]):
+        self.operation = operation
+        singular = frozenset(language['singular'])
+        parts, pattern, readers = [], [], []
+        numbers = set()
+        position = 0
+        for match in WORD_SLOT_PATTERN.finditer(text):
+            literal = text[position:match.start()]
+            parts.append(literal.replace('{', '{{').replace('}', '}}') + '{}')
+            pattern.append(re.escape(literal))
+            slot, form, number, target = match.groups()
+            if slot in ('a', 'b'):
+                readers.append(operator.itemgetter(WORD_ROLES.index(slot)))
+                pattern.append(f"(?P={slot})" if slot in numbers else rf"(?P<{slot}>\d+)")
+                numbers.add(slot)
+            else:
+                readers.append(self.compile_slot(text, slot, form, number, target, language, singular))
+                pattern.append('.+?')
+            position = match.end()
+        parts.append(text[position:].replace('{', '{{').replace('}', '}}'))
+        pattern.append(re.escape(text[position:]))
+        if numbers != {'a', 'b'}:
+            raise ValueError(f"Word problem template without both {{a}} and {{b}}: {text}")
+
+        self.format = "".join(parts).format
+        self.readers = tuple(readers)
+        self.pattern = re.compile("".join(pattern))
+
+    @staticmethod
+    def compile_slot(text, slot, form, number, target, language, singular):
+        """Build the reader of one word slot, checking every table entry it can meet has its form"""
+        if slot in WORD_TABLES:
+            entries = language[WORD_TABLES[slot]]
+            role = WORD_ROLES.index(slot)
+            form = form or 'one'
+            keys = (form, 'other' if form == 'one' else form + '_other')
+            if any(key not in entry for entry in entries for key in (keys if number else keys[:1])):
+                raise ValueError(f"Word problem template slot {{{slot}.{form}}} has no such form: {text}")
+            if number:
+                count = WORD_ROLES.index(number)
+                return lambda record: record[role][keys[record[count] not in singular]]
+            return lambda record: record[role][form]
+
+        if slot not in language['words'] or form:
+            raise ValueError(f"Word problem template slot {{{slot}}} is not in the word table: {text}")
+        word = language['words'][slot]
+        if number:
+            count = WORD_ROLES.index(number)
+            forms = (word['one'], word['other'])
+            return lambda record: forms[record[count] not in singular]
+        role = WORD_ROLES.index(target or 'name')
+        return lambda record: word[record[role]['gender']]
+
+    def fill(self, record: Tuple[int, int, Dict[str, str], Dict[str, str], Dict[str, str]]) -> str:
+        """The problem text for one record"""
+        return self.format(*[read(record) for read in self.readers])
+
+
+# Compiled word-problem languages, built on first use per process
+_word_languages_cache: Dict[str, Dict[str, Any]] = {}
+
+
+def get_word_language(lang: str) -> Dict[str, Any]:
+    """The tables of a word-problem language with derived forms filled in and its templates compiled"""
+    if lang not in _word_languages_cache:
+        vocabulary = WORD_VOCABULARY[lang]
+        derive = WORD_FORM_RULES.get(lang)
+        language = {'singular': vocabulary['singular'], 'words': vocabulary['words']}
+        for table in WORD_TABLES.values():
+            language[table] = [dict(entry, **derive(entry)) if derive else dict(entry) for entry in vocabulary[table]]
+        # Languages without plurals list one form, which then agrees with every number
+        for entry in language['names'] + language['items'] + language['boxes']:
+            for key in [key for key in entry if key != 'gender' and not key.endswith('other')]:
+                entry.setdefault('other' if key == 'one' else key + '_other', entry[key])
+        language['templates'] = {operation: [WordTemplate(operation, text, language) for text in texts]
+                                 for operation, texts in vocabulary['templates'].items()}
+        _word_languages_cache[lang] = language
+    return _word_languages_cache[lang]
+
+
+@register_problem_type
+class WordProblems(ProblemType):
+    """Word problems for the four operations, a quarter each, with the basic types' operands
+    (subtraction never below zero) written out in the language of config 'word_lang'"""
+    key, id_code, label_key, style = 'word', 13, 'word', 'secondary'
+    config_keys = ('add_range', 'sub_range', 'mul_range', 'div_range', 'difficulty', 'word_lang')
+    grid = (10, 2)
+
+    def generate_batch(self, n, rng, config):
+        language = get_word_language(WORD_LANGUAGES[config['word_lang']])
+        names, items, boxes = language['names'], language['items'], language['boxes']
+        choice = rng.choice
+        per_type = n // 4
+        problems = []
+        for key, count in (('add', per_type), ('sub', per_type), ('mul', per_type), ('div', per_type),
+                           ('add', n - 4 * per_type)):
+            operands = PROBLEM_TYPES[key].draw_operands(count, rng, dict(config, no_negative=True))
+            templates = language['templates'][key]
+            calculate = WORD_OPERATIONS[key]
+            for a, b in operands:
+                text = choice(templates).fill((a, b, choice(names), choice(items), choice(boxes)))
+                problems.append((text, calculate(a, b)))
+        return problems
+
+    def verify(self, problem_text, answer, config):
+        lang = WORD_LANGUAGES[config['word_lang']]
+        symbols = {key: symbol for symbol, key in BASIC_OPERATOR_TYPES.items()}
+        for key, templates in get_word_language(lang)['templates'].items():
+            for template in templates:
+                match = template.pattern.fullmatch(problem_text)
+                if match:
+                    return PROBLEM_TYPES[key].verify(f"{match['a']} {symbols[key]} {match['b']} = ", answer,
+                                                     dict(config, no_negative=True))
+        return [f"{problem_text.strip()}: matches no '{lang}' word problem template"]
 
 
 class MathWorksheetGenerator:
     """Math Worksheet Generator Application"""
 
-    def __init__(self):
-        """Initialize the application"""
-        self.root = ttk.Window(
-            title="Math Worksheet Generator",
-            themename="cosmo",
-            size=(720, 880),  # Modified size to 720pt x 880pt
-            position=(100, 50)
-        )
+    def __init__(self, headless: bool = False, startup_timing: bool = False):
+        """Initialize the application (headless: no window, for command-line batch tools)"""
+        self.headless = headless
+        self.startup_timing = startup_timing
+        self.startup_marks = []
+        self.mark_startup('imports')
+
+        self.root = None
+        if not headless:
+            self.root = ttk.Window(
+                title="Math Worksheet Generator",
+                themename="cosmo",
+                size=(720, 880),  # Modified size to 720pt x 880pt
+                position=(100, 50)
+            )
+            self.mark_startup('window created')
 
         # Multilingual support
         self.lang_dict = {
@@ -57,10 +1625,13 @@ class MathWorksheetGenerator:
                 'menu_language': 'Language',
                 'menu_about': 'About',
                 'menu_export_pdf': 'Export PDF',
+                'menu_roster_pdf': 'Class Roster PDF...',
                 'menu_print': 'Print',
+                'menu_history': 'History',
+                'history_empty': '(no worksheets yet)',
                 'tab_settings': '📝 Settings',
                 'tab_preview': '👀 Preview',
-                'card_title_label': '🎯 Worksheet Title (***Please use English***)',
+                'card_title_label': '🎯 Worksheet Title',
                 'card_problem_type': '🔢 Problem Type',
                 'add': '➕ Addition',
                 'sub': '➖ Subtraction',
@@ -69,10 +1640,32 @@ class MathWorksheetGenerator:
                 'mixed': '🔀 Mixed',
                 'parens': '() Order of Operations',
                 'fill_blank': '__ Fill in the Blank',
+                'frac_add': '½ Fractions + −',
+                'frac_simplify': '¾ Simplify Fractions',
+                'decimal': '0.5 Decimals',
+                'div_rem': 'r Division with Remainder',
+                'long_div': '⟌ Long Division',
+                'multi_step': '🌳 Multi-Step',
+                'word': '💬 Word Problems',
                 'card_ranges': '📊 Number Range',
                 'range_to': 'to',
+                'dec_places': 'decimal places',
+                'dividend_digits': 'digit dividend',
+                'operands': 'numbers',
+                'answer_max': 'max answer',
+                'difficulty': 'Difficulty:',
+                'difficulty_any': 'Any',
+                'difficulty_easy': 'Easy',
+                'difficulty_medium': 'Medium',
+                'difficulty_hard': 'Hard',
+                'difficulty_balanced': 'Balanced',
+                'n_up': 'Worksheets per sheet:',
+                'sheet_size': 'Paper:',
                 'card_options': '⚙️ Other Options',
                 'no_negative': '🚫 Avoid negative results (for subtraction)',
+                'compact_pdf': '📦 Compact PDF (smaller files for sharing)',
+                'archive_worksheets': 'Keep a record of exported and printed worksheets',
+                'archive_class': 'Class:',
                 'seed': '🎲 Fixed random seed:',
                 'card_samples': '📋 Default Samples',
                 'sample_a': 'Mixed Beginner',
@@ -119,10 +1712,13 @@ class MathWorksheetGenerator:
                 'menu_language': '語言',
                 'menu_about': '關於',
                 'menu_export_pdf': '匯出為PDF',
+                'menu_roster_pdf': '班級名單PDF...',
                 'menu_print': '列印',
+                'menu_history': '歷史記錄',
+                'history_empty': '（尚無練習題）',
                 'tab_settings': '📝 設定',
                 'tab_preview': '👀 預覽',
-                'card_title_label': '🎯 工作表標題 (***請使用英文***)',
+                'card_title_label': '🎯 工作表標題',
                 'card_problem_type': '🔢 問題類型',
                 'add': '➕ 加法',
                 'sub': '➖ 減法',
@@ -131,10 +1727,32 @@ class MathWorksheetGenerator:
                 'mixed': '🔀 混合',
                 'parens': '() 運算順序',
                 'fill_blank': '__ 填空',
+                'frac_add': '½ 分數加減',
+                'frac_simplify': '¾ 約分',
+                'decimal': '0.5 小數',
+                'div_rem': 'r 有餘數除法',
+                'long_div': '⟌ 長除法',
+                'multi_step': '🌳 多步計算',
+                'word': '💬 文字應用題',
                 'card_ranges': '📊 數字範圍',
                 'range_to': '至',
+                'dec_places': '位小數',
+                'dividend_digits': '位數被除數',
+                'operands': '個數',
+                'answer_max': '答案上限',
+                'difficulty': '難度：',
+                'difficulty_any': '不限',
+                'difficulty_easy': '簡單',
+                'difficulty_medium': '中等',
+                'difficulty_hard': '困難',
+                'difficulty_balanced': '均衡',
+                'n_up': '每張紙工作紙數：',
+                'sheet_size': '紙張：',
                 'card_options': '⚙️ 其他選項',
                 'no_negative': '🚫 避免負數答案 (用於減法)',
+                'compact_pdf': '📦 精簡PDF (檔案更小，方便分享)',
+                'archive_worksheets': '保存已匯出和列印的工作紙記錄',
+                'archive_class': '班別:',
                 'seed': '🎲 固定亂數種子:',
                 'card_samples': '📋 範例',
                 'sample_a': '混合初學者',
@@ -164,11 +1782,11 @@ class MathWorksheetGenerator:
                 'msg_export_fail': '匯出PDF時發生錯誤：{}',
                 'about_title': '關於',
                 'about_content': '數學練習題產生器\n\n© 2025\n\n作者: On Tang\n網站: on99.co.uk\n\n本應用程式是一款簡單的工具，用於建立可自訂的數學練習題。旨在幫助學生練習和提升他們的數學技能。',
-                'pdf_header': 'Maths Worksheet',
-                'pdf_subtitle': 'Write the answers as fast as you can, but make sure they are correct!',
-                'pdf_date': 'Date: ',
-                'pdf_name': 'Name: ',
-                'pdf_footer_left': 'Maths Worksheet',
+                'pdf_header': '數學練習題',
+                'pdf_subtitle': '請盡快寫出答案，但一定要確保答案正確！',
+                'pdf_date': '日期：',
+                'pdf_name': '姓名：',
+                'pdf_footer_left': '數學練習題',
                 'pdf_copyright': 'Copyright © 2025. on99.co.uk',
                 'msg_print_started': '已啟動列印程式。請從對話框中選擇您的印表機。',
                 'msg_print_tip': 'PDF 文件已開啟。請使用您的 PDF 閱讀器之列印功能。',
@@ -181,10 +1799,13 @@ class MathWorksheetGenerator:
                 'menu_language': '语言',
                 'menu_about': '关于',
                 'menu_export_pdf': '导出为PDF',
+                'menu_roster_pdf': '班级名单PDF...',
                 'menu_print': '打印',
+                'menu_history': '历史记录',
+                'history_empty': '（尚无练习题）',
                 'tab_settings': '📝 设置',
                 'tab_preview': '👀 预览',
-                'card_title_label': '🎯 工作表标题 (***请使用英文***)',
+                'card_title_label': '🎯 工作表标题',
                 'card_problem_type': '🔢 问题类型',
                 'add': '➕ 加法',
                 'sub': '➖ 减法',
@@ -193,10 +1814,32 @@ class MathWorksheetGenerator:
                 'mixed': '🔀 混合',
                 'parens': '() 运算顺序',
                 'fill_blank': '__ 填空',
+                'frac_add': '½ 分数加减',
+                'frac_simplify': '¾ 约分',
+                'decimal': '0.5 小数',
+                'div_rem': 'r 有余数除法',
+                'long_div': '⟌ 长除法',
+                'multi_step': '🌳 多步计算',
+                'word': '💬 文字应用题',
                 'card_ranges': '📊 数字范围',
                 'range_to': '至',
+                'dec_places': '位小数',
+                'dividend_digits': '位数被除数',
+                'operands': '个数',
+                'answer_max': '答案上限',
+                'difficulty': '难度：',
+                'difficulty_any': '不限',
+                'difficulty_easy': '简单',
+                'difficulty_medium': '中等',
+                'difficulty_hard': '困难',
+                'difficulty_balanced': '均衡',
+                'n_up': '每张纸练习纸数：',
+                'sheet_size': '纸张：',
                 'card_options': '⚙️ 其他选项',
                 'no_negative': '🚫 避免负数答案 (用于减法)',
+                'compact_pdf': '📦 精简PDF (文件更小，方便分享)',
+                'archive_worksheets': '保存已导出和打印的练习纸记录',
+                'archive_class': '班级:',
                 'seed': '🎲 固定随机种子:',
                 'card_samples': '📋 示例',
                 'sample_a': '混合初学者',
@@ -226,11 +1869,11 @@ class MathWorksheetGenerator:
                 'msg_export_fail': '导出PDF时发生错误：{}',
                 'about_title': '关于',
                 'about_content': '数学练习题生成器\n\n© 2025\n\n作者: On Tang\n网站: on99.co.uk\n\n本应用程序是一款简单的工具，用于创建可自定义的数学练习题。旨在帮助学生练习和提升他们的数学技能。',
-                'pdf_header': 'Maths Worksheet',
-                'pdf_subtitle': 'Write the answers as fast as you can, but make sure they are correct!',
-                'pdf_date': 'Date: ',
-                'pdf_name': 'Name: ',
-                'pdf_footer_left': 'Maths Worksheet',
+                'pdf_header': '数学练习题',
+                'pdf_subtitle': '请尽快写出答案，但一定要确保答案正确！',
+                'pdf_date': '日期：',
+                'pdf_name': '姓名：',
+                'pdf_footer_left': '数学练习题',
                 'pdf_copyright': 'Copyright © 2025. on99.co.uk',
                 'msg_print_started': '已启动打印程序。请从对话框中选择您的打印机。',
                 'msg_print_tip': 'PDF 文件已打开。请使用您的 PDF 阅读器之打印功能。',
@@ -243,10 +1886,13 @@ class MathWorksheetGenerator:
                 'menu_language': '言語',
                 'menu_about': 'について',
                 'menu_export_pdf': 'PDFをエクスポート',
+                'menu_roster_pdf': '名簿からPDF...',
                 'menu_print': '印刷',
+                'menu_history': '履歴',
+                'history_empty': '（ワークシートはまだありません）',
                 'tab_settings': '📝 設定',
                 'tab_preview': '👀 プレビュー',
-                'card_title_label': '🎯 ワークシートタイトル (***英語を使用してください***)',
+                'card_title_label': '🎯 ワークシートタイトル',
                 'card_problem_type': '🔢 問題の種類',
                 'add': '➕ 足し算',
                 'sub': '➖ 引き算',
@@ -255,10 +1901,32 @@ class MathWorksheetGenerator:
                 'mixed': '🔀 混合',
                 'parens': '() 演算の順序',
                 'fill_blank': '__ 穴埋め',
+                'frac_add': '½ 分数のたし算・ひき算',
+                'frac_simplify': '¾ 約分',
+                'decimal': '0.5 小数',
+                'div_rem': 'r あまりのあるわり算',
+                'long_div': '⟌ 筆算のわり算',
+                'multi_step': '🌳 多段階の計算',
+                'word': '💬 文章題',
                 'card_ranges': '📊 数字の範囲',
                 'range_to': 'から',
+                'dec_places': '小数点以下の桁数',
+                'dividend_digits': 'けたのわられる数',
+                'operands': '個の数',
+                'answer_max': '答えの上限',
+                'difficulty': '難易度：',
+                'difficulty_any': '指定なし',
+                'difficulty_easy': 'やさしい',
+                'difficulty_medium': 'ふつう',
+                'difficulty_hard': 'むずかしい',
+                'difficulty_balanced': 'バランス',
+                'n_up': '1枚あたりのプリント数：',
+                'sheet_size': '用紙：',
                 'card_options': '⚙️ その他のオプション',
                 'no_negative': '🚫 マイナスになる結果を避ける (引き算用)',
+                'compact_pdf': '📦 コンパクトPDF (共有用に小さいファイル)',
+                'archive_worksheets': '書き出し・印刷したプリントを記録する',
+                'archive_class': 'クラス:',
                 'seed': '🎲 固定乱数シード:',
                 'card_samples': '📋 デフォルトサンプル',
                 'sample_a': '初心者向け混合',
@@ -288,11 +1956,11 @@ class MathWorksheetGenerator:
                 'msg_export_fail': 'PDFのエクスポート中にエラーが発生しました: {}',
                 'about_title': 'について',
                 'about_content': '数学ワークシートジェネレーター\n\n© 2025\n\n著者: On Tang\nウェブサイト: on99.co.uk\n\nこのアプリケーションは、カスタマイズ可能な数学ワークシートを作成するためのシンプルなツールです。学生が数学のスキルを練習し、向上させるのに役立つように設計されています。',
-                'pdf_header': 'Maths Worksheet',
-                'pdf_subtitle': 'Write the answers as fast as you can, but make sure they are correct!',
-                'pdf_date': 'Date: ',
-                'pdf_name': 'Name: ',
-                'pdf_footer_left': 'Maths Worksheet',
+                'pdf_header': '算数ワークシート',
+                'pdf_subtitle': 'できるだけ速く、でも正確に答えを書きましょう！',
+                'pdf_date': '日付：',
+                'pdf_name': '名前：',
+                'pdf_footer_left': '算数ワークシート',
                 'pdf_copyright': 'Copyright © 2025. on99.co.uk',
                 'msg_print_started': '印刷プログラムが起動しました。ダイアログからプリンタを選択してください。',
                 'msg_print_tip': 'PDFファイルが開かれました。PDFリーダーの印刷機能を使用してください。',
@@ -305,10 +1973,13 @@ class MathWorksheetGenerator:
                 'menu_language': '언어',
                 'menu_about': '정보',
                 'menu_export_pdf': 'PDF 내보내기',
+                'menu_roster_pdf': '학급 명단 PDF...',
                 'menu_print': '인쇄',
+                'menu_history': '기록',
+                'history_empty': '(아직 워크시트가 없습니다)',
                 'tab_settings': '📝 설정',
                 'tab_preview': '👀 미리보기',
-                'card_title_label': '🎯 워크시트 제목 (***영어를 사용하세요***)',
+                'card_title_label': '🎯 워크시트 제목',
                 'card_problem_type': '🔢 문제 유형',
                 'add': '➕ 덧셈',
                 'sub': '➖ 뺄셈',
@@ -317,10 +1988,32 @@ class MathWorksheetGenerator:
                 'mixed': '🔀 혼합',
                 'parens': '() 연산 순서',
                 'fill_blank': '__ 빈칸 채우기',
+                'frac_add': '½ 분수 덧셈·뺄셈',
+                'frac_simplify': '¾ 약분',
+                'decimal': '0.5 소수',
+                'div_rem': 'r 나머지 있는 나눗셈',
+                'long_div': '⟌ 긴 나눗셈',
+                'multi_step': '🌳 여러 단계 계산',
+                'word': '💬 문장제',
                 'card_ranges': '📊 숫자 범위',
                 'range_to': '에서',
+                'dec_places': '소수 자릿수',
+                'dividend_digits': '자리 피제수',
+                'operands': '개의 수',
+                'answer_max': '최대 답',
+                'difficulty': '난이도:',
+                'difficulty_any': '제한 없음',
+                'difficulty_easy': '쉬움',
+                'difficulty_medium': '보통',
+                'difficulty_hard': '어려움',
+                'difficulty_balanced': '균형',
+                'n_up': '용지당 학습지 수:',
+                'sheet_size': '용지:',
                 'card_options': '⚙️ 기타 옵션',
                 'no_negative': '🚫 음수 결과 피하기 (뺄셈용)',
+                'compact_pdf': '📦 압축 PDF (공유용 작은 파일)',
+                'archive_worksheets': '내보내거나 인쇄한 학습지 기록 보관',
+                'archive_class': '반:',
                 'seed': '🎲 고정 랜덤 시드:',
                 'card_samples': '📋 기본 샘플',
                 'sample_a': '초급 혼합',
@@ -350,11 +2043,11 @@ class MathWorksheetGenerator:
                 'msg_export_fail': 'PDF 내보내기 중 오류가 발생했습니다: {}',
                 'about_title': '정보',
                 'about_content': '수학 워크시트 생성기\n\n© 2025\n\nAuthor: On Tang\nWebsite: on99.co.uk\n\n이 응용 프로그램은 사용자 정의 가능한 수학 워크시트를 만드는 간단한 도구입니다. 학생들이 수학 기술을 연습하고 향상시키는 데 도움이 되도록 설계되었습니다.',
-                'pdf_header': 'Maths Worksheet',
-                'pdf_subtitle': 'Write the answers as fast as you can, but make sure they are correct!',
-                'pdf_date': 'Date: ',
-                'pdf_name': 'Name: ',
-                'pdf_footer_left': 'Maths Worksheet',
+                'pdf_header': '수학 워크시트',
+                'pdf_subtitle': '최대한 빨리 답을 쓰되, 정확한지 꼭 확인하세요!',
+                'pdf_date': '날짜: ',
+                'pdf_name': '이름: ',
+                'pdf_footer_left': '수학 워크시트',
                 'pdf_copyright': 'Copyright © 2025. on99.co.uk',
                 'msg_print_started': '인쇄 프로그램이 시작되었습니다. 대화 상자에서 프린터를 선택하세요.',
                 'msg_print_tip': 'PDF 파일이 열렸습니다. PDF 리더의 인쇄 기능을 사용하세요.',
@@ -367,10 +2060,13 @@ class MathWorksheetGenerator:
                 'menu_language': 'Langue',
                 'menu_about': 'À propos',
                 'menu_export_pdf': 'Exporter en PDF',
+                'menu_roster_pdf': 'PDF par liste de classe...',
                 'menu_print': 'Imprimer',
+                'menu_history': 'Historique',
+                'history_empty': '(aucune fiche pour l’instant)',
                 'tab_settings': '📝 Paramètres',
                 'tab_preview': '👀 Aperçu',
-                'card_title_label': '🎯 Titre de la Fiche (***Veuillez utiliser l\'anglais***)',
+                'card_title_label': '🎯 Titre de la Fiche',
                 'card_problem_type': '🔢 Type de Problème',
                 'add': '➕ Addition',
                 'sub': '➖ Soustraction',
@@ -379,10 +2075,32 @@ class MathWorksheetGenerator:
                 'mixed': '🔀 Mixte',
                 'parens': '() Ordre des Opérations',
                 'fill_blank': '__ Remplir le vide',
+                'frac_add': '½ Fractions + −',
+                'frac_simplify': '¾ Simplifier les fractions',
+                'decimal': '0,5 Décimaux',
+                'div_rem': 'r Division avec reste',
+                'long_div': '⟌ Division posée',
+                'multi_step': '🌳 Calculs en plusieurs étapes',
+                'word': '💬 Problèmes',
                 'card_ranges': '📊 Plage de Nombres',
                 'range_to': 'à',
+                'dec_places': 'décimales',
+                'dividend_digits': 'chiffres au dividende',
+                'operands': 'nombres',
+                'answer_max': 'réponse max',
+                'difficulty': 'Difficulté :',
+                'difficulty_any': 'Libre',
+                'difficulty_easy': 'Facile',
+                'difficulty_medium': 'Moyen',
+                'difficulty_hard': 'Difficile',
+                'difficulty_balanced': 'Équilibré',
+                'n_up': 'Fiches par feuille :',
+                'sheet_size': 'Papier :',
                 'card_options': '⚙️ Autres Options',
                 'no_negative': '🚫 Éviter les résultats négatifs (pour la soustraction)',
+                'compact_pdf': '📦 PDF compact (fichiers plus légers à partager)',
+                'archive_worksheets': 'Garder une trace des fiches exportées et imprimées',
+                'archive_class': 'Classe:',
                 'seed': '🎲 Graine aléatoire fixe:',
                 'card_samples': '📋 Exemples par Défaut',
                 'sample_a': 'Mixte Débutant',
@@ -412,11 +2130,11 @@ class MathWorksheetGenerator:
                 'msg_export_fail': 'Une erreur est survenue lors de l\'exportation du PDF: {}',
                 'about_title': 'À propos',
                 'about_content': 'Générateur de Fiches d\'Exercices de Mathématiques\n\n© 2025\n\nAuthor: On Tang\nWebsite: on99.co.uk\n\nCette application est un outil simple pour créer des fiches d\'exercices de mathématiques personnalisables. Elle est conçue pour aider les étudiants à pratiquer et à améliorer leurs compétences en mathématiques.',
-                'pdf_header': 'Maths Worksheet',
-                'pdf_subtitle': 'Write the answers as fast as you can, but make sure they are correct!',
-                'pdf_date': 'Date: ',
-                'pdf_name': 'Name: ',
-                'pdf_footer_left': 'Maths Worksheet',
+                'pdf_header': 'Fiche de Mathématiques',
+                'pdf_subtitle': 'Écris les réponses aussi vite que possible, mais vérifie qu\'elles sont justes !',
+                'pdf_date': 'Date : ',
+                'pdf_name': 'Nom : ',
+                'pdf_footer_left': 'Fiche de Mathématiques',
                 'pdf_copyright': 'Copyright © 2025. on99.co.uk',
                 'msg_print_started': 'Le programme d\'impression a été lancé. Veuillez sélectionner votre imprimante dans la boîte de dialogue.',
                 'msg_print_tip': 'Le fichier PDF a été ouvert. Veuillez utiliser la fonction d\'impression de votre lecteur PDF.',
@@ -429,10 +2147,13 @@ class MathWorksheetGenerator:
                 'menu_language': 'भाषा',
                 'menu_about': 'के बारे में',
                 'menu_export_pdf': 'PDF के रूप में निर्यात करें',
+                'menu_roster_pdf': 'कक्षा सूची PDF...',
                 'menu_print': 'छापें',
+                'menu_history': 'इतिहास',
+                'history_empty': '(अभी कोई वर्कशीट नहीं)',
                 'tab_settings': '📝 सेटिंग्स',
                 'tab_preview': '👀 पूर्वावलोकन',
-                'card_title_label': '🎯 वर्कशीट शीर्षक (***कृपया अंग्रेजी का उपयोग करें***)',
+                'card_title_label': '🎯 वर्कशीट शीर्षक',
                 'card_problem_type': '🔢 समस्या का प्रकार',
                 'add': '➕ जोड़',
                 'sub': '➖ घटाव',
@@ -441,10 +2162,32 @@ class MathWorksheetGenerator:
                 'mixed': '🔀 मिश्रित',
                 'parens': '() संचालन का क्रम',
                 'fill_blank': '__ रिक्त स्थान भरें',
+                'frac_add': '½ भिन्न + −',
+                'frac_simplify': '¾ भिन्न सरल करें',
+                'decimal': '0.5 दशमलव',
+                'div_rem': 'r शेषफल सहित भाग',
+                'long_div': '⟌ लंबा भाग',
+                'multi_step': '🌳 बहु-चरणीय',
+                'word': '💬 शब्द समस्याएँ',
                 'card_ranges': '📊 संख्या सीमा',
                 'range_to': 'से',
+                'dec_places': 'दशमलव स्थान',
+                'dividend_digits': 'अंकों का भाज्य',
+                'operands': 'संख्याएँ',
+                'answer_max': 'अधिकतम उत्तर',
+                'difficulty': 'कठिनाई:',
+                'difficulty_any': 'कोई भी',
+                'difficulty_easy': 'आसान',
+                'difficulty_medium': 'मध्यम',
+                'difficulty_hard': 'कठिन',
+                'difficulty_balanced': 'संतुलित',
+                'n_up': 'प्रति शीट वर्कशीट:',
+                'sheet_size': 'कागज़:',
                 'card_options': '⚙️ अन्य विकल्प',
                 'no_negative': '🚫 नकारात्मक परिणामों से बचें (घटाव के लिए)',
+                'compact_pdf': '📦 कॉम्पैक्ट PDF (साझा करने के लिए छोटी फ़ाइलें)',
+                'archive_worksheets': 'निर्यात और प्रिंट की गई वर्कशीट का रिकॉर्ड रखें',
+                'archive_class': 'कक्षा:',
                 'seed': '🎲 स्थिर यादृच्छिक बीज:',
                 'card_samples': '📋 डिफ़ॉल्ट नमूने',
                 'sample_a': 'मिश्रित शुरुआती',
@@ -474,11 +2217,11 @@ class MathWorksheetGenerator:
                 'msg_export_fail': 'पीडीएफ निर्यात करते समय एक त्रुटि हुई: {}',
                 'about_title': 'के बारे में',
                 'about_content': 'गणित वर्कशीट जेनरेटर\n\n© 2025\n\nलेखक: On Tang\nवेबसाइट: on99.co.uk\n\nयह एप्लिकेशन अनुकूलन योग्य गणित वर्कशीट्स बनाने के लिए एक सरल उपकरण है। इसे छात्रों को उनके गणित कौशल का अभ्यास करने और सुधारने में मदद करने के लिए डिज़ाइन किया गया है।',
-                'pdf_header': 'Maths Worksheet',
-                'pdf_subtitle': 'Write the answers as fast as you can, but make sure they are correct!',
-                'pdf_date': 'Date: ',
-                'pdf_name': 'Name: ',
-                'pdf_footer_left': 'Maths Worksheet',
+                'pdf_header': 'गणित वर्कशीट',
+                'pdf_subtitle': 'जितनी जल्दी हो सके उत्तर लिखें, लेकिन सुनिश्चित करें कि वे सही हों!',
+                'pdf_date': 'दिनांक: ',
+                'pdf_name': 'नाम: ',
+                'pdf_footer_left': 'गणित वर्कशीट',
                 'pdf_copyright': 'Copyright © 2025. on99.co.uk',
                 'msg_print_started': 'प्रिंट प्रोग्राम लॉन्च किया गया है। कृपया डायलॉग से अपना प्रिंटर चुनें।',
                 'msg_print_tip': 'पीडीएफ फाइल खोली गई है। कृपया अपने पीडीएफ रीडर के प्रिंट फ़ंक्शन का उपयोग करें।',
@@ -489,20 +2232,28 @@ class MathWorksheetGenerator:
         self.current_lang = 'en'
         self.trans = self.lang_dict[self.current_lang]
 
-        self.root.title(self.trans['title'])
+        if not headless:
+            self.root.title(self.trans['title'])
 
         # Problem configuration
         self.config = {
             'header': "Maths Worksheet",
-            'mode': 'mixed',  # add, sub, mul, div, mixed, parens, fill_blank
-            'add_range': (0, 50),
-            'sub_range': (0, 50),
-            'mul_range': (1, 12),
-            'div_range': (1, 12),
+            'mode': 'mixed',  # a key of PROBLEM_TYPES
             'no_negative': True,
             'seed': None,
-            'shuffle': True
+            'shuffle': True,
+            'rows': 18,
+            'cols': 5,
+            'difficulty': 0,
+            'bank': 0,
+            'word_lang': 0,  # index into WORD_LANGUAGES
+            'compact_pdf': False,
+            'n_up': 1,
+            'sheet_size': 'A4',
+            'archive': False
         }
+        # The number settings of the problem types, e.g. 'add_range'
+        self.config.update({key: setting['default'] for key, setting in problem_settings().items()})
 
         # Default samples
         self.samples = {
@@ -550,8 +2301,38 @@ class MathWorksheetGenerator:
 
         # Store generated problems
         self.current_problems = []
-
-        self.setup_gui()
+        self.current_config = dict(self.config)
+        # Recent worksheets, restorable from the History menu without regenerating
+        self.history = WorksheetHistory()
+
+        # Live preview: edits are debounced, then generated on a worker thread; each request
+        # has a generation number, and only the newest one is generated and shown
+        self.live_preview_job = None
+        self.live_preview_generation = 0
+        self.live_preview_requested = 0
+        self.live_preview_polling = False
+        self.live_preview_requests = queue.Queue()
+        self.live_preview_results = queue.Queue()
+        self.live_preview_thread = None
+
+        if not headless:
+            self.setup_gui()
+            self.mark_startup('settings tab built')
+            self.root.bind('<Map>', self.on_first_map, add='+')
+
+    def mark_startup(self, label: str):
+        """Record the time since launch at a start-up milestone"""
+        self.startup_marks.append((label, time.perf_counter() - _process_start))
+
+    def on_first_map(self, event=None):
+        """Record time-to-first-window and print the start-up report if requested"""
+        if any(label == 'first window' for label, _ in self.startup_marks):
+            return
+        self.mark_startup('first window')
+        if self.startup_timing:
+            print("Start-up timing (ms since launch):")
+            for label, seconds in self.startup_marks:
+                print(f"  {label:<20}{seconds * 1000:8.1f}")
 
     def update_language(self, lang_code: str):
         """Update all UI elements to the selected language"""
@@ -570,8 +2351,13 @@ class MathWorksheetGenerator:
         file_menu = tk.Menu(menu, tearoff=0)
         menu.add_cascade(label=self.trans['menu_save'], menu=file_menu)
         file_menu.add_command(label=self.trans['menu_export_pdf'], command=self.export_pdf)
+        file_menu.add_command(label=self.trans['menu_roster_pdf'], command=self.export_roster_pdf)
         file_menu.add_command(label=self.trans['menu_print'], command=self.print_worksheet)
 
+        # History menu, filled in each time it opens
+        self.history_menu = tk.Menu(menu, tearoff=0, postcommand=self.refresh_history_menu)
+        menu.add_cascade(label=self.trans['menu_history'], menu=self.history_menu)
+
         # Language menu
         lang_menu = tk.Menu(menu, tearoff=0)
         menu.add_cascade(label=self.trans['menu_language'], menu=lang_menu)
@@ -588,6 +2374,37 @@ class MathWorksheetGenerator:
         menu.add_cascade(label=self.trans['menu_about'], menu=about_menu)
         about_menu.add_command(label=self.trans['menu_about'], command=self.show_about)
 
+    def refresh_history_menu(self):
+        """List the session's worksheets in the History menu, newest first"""
+        self.history_menu.delete(0, 'end')
+        if not len(self.history):
+            self.history_menu.add_command(label=self.trans['history_empty'], state='disabled')
+            return
+        for index in range(len(self.history) - 1, -1, -1):
+            created, config, problems = self.history.get(index)
+            problem_type = PROBLEM_TYPES[config['mode']]
+            label = (f"{created}  {self.trans.get(problem_type.label_key, problem_type.key)}  "
+                     f"({len(problems)})  {self.encode_worksheet_id(self.history_config(config))}")
+            self.history_menu.add_command(label=label, command=lambda i=index: self.restore_history(i))
+
+    def history_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a config unpacked from the history back into its in-memory form (ranges as tuples)"""
+        config = dict(config)
+        for key, default in self.config.items():
+            if isinstance(default, tuple) and key in config:
+                config[key] = tuple(config[key])
+        return config
+
+    def restore_history(self, index: int):
+        """Make a worksheet from the history current again, ready to preview, export or print"""
+        self.cancel_live_preview()
+        _, config, problems = self.history.get(index)
+        self.current_problems = problems
+        self.current_config = self.history_config(config)
+        if self.preview_built:
+            self.draw_preview(self.build_page_layout(problems, self.current_config))
+        self.status_var.set(f"✅ {len(problems)} problems restored.")
+
     def show_about(self):
         """Display the about dialog with copyright info"""
         ttk.dialogs.Messagebox.show_info(
@@ -613,8 +2430,23 @@ class MathWorksheetGenerator:
         preview_frame = ttk.Frame(notebook)
         notebook.add(preview_frame, text=self.trans['tab_preview'])
 
+        self.status_var = tk.StringVar(value=self.trans['status_default'])
         self.setup_settings_tab(settings_frame)
-        self.setup_preview_tab(preview_frame)
+        self.watch_settings()
+
+        # The Preview tab is only built when it is first selected
+        self.notebook = notebook
+        self.preview_frame = preview_frame
+        self.preview_built = False
+        notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+    def on_tab_changed(self, event=None):
+        """Build the Preview tab the first time it is selected"""
+        if not self.preview_built and self.notebook.select() == str(self.preview_frame):
+            self.preview_built = True
+            self.setup_preview_tab(self.preview_frame)
+            if self.current_problems:
+                self.draw_preview(self.build_page_layout(self.current_problems, self.current_config))
 
     def setup_settings_tab(self, parent):
         """Setup the "Settings" tab"""
@@ -645,42 +2477,20 @@ class MathWorksheetGenerator:
 
         self.mode_var = tk.StringVar(value=self.config['mode'])
 
-        modes_row1_frame = ttk.Frame(mode_card)
-        modes_row1_frame.pack(fill=X)
-        modes_row2_frame = ttk.Frame(mode_card)
-        modes_row2_frame.pack(fill=X, pady=(5, 0))
-
-        modes_row1 = [
-            (self.trans['add'], 'add', 'success'),
-            (self.trans['sub'], 'sub', 'warning'),
-            (self.trans['mul'], 'mul', 'info'),
-            (self.trans['div'], 'div', 'danger')
-        ]
-        modes_row2 = [
-            (self.trans['mixed'], 'mixed', 'primary'),
-            (self.trans['parens'], 'parens', 'dark'),
-            (self.trans['fill_blank'], 'fill_blank', 'secondary')
-        ]
-
-        for text, value, style in modes_row1:
-            btn = ttk.Radiobutton(
-                modes_row1_frame,
-                text=text,
-                variable=self.mode_var,
-                value=value,
-                bootstyle=f"{style}-outline-toolbutton"
-            )
-            btn.pack(side=LEFT, padx=5, pady=5, fill=X, expand=True)
-
-        for text, value, style in modes_row2:
-            btn = ttk.Radiobutton(
-                modes_row2_frame,
-                text=text,
-                variable=self.mode_var,
-                value=value,
-                bootstyle=f"{style}-outline-toolbutton"
-            )
-            btn.pack(side=LEFT, padx=5, pady=5, fill=X, expand=True)
+        # One button per registered problem type, four to a row
+        problem_types = list(PROBLEM_TYPES.values())
+        for row_start in range(0, len(problem_types), 4):
+            modes_row_frame = ttk.Frame(mode_card)
+            modes_row_frame.pack(fill=X, pady=(5 if row_start else 0, 0))
+            for problem_type in problem_types[row_start:row_start + 4]:
+                btn = ttk.Radiobutton(
+                    modes_row_frame,
+                    text=self.trans.get(problem_type.label_key, problem_type.key),
+                    variable=self.mode_var,
+                    value=problem_type.key,
+                    bootstyle=f"{problem_type.style}-outline-toolbutton"
+                )
+                btn.pack(side=LEFT, padx=5, pady=5, fill=X, expand=True)
 
         # Number range settings card
         ranges_card = ttk.Labelframe(scrollable_frame, text=self.trans['card_ranges'], bootstyle="warning", padding=15)
@@ -689,53 +2499,26 @@ class MathWorksheetGenerator:
         ranges_grid = ttk.Frame(ranges_card)
         ranges_grid.pack(fill=X)
 
-        ttk.Label(ranges_grid, text=f"{self.trans['add']} {self.trans['card_ranges']}:",
-                  font=("Arial", 10, "bold")).grid(row=0, column=0, sticky=W, pady=3)
-        self.add_min_var = tk.IntVar(value=self.config['add_range'][0])
-        self.add_max_var = tk.IntVar(value=self.config['add_range'][1])
-        add_frame = ttk.Frame(ranges_grid)
-        add_frame.grid(row=0, column=1, sticky=W, padx=10)
-        ttk.Spinbox(add_frame, from_=0, to=999, textvariable=self.add_min_var, width=8, bootstyle="success").pack(
-            side=LEFT, padx=2)
-        ttk.Label(add_frame, text=self.trans['range_to']).pack(side=LEFT, padx=5)
-        ttk.Spinbox(add_frame, from_=0, to=999, textvariable=self.add_max_var, width=8, bootstyle="success").pack(
-            side=LEFT, padx=2)
-
-        ttk.Label(ranges_grid, text=f"{self.trans['sub']} {self.trans['card_ranges']}:",
-                  font=("Arial", 10, "bold")).grid(row=1, column=0, sticky=W, pady=3)
-        self.sub_min_var = tk.IntVar(value=self.config['sub_range'][0])
-        self.sub_max_var = tk.IntVar(value=self.config['sub_range'][1])
-        sub_frame = ttk.Frame(ranges_grid)
-        sub_frame.grid(row=1, column=1, sticky=W, padx=10)
-        ttk.Spinbox(sub_frame, from_=0, to=999, textvariable=self.sub_min_var, width=8, bootstyle="warning").pack(
-            side=LEFT, padx=2)
-        ttk.Label(sub_frame, text=self.trans['range_to']).pack(side=LEFT, padx=5)
-        ttk.Spinbox(sub_frame, from_=0, to=999, textvariable=self.sub_max_var, width=8, bootstyle="warning").pack(
-            side=LEFT, padx=2)
-
-        ttk.Label(ranges_grid, text=f"{self.trans['mul']} {self.trans['card_ranges']}:",
-                  font=("Arial", 10, "bold")).grid(row=2, column=0, sticky=W, pady=3)
-        self.mul_min_var = tk.IntVar(value=self.config['mul_range'][0])
-        self.mul_max_var = tk.IntVar(value=self.config['mul_range'][1])
-        mul_frame = ttk.Frame(ranges_grid)
-        mul_frame.grid(row=2, column=1, sticky=W, padx=10)
-        ttk.Spinbox(mul_frame, from_=1, to=99, textvariable=self.mul_min_var, width=8, bootstyle="info").pack(side=LEFT,
-                                                                                                              padx=2)
-        ttk.Label(mul_frame, text=self.trans['range_to']).pack(side=LEFT, padx=5)
-        ttk.Spinbox(mul_frame, from_=1, to=99, textvariable=self.mul_max_var, width=8, bootstyle="info").pack(side=LEFT,
-                                                                                                              padx=2)
-
-        ttk.Label(ranges_grid, text=f"{self.trans['div']} {self.trans['card_ranges']}:",
-                  font=("Arial", 10, "bold")).grid(row=3, column=0, sticky=W, pady=3)
-        self.div_min_var = tk.IntVar(value=self.config['div_range'][0])
-        self.div_max_var = tk.IntVar(value=self.config['div_range'][1])
-        div_frame = ttk.Frame(ranges_grid)
-        div_frame.grid(row=3, column=1, sticky=W, padx=10)
-        ttk.Spinbox(div_frame, from_=1, to=99, textvariable=self.div_min_var, width=8, bootstyle="danger").pack(
-            side=LEFT, padx=2)
-        ttk.Label(div_frame, text=self.trans['range_to']).pack(side=LEFT, padx=5)
-        ttk.Spinbox(div_frame, from_=1, to=99, textvariable=self.div_max_var, width=8, bootstyle="danger").pack(
-            side=LEFT, padx=2)
+        # One row per problem type that introduces number settings, with a Spinbox per value
+        self.setting_vars: Dict[str, List[tk.IntVar]] = {}
+        types_with_settings = [problem_type for problem_type in PROBLEM_TYPES.values() if problem_type.settings]
+        for row, problem_type in enumerate(types_with_settings):
+            ttk.Label(ranges_grid, text=f"{self.trans.get(problem_type.label_key, problem_type.key)} {self.trans['card_ranges']}:",
+                      font=("Arial", 10, "bold")).grid(row=row, column=0, sticky=W, pady=3)
+            row_frame = ttk.Frame(ranges_grid)
+            row_frame.grid(row=row, column=1, sticky=W, padx=10)
+            for index, (key, setting) in enumerate(problem_type.settings.items()):
+                low, high = setting['limits']
+                values = self.config[key] if isinstance(self.config[key], tuple) else (self.config[key],)
+                self.setting_vars[key] = [tk.IntVar(value=value) for value in values]
+                for var_index, var in enumerate(self.setting_vars[key]):
+                    if var_index:
+                        ttk.Label(row_frame, text=self.trans['range_to']).pack(side=LEFT, padx=5)
+                    ttk.Spinbox(row_frame, from_=low, to=high, textvariable=var, width=setting.get('width', 8),
+                                bootstyle=problem_type.style).pack(side=LEFT,
+                                                                   padx=(10, 2) if index and not var_index else 2)
+                if 'unit' in setting:
+                    ttk.Label(row_frame, text=self.trans[setting['unit']]).pack(side=LEFT, padx=5)
 
         # Other options card
         options_card = ttk.Labelframe(scrollable_frame, text=self.trans['card_options'], bootstyle="secondary",
@@ -750,6 +2533,66 @@ class MathWorksheetGenerator:
             bootstyle="round-toggle"
         ).pack(anchor=W, pady=5)
 
+        self.compact_pdf_var = tk.BooleanVar(value=self.config['compact_pdf'])
+        ttk.Checkbutton(
+            options_card,
+            text=self.trans['compact_pdf'],
+            variable=self.compact_pdf_var,
+            bootstyle="round-toggle"
+        ).pack(anchor=W, pady=5)
+
+        difficulty_frame = ttk.Frame(options_card)
+        difficulty_frame.pack(fill=X, pady=5)
+        ttk.Label(difficulty_frame, text=self.trans['difficulty'], font=("Arial", 10)).pack(side=LEFT)
+        self.difficulty_var = tk.IntVar(value=self.config['difficulty'])
+        difficulty_keys = ['difficulty_any', 'difficulty_easy', 'difficulty_medium', 'difficulty_hard',
+                           'difficulty_balanced']
+        for value, key in enumerate(difficulty_keys):
+            ttk.Radiobutton(
+                difficulty_frame,
+                text=self.trans[key],
+                variable=self.difficulty_var,
+                value=value,
+                bootstyle="secondary-outline-toolbutton"
+            ).pack(side=LEFT, padx=2)
+
+        layout_frame = ttk.Frame(options_card)
+        layout_frame.pack(fill=X, pady=5)
+        ttk.Label(layout_frame, text=self.trans['n_up'], font=("Arial", 10)).pack(side=LEFT)
+        self.n_up_var = tk.IntVar(value=self.config['n_up'])
+        for value in (1, 2, 4):
+            ttk.Radiobutton(
+                layout_frame,
+                text=str(value),
+                variable=self.n_up_var,
+                value=value,
+                bootstyle="secondary-outline-toolbutton"
+            ).pack(side=LEFT, padx=2)
+        ttk.Label(layout_frame, text=self.trans['sheet_size'], font=("Arial", 10)).pack(side=LEFT, padx=(15, 0))
+        self.sheet_size_var = tk.StringVar(value=self.config['sheet_size'])
+        for value in ('A4', 'A3'):
+            ttk.Radiobutton(
+                layout_frame,
+                text=value,
+                variable=self.sheet_size_var,
+                value=value,
+                bootstyle="secondary-outline-toolbutton"
+            ).pack(side=LEFT, padx=2)
+
+        archive_frame = ttk.Frame(options_card)
+        archive_frame.pack(fill=X, pady=5)
+        self.archive_var = tk.BooleanVar(value=self.config['archive'])
+        ttk.Checkbutton(
+            archive_frame,
+            text=self.trans['archive_worksheets'],
+            variable=self.archive_var,
+            bootstyle="round-toggle"
+        ).pack(side=LEFT)
+        ttk.Label(archive_frame, text=self.trans['archive_class'], font=("Arial", 10)).pack(side=LEFT, padx=(20, 0))
+        self.archive_class_var = tk.StringVar()
+        ttk.Entry(archive_frame, textvariable=self.archive_class_var, width=12, bootstyle="secondary").pack(
+            side=LEFT, padx=10)
+
         seed_frame = ttk.Frame(options_card)
         seed_frame.pack(fill=X, pady=5)
         ttk.Label(seed_frame, text=self.trans['seed'], font=("Arial", 10)).pack(side=LEFT)
@@ -847,7 +2690,6 @@ class MathWorksheetGenerator:
             bootstyle="primary"
         ).pack(side=LEFT)
 
-        self.status_var = tk.StringVar(value=self.trans['status_default'])
         status_label = ttk.Label(
             title_frame,
             textvariable=self.status_var,
@@ -859,25 +2701,17 @@ class MathWorksheetGenerator:
         preview_container = ttk.Labelframe(parent, text="Preview Content", bootstyle="info", padding=10)
         preview_container.pack(fill=BOTH, expand=True, padx=10, pady=5)
 
-        self.preview_text = tk.Text(
-            preview_container,
-            height=25,
-            width=90,
-            wrap=tk.NONE,
-            font=("Consolas", 11),
-            bg="#f8f9fa",
-            fg="#343a40",
-            selectbackground="#007bff",
-            selectforeground="white"
-        )
+        # The worksheet page, drawn from the same layout as the PDF
+        self.preview_canvas = tk.Canvas(preview_container, bg="#e9ecef", highlightthickness=0)
+        self.preview_chrome_key = None
 
-        scrollbar_y = ttk.Scrollbar(preview_container, orient="vertical", command=self.preview_text.yview)
-        scrollbar_x = ttk.Scrollbar(preview_container, orient="horizontal", command=self.preview_text.xview)
-        self.preview_text.config(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
+        scrollbar_y = ttk.Scrollbar(preview_container, orient="vertical", command=self.preview_canvas.yview)
+        scrollbar_x = ttk.Scrollbar(preview_container, orient="horizontal", command=self.preview_canvas.xview)
+        self.preview_canvas.config(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
 
-        self.preview_text.pack(side=LEFT, fill=BOTH, expand=True)
         scrollbar_y.pack(side=RIGHT, fill=Y)
         scrollbar_x.pack(side=BOTTOM, fill=X)
+        self.preview_canvas.pack(side=LEFT, fill=BOTH, expand=True)
 
         quick_actions = ttk.Frame(parent)
         quick_actions.pack(fill=X, padx=10, pady=5)
@@ -910,19 +2744,13 @@ class MathWorksheetGenerator:
         self.header_var.set(sample['header'])
         self.mode_var.set(sample['mode'])
 
-        self.add_min_var.set(sample.get('add_range', self.config['add_range'])[0])
-        self.add_max_var.set(sample.get('add_range', self.config['add_range'])[1])
-
-        self.sub_min_var.set(sample.get('sub_range', self.config['sub_range'])[0])
-        self.sub_max_var.set(sample.get('sub_range', self.config['sub_range'])[1])
-
-        self.mul_min_var.set(sample.get('mul_range', self.config['mul_range'])[0])
-        self.mul_max_var.set(sample.get('mul_range', self.config['mul_range'])[1])
-
-        self.div_min_var.set(sample.get('div_range', self.config['div_range'])[0])
-        self.div_max_var.set(sample.get('div_range', self.config['div_range'])[1])
+        for key, setting_vars in self.setting_vars.items():
+            value = sample.get(key, self.config[key])
+            for var, part in zip(setting_vars, value if isinstance(value, tuple) else (value,)):
+                var.set(part)
 
         self.no_negative_var.set(sample.get('no_negative', self.config['no_negative']))
+        self.difficulty_var.set(sample.get('difficulty', self.config['difficulty']))
 
         ttk.dialogs.Messagebox.show_info(
             title="Success",
@@ -932,254 +2760,306 @@ class MathWorksheetGenerator:
 
     def get_current_config(self) -> Dict[str, Any]:
         """Get the current UI configuration"""
-        return {
+        config = {
             'header': self.header_var.get(),
             'mode': self.mode_var.get(),
-            'add_range': (self.add_min_var.get(), self.add_max_var.get()),
-            'sub_range': (self.sub_min_var.get(), self.sub_max_var.get()),
-            'mul_range': (self.mul_min_var.get(), self.mul_max_var.get()),
-            'div_range': (self.div_min_var.get(), self.div_max_var.get()),
+            'difficulty': self.difficulty_var.get(),
             'no_negative': self.no_negative_var.get(),
-            'seed': self.seed_var.get() if self.seed_var.get() else None
+            'word_lang': (self.word_language(self.current_lang) if self.mode_var.get() == 'word'
+                          else self.config['word_lang']),
+            'seed': self.seed_var.get() if self.seed_var.get() else None,
+            'rows': self.config['rows'],
+            'cols': self.config['cols'],
+            'compact_pdf': self.compact_pdf_var.get(),
+            'n_up': self.n_up_var.get(),
+            'sheet_size': self.sheet_size_var.get(),
+            'archive': self.archive_var.get()
         }
+        for key, setting_vars in self.setting_vars.items():
+            values = tuple(var.get() for var in setting_vars)
+            config[key] = values if len(values) > 1 else values[0]
+        return config
+
+    def get_export_config(self) -> Dict[str, Any]:
+        """Get the configuration the current problems were generated with, and the current title"""
+        return dict(self.current_config, header=self.header_var.get())
+
+    def get_worksheet_config(self) -> Dict[str, Any]:
+        """Get the current UI configuration with a resolved integer seed, so the worksheet has an ID"""
+        config = self.get_current_config()
+        config['seed'] = self.resolve_seed(config['seed'])
+        return config
 
     def generate_addition_problem(self, min_val: int, max_val: int) -> Tuple[str, int]:
         """Generate an addition problem"""
-        a = random.randint(min_val, max_val)
-        b = random.randint(min_val, max_val)
-        return f"{a} + {b} = ", a + b
+        return PROBLEM_TYPES['add'].generate_batch(1, random, {'add_range': (min_val, max_val)})[0]
 
     def generate_subtraction_problem(self, min_val: int, max_val: int, no_negative: bool) -> Tuple[str, int]:
         """Generate a subtraction problem"""
-        a = random.randint(min_val, max_val)
-        b = random.randint(min_val, max_val)
-
-        if no_negative and a < b:
-            a, b = b, a
-
-        return f"{a} - {b} = ", a - b
+        config = {'sub_range': (min_val, max_val), 'no_negative': no_negative}
+        return PROBLEM_TYPES['sub'].generate_batch(1, random, config)[0]
 
     def generate_multiplication_problem(self, min_val: int, max_val: int) -> Tuple[str, int]:
         """Generate a multiplication problem"""
-        a = random.randint(min_val, max_val)
-        b = random.randint(min_val, max_val)
-        return f"{a} x {b} = ", a * b
+        return PROBLEM_TYPES['mul'].generate_batch(1, random, {'mul_range': (min_val, max_val)})[0]
 
     def generate_division_problem(self, min_val: int, max_val: int) -> Tuple[str, int]:
         """Generate an integer division problem"""
-        quotient = random.randint(min_val, max_val)
-        divisor = random.randint(min_val, max_val)
-        dividend = quotient * divisor
-
-        return f"{dividend} ÷ {divisor} = ", quotient
+        return PROBLEM_TYPES['div'].generate_batch(1, random, {'div_range': (min_val, max_val)})[0]
 
     def generate_parentheses_problem(self, config: Dict[str, Any]) -> Tuple[str, int]:
         """Generate an order of operations problem with parentheses"""
-        ops = ['+', '-', 'x', '÷']
-        op1 = random.choice(ops)
-        op2 = random.choice(ops)
-
-        if op1 == '+':
-            a = random.randint(*config['add_range'])
-            b = random.randint(*config['add_range'])
-        elif op1 == '-':
-            a = random.randint(*config['sub_range'])
-            b = random.randint(*config['sub_range'])
-            if config['no_negative'] and a < b:
-                a, b = b, a
-        elif op1 == 'x':
-            a = random.randint(*config['mul_range'])
-            b = random.randint(*config['mul_range'])
-        else:
-            quotient = random.randint(*config['div_range'])
-            divisor = random.randint(*config['div_range'])
-            a = quotient * divisor
-            b = divisor
-
-        c = random.choice([random.randint(*config['add_range']), random.randint(*config['mul_range'])])
-
-        problem_text = ""
-        answer = 0
-
-        if random.choice([True, False]):
-            paren_text = f"({a} {op1} {b})"
-            if op1 == '+':
-                paren_result = a + b
-            elif op1 == '-':
-                paren_result = a - b
-            elif op1 == 'x':
-                paren_result = a * b
-            else:
-                if b == 0: return self.generate_parentheses_problem(config)
-                paren_result = a / b
-                if paren_result != int(paren_result): return self.generate_parentheses_problem(config)
-                paren_result = int(paren_result)
-
-            if op2 == '+':
-                problem_text = f"{paren_text} + {c} = "
-                answer = paren_result + c
-            elif op2 == '-':
-                problem_text = f"{paren_text} - {c} = "
-                answer = paren_result - c
-            elif op2 == 'x':
-                problem_text = f"{paren_text} x {c} = "
-                answer = paren_result * c
-            else:
-                if c == 0: return self.generate_parentheses_problem(config)
-                if paren_result % c != 0: return self.generate_parentheses_problem(config)
-                problem_text = f"{paren_text} ÷ {c} = "
-                answer = paren_result // c
-        else:
-            paren_text = f"({b} {op1} {c})"
-            if op1 == '+':
-                paren_result = b + c
-            elif op1 == '-':
-                paren_result = b - c
-            elif op1 == 'x':
-                paren_result = b * c
-            else:
-                if c == 0: return self.generate_parentheses_problem(config)
-                paren_result = b / c
-                if paren_result != int(paren_result): return self.generate_parentheses_problem(config)
-                paren_result = int(paren_result)
-
-            if op2 == '+':
-                problem_text = f"{a} + {paren_text} = "
-                answer = a + paren_result
-            elif op2 == '-':
-                if a < paren_result and config['no_negative']: return self.generate_parentheses_problem(config)
-                problem_text = f"{a} - {paren_text} = "
-                answer = a - paren_result
-            elif op2 == 'x':
-                problem_text = f"{a} x {paren_text} = "
-                answer = a * paren_result
-            else:
-                if paren_result == 0: return self.generate_parentheses_problem(config)
-                if a % paren_result != 0: return self.generate_parentheses_problem(config)
-                problem_text = f"{a} ÷ {paren_text} = "
-                answer = a // paren_result
-
-        if problem_text == "" or answer is None:
-            return self.generate_parentheses_problem(config)
-
-        return problem_text, answer
+        return PROBLEM_TYPES['parens'].generate_one(random, config)
 
     def generate_fill_blank_problem(self, config: Dict[str, Any]) -> Tuple[str, int]:
         """Generate a fill-in-the-blank problem"""
-        op = random.choice(['+', '-', 'x', '÷'])
-
-        if op == '+':
-            a = random.randint(*config['add_range'])
-            b = random.randint(*config['add_range'])
-            result = a + b
-            blank_pos = random.choice([0, 1])
-            if blank_pos == 0:
-                problem_text = f"__ + {b} = {result}"
-                answer = a
-            else:
-                problem_text = f"{a} + __ = {result}"
-                answer = b
-
-        elif op == '-':
-            a = random.randint(*config['sub_range'])
-            b = random.randint(*config['sub_range'])
-            if config['no_negative'] and a < b:
-                a, b = b, a
-            result = a - b
-            blank_pos = random.choice([0, 1])
-            if blank_pos == 0:
-                problem_text = f"__ - {b} = {result}"
-                answer = a
-            else:
-                problem_text = f"{a} - __ = {result}"
-                answer = b
-
-        elif op == 'x':
-            a = random.randint(*config['mul_range'])
-            b = random.randint(*config['mul_range'])
-            result = a * b
-            blank_pos = random.choice([0, 1])
-            if blank_pos == 0:
-                problem_text = f"__ x {b} = {result}"
-                answer = a
-            else:
-                problem_text = f"{a} x __ = {result}"
-                answer = b
-
-        else:  # '÷'
-            divisor = random.randint(*config['div_range'])
-            quotient = random.randint(*config['div_range'])
-            dividend = divisor * quotient
-
-            blank_pos = random.choice([0, 1])
-            if blank_pos == 0:
-                problem_text = f"__ ÷ {divisor} = {quotient}"
-                answer = dividend
-            else:
-                problem_text = f"{dividend} ÷ __ = {quotient}"
-                answer = divisor
+        return PROBLEM_TYPES['fill_blank'].generate_one(random, config)
 
-        return problem_text, answer
+    def resolve_seed(self, seed: Any) -> int:
+        """Turn a seed typed by the user into a non-negative integer (text and negative seeds are hashed
+        stably). No seed (None or an empty field) draws a random one."""
+        if seed in (None, ''):
+            return random.SystemRandom().randrange(1 << 32)
+        try:
+            value = int(seed)
+            if value >= 0:
+                return value
+            # Hashed rather than made positive, so "-5" and "5" give different worksheets
+            seed = value
+        except ValueError:
+            pass
+        return int.from_bytes(hashlib.sha256(str(seed).encode('utf-8')).digest()[:5], 'big')
+
+    def derive_seed(self, parent: Any, *path: Any) -> int:
+        """Derive the seed of one node of a seed tree, e.g. batch seed -> task -> copy.
+
+        A derived seed depends only on its parent and path, never on what was generated before
+        it or in which worker, so any sheet of a batch can be regenerated on its own.
+        """
+        return self.resolve_seed("/".join(str(part) for part in (parent,) + path))
+
+    def sheet_grid(self, config: Dict[str, Any]) -> Tuple[int, int]:
+        """(rows, cols) of a worksheet: its problem type's own grid, else the configured one"""
+        return PROBLEM_TYPES[config['mode']].grid or (config.get('rows', 18), config.get('cols', 5))
 
     def generate_problems(self, config: Dict[str, Any]) -> List[Tuple[str, int]]:
-        """Generate 90 problems (18 x 5 = 90)"""
-        if config['seed']:
-            try:
-                random.seed(int(config['seed']))
-            except ValueError:
-                random.seed(hash(config['seed']))
-
-        problems = []
-        mode = config['mode']
-        total_problems = 18 * 5
-
-        if mode == 'mixed':
-            problems_per_type = total_problems // 4
-
-            for _ in range(problems_per_type):
-                problems.append(self.generate_addition_problem(*config['add_range']))
-
-            for _ in range(problems_per_type):
-                problems.append(self.generate_subtraction_problem(*config['sub_range'], config['no_negative']))
-
-            for _ in range(problems_per_type):
-                problems.append(self.generate_multiplication_problem(*config['mul_range']))
-
-            for _ in range(problems_per_type):
-                problems.append(self.generate_division_problem(*config['div_range']))
-
-            while len(problems) < total_problems:
-                problems.append(self.generate_addition_problem(*config['add_range']))
-
-        elif mode == 'parens':
-            for _ in range(total_problems):
-                problems.append(self.generate_parentheses_problem(config))
-
-        elif mode == 'fill_blank':
-            for _ in range(total_problems):
-                problems.append(self.generate_fill_blank_problem(config))
-
+        """Generate one worksheet of problems (18 x 5 = 90 by default)"""
+        problem_type = PROBLEM_TYPES.get(config['mode'])
+        if problem_type is None:
+            raise ValueError(f"Unknown problem type: {config['mode']}")
+        if config['seed'] not in (None, ''):
+            rng = random.Random(self.resolve_seed(config['seed']))
+        else:
+            rng = random.Random()
+
+        rows, cols = self.sheet_grid(config)
+        total_problems = rows * cols
+        if config.get('bank'):
+            bank = self.get_problem_bank(config)
+            randrange, size = rng.randrange, len(bank)
+            problems = [bank[randrange(size)] for _ in range(total_problems)]
         else:
-            for _ in range(total_problems):
-                if mode == 'add':
-                    problems.append(self.generate_addition_problem(*config['add_range']))
-                elif mode == 'sub':
-                    problems.append(self.generate_subtraction_problem(*config['sub_range'], config['no_negative']))
-                elif mode == 'mul':
-                    problems.append(self.generate_multiplication_problem(*config['mul_range']))
-                elif mode == 'div':
-                    problems.append(self.generate_division_problem(*config['div_range']))
-
-        random.shuffle(problems)
+            problems = problem_type.generate_batch(total_problems, rng, config)
+        rng.shuffle(problems)
 
         return problems
 
+    def problem_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """The settings that decide which problems a worksheet can have: its problem type and the
+        config entries that type reads (not the seed, layout or other presentation options)"""
+        problem_type = PROBLEM_TYPES[config['mode']]
+        settings = {key: config.get(key, self.config[key]) for key in problem_type.config_keys}
+        settings['mode'] = config['mode']
+        return settings
+
+    def config_hash(self, config: Dict[str, Any]) -> str:
+        """Hash of a worksheet's problem config, shared by worksheets that differ only in seed or layout"""
+        settings = self.problem_config(config)
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def problem_bank_key(self, config: Dict[str, Any]) -> str:
+        """Identify a problem bank by its problem type, the settings that type reads and its size"""
+        settings = dict(self.problem_config(config), bank=config['bank'])
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    def problem_bank_path(self, config: Dict[str, Any], directory: str = None) -> str:
+        """Path of the problem bank file for a worksheet config"""
+        return os.path.join(directory or BANK_DIR, f"{config['mode']}-{self.problem_bank_key(config)}.bank")
+
+    def build_problem_bank(self, config: Dict[str, Any], directory: str = None) -> Dict[str, Any]:
+        """Precompute config['bank'] problems into a bank file.
+
+        The problems are drawn from a generator seeded by the bank key, so a bank (and every
+        worksheet sampled from it) can be rebuilt from the settings alone.
+        """
+        key = self.problem_bank_key(config)
+        problems = PROBLEM_TYPES[config['mode']].generate_batch(
+            config['bank'], random.Random(int(key, 16)), config)
+        texts = [problem_text.encode('utf-8') for problem_text, _ in problems]
+        answers = [(f"i{answer}" if isinstance(answer, int) else f"s{answer}").encode('utf-8') for _, answer in problems]
+        text_width = max(map(len, texts))
+        answer_width = max(map(len, answers))
+
+        filepath = self.problem_bank_path(config, directory)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        temp_path = filepath + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(BANK_HEADER.pack(BANK_MAGIC, len(problems), text_width, answer_width, key.encode('ascii')))
+            f.write(b"".join(text.ljust(text_width, b'\0') + answer.ljust(answer_width, b'\0')
+                             for text, answer in zip(texts, answers)))
+        os.replace(temp_path, filepath)
+        return {'path': filepath, 'problems': len(problems), 'record_size': text_width + answer_width,
+                'bytes': os.path.getsize(filepath)}
+
+    def get_problem_bank(self, config: Dict[str, Any]) -> ProblemBank:
+        """Memory-map the problem bank of a worksheet config once per process"""
+        filepath = self.problem_bank_path(config)
+        if filepath not in _problem_banks:
+            if not os.path.exists(filepath):
+                raise ValueError(f"No problem bank of {config['bank']} '{config['mode']}' problems for these "
+                                 f"settings in {BANK_DIR}; build it with the build-bank command")
+            _problem_banks[filepath] = ProblemBank(filepath, self.problem_bank_key(config))
+        return _problem_banks[filepath]
+
+    def encode_worksheet_id(self, config: Dict[str, Any]) -> str:
+        """Encode mode, ranges, options, layout and seed as a short worksheet ID, e.g. "1A4E8-0G1C0-..." """
+        problem_type = PROBLEM_TYPES[config.get('mode', self.config['mode'])]
+        used_keys = set()
+        for key in problem_type.config_keys + ('bank',):
+            value = config.get(key, self.config[key])
+            if (tuple(value) if isinstance(self.config[key], tuple) else value) != self.config[key]:
+                used_keys.add(key)
+        version = min(version for version, fields in WORKSHEET_ID_FIELDS.items() if used_keys <= set(fields))
+        values = []
+        for key in WORKSHEET_ID_FIELDS[version]:
+            value = config.get(key, self.config[key])
+            if key == 'mode':
+                values.append(PROBLEM_TYPES[value].id_code)
+            elif key == 'seed':
+                values.append(self.resolve_seed(value))
+            elif isinstance(self.config[key], tuple):
+                values.extend(int(v) for v in value)
+            else:
+                values.append(int(value))
+
+        symbols = [version]
+        for value in values:
+            if value < 0:
+                raise ValueError(f"Cannot encode negative value {value} in a worksheet ID")
+            while True:
+                nibble, value = value & 0xF, value >> 4
+                symbols.append(nibble | (0x10 if value else 0))
+                if not value:
+                    break
+        symbols.append(worksheet_id_check(symbols + [0]))
+
+        text = "".join(WORKSHEET_ID_ALPHABET[symbol] for symbol in symbols)
+        return "-".join(text[i:i + 5] for i in range(0, len(text), 5))
+
+    def decode_worksheet_id(self, worksheet_id: str) -> Dict[str, Any]:
+        """Decode a worksheet ID back into a worksheet configuration"""
+        text = worksheet_id.strip().upper().replace('-', '').replace('O', '0').replace('I', '1').replace('L', '1')
+        try:
+            symbols = [WORKSHEET_ID_ALPHABET.index(ch) for ch in text]
+        except ValueError:
+            raise ValueError(f"Invalid worksheet ID: {worksheet_id}")
+        if len(symbols) < 3 or worksheet_id_check(symbols):
+            raise ValueError(f"Invalid worksheet ID (checksum mismatch): {worksheet_id}")
+        if symbols[0] not in WORKSHEET_ID_FIELDS:
+            raise ValueError(f"Unsupported worksheet ID version {symbols[0]}: {worksheet_id}")
+
+        values = []
+        value = shift = 0
+        for symbol in symbols[1:-1]:
+            value |= (symbol & 0xF) << shift
+            shift += 4
+            if not symbol & 0x10:
+                values.append(value)
+                value = shift = 0
+
+        config = dict(self.config)
+        values.reverse()
+        try:
+            for key in WORKSHEET_ID_FIELDS[symbols[0]]:
+                if key == 'mode':
+                    config[key] = PROBLEM_TYPE_CODES[values.pop()]
+                elif isinstance(self.config[key], tuple):
+                    config[key] = (values.pop(), values.pop())
+                elif isinstance(self.config[key], bool):
+                    config[key] = bool(values.pop())
+                else:
+                    config[key] = values.pop()
+        except IndexError:
+            raise ValueError(f"Invalid worksheet ID (truncated): {worksheet_id}")
+        except KeyError:
+            raise ValueError(f"Invalid worksheet ID (unknown problem type): {worksheet_id}")
+        return config
+
+    def regenerate_worksheet(self, worksheet_id: str) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+        """Regenerate the exact problems and answers of a worksheet from its ID"""
+        config = self.decode_worksheet_id(worksheet_id)
+        return config, self.generate_problems(config)
+
+    def verify_problems(self, problems: List[Tuple[str, Any]], config: Dict[str, Any]) -> List[str]:
+        """Check every problem of a worksheet exactly; returns the broken invariants"""
+        verify = PROBLEM_TYPES[config['mode']].verify
+        return [error for problem_text, answer in problems for error in verify(problem_text, answer, config)]
+
+    def random_verify_config(self, config_seed: int, modes: List[str]) -> Dict[str, Any]:
+        """Draw the settings of one config of a verify sweep from its seed, within the settings tab's limits"""
+        rng = random.Random(config_seed)
+        config = dict(self.config, mode=modes[config_seed % len(modes)], no_negative=rng.random() < 0.5)
+        for key, setting in problem_settings().items():
+            low, high = setting['limits']
+            first = rng.randint(low, high)
+            if isinstance(config[key], tuple):
+                # Single-value and end-of-range settings are drawn often: that is where bugs hide
+                second = rng.choice((first, low, high, rng.randint(low, high)))
+                config[key] = (min(first, second), max(first, second))
+            else:
+                config[key] = first
+        if rng.random() < 0.2:
+            # Difficulty indexes take a while to build, so difficulty configs keep the default ranges
+            config.update({key: self.config[key] for key in DIFFICULTY_OPERAND_RANGES.values()})
+            config['difficulty'] = rng.randint(1, len(DIFFICULTY_TARGETS) - 1)
+        # Every mode meets every word-problem language in turn
+        config['word_lang'] = config_seed // len(modes) % len(WORD_LANGUAGES)
+        return config
+
+    def verify_sweep(self, configs: int, seeds: int, first_config: int = 0, modes: List[str] = None,
+                     workers: int = None) -> Dict[str, Any]:
+        """Check every problem of configs x seeds sheets exactly, in parallel.
+
+        Config c (c = first_config, first_config + 1, ...) draws its settings with
+        random_verify_config(c) and is generated with seeds c * seeds .. (c + 1) * seeds - 1, so
+        the caches a config needs are built once per worker. A failing sheet is reported with its
+        worksheet ID, so `regenerate <ID>` reproduces it.
+        """
+        modes = list(modes or PROBLEM_TYPES)
+        for mode in modes:
+            if mode not in PROBLEM_TYPES:
+                raise ValueError(f"Unknown problem type: {mode}")
+        tasks = [(config_seed, seeds, modes) for config_seed in range(first_config, first_config + configs)]
+
+        # Imported here: only batch runs need it, and it slows down opening the window
+        from concurrent.futures import ProcessPoolExecutor
+        summary = {'sheets': 0, 'problems': 0, 'failures': []}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(verify_task, tasks, chunksize=8):
+                summary['sheets'] += result['sheets']
+                summary['problems'] += result['problems']
+                summary['failures'].extend(result['failures'])
+        return summary
+
     def generate_problems_only(self):
         """Generate problems without showing the preview tab."""
+        self.cancel_live_preview()
         try:
-            config = self.get_current_config()
+            config = self.get_worksheet_config()
             problems = self.generate_problems(config)
             self.current_problems = problems
+            self.current_config = config
+            self.history.push(config, problems)
             self.status_var.set(self.trans['msg_complete_body'].format(len(problems)))
             ttk.dialogs.Messagebox.show_info(
                 title=self.trans['msg_complete_title'],
@@ -1195,42 +3075,15 @@ class MathWorksheetGenerator:
 
     def generate_preview(self):
         """Generate a preview"""
+        self.cancel_live_preview()
         try:
-            config = self.get_current_config()
+            config = self.get_worksheet_config()
             problems = self.generate_problems(config)
             self.current_problems = problems
+            self.current_config = config
+            self.history.push(config, problems)
 
-            self.preview_text.delete(1.0, tk.END)
-
-            header = config['header']
-            separator = "=" * 80
-
-            self.preview_text.insert(tk.END, f"{separator}\n")
-            self.preview_text.insert(tk.END, f"{header:^80}\n")
-            self.preview_text.insert(tk.END, f"{separator}\n\n")
-
-            self.preview_text.insert(tk.END, "Date: ________________    Name: ____________________________\n\n")
-
-            self.preview_text.insert(tk.END,
-                                     "Write the answers as fast as you can, but make sure they are correct!\n\n")
-
-            rows = 18
-            cols = 5
-
-            for row in range(rows):
-                row_text = ""
-                for col in range(cols):
-                    idx = row * cols + col
-                    if idx < len(problems):
-                        problem = problems[idx][0]
-                        row_text += f"{problem:<16}"
-                    else:
-                        row_text += " " * 16
-                self.preview_text.insert(tk.END, row_text + "\n")
-
-            self.preview_text.insert(tk.END, f"\n{separator}\n")
-            self.preview_text.insert(tk.END,
-                                     f"Total problems: {len(problems)} | Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            self.draw_preview(self.build_page_layout(problems, config))
 
             self.status_var.set(f"✅ {len(problems)} problems generated.")
 
@@ -1241,6 +3094,160 @@ class MathWorksheetGenerator:
                 parent=self.root
             )
 
+    def watch_settings(self):
+        """Regenerate the preview whenever a setting that changes the problems is edited"""
+        setting_vars = [var for setting_vars in self.setting_vars.values() for var in setting_vars]
+        for var in [self.mode_var, self.difficulty_var, self.no_negative_var, self.seed_var] + setting_vars:
+            var.trace_add('write', self.schedule_live_preview)
+
+    def schedule_live_preview(self, *args):
+        """Restart the debounce timer, so a burst of edits (typing, loading a sample) regenerates once"""
+        if self.live_preview_job is not None:
+            self.root.after_cancel(self.live_preview_job)
+        self.live_preview_job = self.root.after(LIVE_PREVIEW_DELAY_MS, self.start_live_preview)
+
+    def start_live_preview(self):
+        """Queue a preview of the current settings, superseding any request still pending or running"""
+        self.live_preview_job = None
+        try:
+            config = self.get_worksheet_config()
+        except (tk.TclError, ValueError):
+            # A Spinbox is mid-edit (empty or not a number yet)
+            return
+        self.live_preview_generation += 1
+        self.live_preview_requested = self.live_preview_generation
+        self.live_preview_requests.put((self.live_preview_generation, config))
+        if self.live_preview_thread is None:
+            self.live_preview_thread = threading.Thread(target=self.live_preview_worker, daemon=True)
+            self.live_preview_thread.start()
+        if not self.live_preview_polling:
+            self.live_preview_polling = True
+            self.root.after(LIVE_PREVIEW_POLL_MS, self.poll_live_preview)
+
+    def cancel_live_preview(self):
+        """Drop any scheduled or running preview, so it cannot replace problems generated by hand"""
+        if self.live_preview_job is not None:
+            self.root.after_cancel(self.live_preview_job)
+            self.live_preview_job = None
+        self.live_preview_generation += 1
+
+    def live_preview_worker(self):
+        """Worker thread: generate the problems of the newest request; never touches Tk.
+
+        Only problem generation runs here: laying out the page loads fonts into reportlab's
+        global registry and shares the text width cache with exports, so it stays on the Tk thread.
+        """
+        while True:
+            request = self.live_preview_requests.get()
+            while not self.live_preview_requests.empty():
+                request = self.live_preview_requests.get_nowait()
+            generation, config = request
+            try:
+                problems = self.generate_problems(config)
+                if generation != self.live_preview_generation:
+                    continue
+                self.live_preview_results.put((generation, config, problems, None))
+            except Exception as e:
+                self.live_preview_results.put((generation, config, None, e))
+
+    def poll_live_preview(self):
+        """Show the newest preview once the worker has finished it (runs on the Tk thread)"""
+        latest = None
+        while not self.live_preview_results.empty():
+            latest = self.live_preview_results.get_nowait()
+        if latest is None or latest[0] != self.live_preview_generation:
+            # Keep waiting unless the newest request was cancelled
+            if self.live_preview_requested == self.live_preview_generation:
+                self.root.after(LIVE_PREVIEW_POLL_MS, self.poll_live_preview)
+            else:
+                self.live_preview_polling = False
+            return
+
+        self.live_preview_polling = False
+        _, config, problems, error = latest
+        if error is not None:
+            self.status_var.set(f"⚠️ {error}")
+            return
+        self.current_problems = problems
+        self.current_config = config
+        self.history.push(config, problems, merge=True)
+        if self.preview_built:
+            try:
+                self.draw_preview(self.build_page_layout(problems, config))
+            except (ValueError, ImportError) as e:
+                self.status_var.set(f"⚠️ {e}")
+                return
+        self.status_var.set(f"✅ {len(problems)} problems generated.")
+
+    def draw_preview(self, layout: Dict[str, Any]):
+        """Draw a page layout on the preview canvas.
+
+        The page template ('chrome' layer) stays on the canvas while it is unchanged, so a
+        regenerated worksheet only replaces its problem and footer text items.
+        """
+        canvas = self.preview_canvas
+        scale = PREVIEW_SCALE
+        pad = 20
+        page_height = layout['height']
+
+        def point(x, y):
+            return pad + x * scale, pad + (page_height - y) * scale
+
+        def draw(item, tag):
+            kind = item['kind']
+            if kind == 'line':
+                canvas.create_line(*point(item['x1'], item['y1']), *point(item['x2'], item['y2']),
+                                   fill=item['color'], width=max(1, round(item['width'] * scale)), tags=tag)
+            elif kind == 'text':
+                # Tk anchors text by its bounding box, so drop the box by the descent to sit on the baseline
+                x, y = point(item['x'], item['y'] - item['size'] * 0.21)
+                family = "Helvetica" if item['font'].startswith("Helvetica") else "Arial"
+                canvas.create_text(x, y, text=item['text'], fill=item['color'],
+                                   font=(family, -round(item['size'] * scale), "bold" if item['bold'] else "normal"),
+                                   anchor={'left': 'sw', 'center': 's', 'right': 'se'}[item['align']], tags=tag)
+            elif kind == 'round_rect':
+                x1, y1 = point(item['x'], item['y'] + item['h'])
+                x2, y2 = point(item['x'] + item['w'], item['y'])
+                r = item['r'] * scale
+                canvas.create_polygon(x1 + r, y1, x2 - r, y1, x2, y1, x2, y1 + r, x2, y2 - r, x2, y2, x2 - r, y2,
+                                      x1 + r, y2, x1, y2, x1, y2 - r, x1, y1 + r, x1, y1,
+                                      smooth=True, fill=item['color'], outline="", tags=tag)
+
+        chrome = [item for item in layout['items'] if item['layer'] == 'chrome']
+        chrome_key = hashlib.sha1(repr(chrome).encode('utf-8')).hexdigest()
+        if chrome_key != self.preview_chrome_key:
+            canvas.delete("all")
+            canvas.create_rectangle(*point(0, 0), *point(layout['width'], page_height),
+                                    fill="white", outline="#adb5bd", tags="chrome")
+            for item in chrome:
+                draw(item, "chrome")
+            canvas.config(scrollregion=(0, 0, layout['width'] * scale + 2 * pad, page_height * scale + 2 * pad))
+            self.preview_chrome_key = chrome_key
+        else:
+            canvas.delete("sheet")
+
+        for item in layout['items']:
+            if item['layer'] != 'chrome':
+                draw(item, "sheet")
+
+    def format_problems_text(self, problems: List[Tuple[str, int]], config: Dict[str, Any]) -> str:
+        """Format a worksheet as plain text for copying and saving"""
+        header = config['header']
+        separator = "=" * 80
+        cell_width = max([16] + [len(problem[0]) + 2 for problem in problems])
+        rows, cols = self.sheet_grid(config)
+
+        lines = [separator, f"{header:^80}", separator, "",
+                 "Date: ________________    Name: ____________________________", "",
+                 "Write the answers as fast as you can, but make sure they are correct!", ""]
+        for row in range(rows):
+            cells = problems[row * cols:(row + 1) * cols]
+            lines.append("".join(f"{problem[0]:<{cell_width}}" for problem in cells).rstrip())
+        lines.extend(["", separator,
+                      f"Total problems: {len(problems)} | Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                      ""])
+        return "\n".join(lines)
+
     def copy_problems(self):
         """Copy problems to clipboard"""
         if not self.current_problems:
@@ -1252,7 +3259,7 @@ class MathWorksheetGenerator:
             return
 
         try:
-            content = self.preview_text.get(1.0, tk.END)
+            content = self.format_problems_text(self.current_problems, self.get_export_config())
             self.root.clipboard_clear()
             self.root.clipboard_append(content)
 
@@ -1291,7 +3298,7 @@ class MathWorksheetGenerator:
 
             if filepath:
                 with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(self.preview_text.get(1.0, tk.END))
+                    f.write(self.format_problems_text(self.current_problems, self.get_export_config()))
 
                 ttk.dialogs.Messagebox.show_info(
                     title=self.trans['msg_save_success'],
@@ -1322,14 +3329,20 @@ class MathWorksheetGenerator:
 
             filepath = filedialog.asksaveasfilename(
                 defaultextension=".pdf",
-                filetypes=[("PDF files", "*.pdf")],
+                filetypes=[("PDF files", "*.pdf"), ("HTML files", "*.html"), ("SVG files", "*.svg")],
                 initialfile=default_filename
             )
 
             if not filepath:
                 return
 
-            self.create_pdf(filepath, self.current_problems, self.get_current_config())
+            if filepath.lower().endswith(('.html', '.htm')):
+                self.create_html(filepath, self.current_problems, self.get_export_config())
+            elif filepath.lower().endswith('.svg'):
+                self.create_svg(filepath, self.current_problems, self.get_export_config())
+            else:
+                self.create_pdf(filepath, self.current_problems, self.get_export_config())
+            self.archive_current_worksheet()
 
             ttk.dialogs.Messagebox.show_info(
                 title=self.trans['msg_export_success'],
@@ -1344,120 +3357,591 @@ class MathWorksheetGenerator:
                 parent=self.root
             )
 
-    def create_pdf(self, filepath: str, problems: List[Tuple[str, int]], config: Dict[str, Any]):
-        """Create a precise A4 PDF file"""
-        c = canvas.Canvas(filepath, pagesize=A4)
+    def archive_current_worksheet(self):
+        """Record the current worksheet in the archive, if archiving is switched on"""
+        config = self.get_export_config()
+        if config.get('archive'):
+            row = self.archive_row(config, self.current_problems, self.current_lang, self.archive_class_var.get().strip())
+            self.archive_worksheets(ARCHIVE_PATH, [row])
+
+    def export_roster_pdf(self):
+        """Export one personalised worksheet per student of a class roster CSV"""
+        roster_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not roster_path:
+            return
+
+        try:
+            roster = self.load_roster(roster_path)
+            default_filename = os.path.splitext(os.path.basename(roster_path))[0] + ".pdf"
+            filepath = filedialog.asksaveasfilename(
+                defaultextension=".pdf",
+                filetypes=[("PDF files", "*.pdf")],
+                initialfile=default_filename
+            )
+            if not filepath:
+                return
+
+            self.create_roster_pdf(filepath, roster, self.get_current_config())
+            ttk.dialogs.Messagebox.show_info(
+                title=self.trans['msg_export_success'],
+                message=self.trans['msg_export_success'].format(filepath),
+                parent=self.root
+            )
+        except Exception as e:
+            ttk.dialogs.Messagebox.show_error(
+                title=self.trans['msg_export_fail'],
+                message=f"{self.trans['msg_export_fail']}: {str(e)}",
+                parent=self.root
+            )
+
+    def find_font_file(self, filename: str) -> str:
+        """Return the path of an installed font file, or an empty string"""
+        if not _font_file_index:
+            for font_dir in PDF_FONT_DIRS:
+                if not os.path.isdir(font_dir):
+                    continue
+                for dirpath, _, filenames in os.walk(font_dir):
+                    for name in filenames:
+                        _font_file_index.setdefault(name.lower(), os.path.join(dirpath, name))
+            _font_file_index.setdefault('', '')
+        return _font_file_index.get(filename.lower(), '')
+
+    def get_pdf_fonts(self, lang_code: str) -> Tuple[str, str, str]:
+        """Register the PDF fonts for a language once per process.
+
+        Returns (regular font, bold font, language of the PDF text). Falls back to
+        Helvetica and English text when no font for the language is installed.
+        """
+        load_reportlab()
+        if lang_code in _pdf_fonts_cache:
+            return _pdf_fonts_cache[lang_code]
+
+        fonts = ("Helvetica", "Helvetica-Bold", 'en' if lang_code in PDF_FONT_FILES else lang_code)
+
+        for filename, subfont_index in PDF_FONT_FILES.get(lang_code, []):
+            path = self.find_font_file(filename)
+            if not path:
+                continue
+            font_name = f"Worksheet-{lang_code}"
+            try:
+                pdfmetrics.registerFont(TTFont(font_name, path, subfontIndex=subfont_index))
+            except Exception:
+                # e.g. CFF-based OpenType collections that reportlab cannot embed
+                continue
+            fonts = (font_name, font_name, lang_code)
+            break
+        else:
+            if lang_code in PDF_CID_FONTS:
+                font_name = PDF_CID_FONTS[lang_code]
+                pdfmetrics.registerFont(UnicodeCIDFont(font_name))
+                fonts = (font_name, font_name, lang_code)
+
+        _pdf_fonts_cache[lang_code] = fonts
+        return fonts
+
+    def sheet_title(self, config: Dict[str, Any], trans: Dict[str, str]) -> str:
+        """The title of a worksheet: its header, or the translated default title if the header was left at the default"""
+        return trans['pdf_header'] if config['header'] == self.config['header'] else config['header']
+
+    def title_font(self, title: str, pdf_lang: str) -> str:
+        """A bold PDF font for a title in a script the fonts of pdf_lang cannot draw, or None to use those"""
+        for pattern, langs in TITLE_SCRIPTS:
+            if pattern.search(title):
+                if pdf_lang in langs:
+                    return None
+                for lang in langs:
+                    _, bold_font, font_lang = self.get_pdf_fonts(lang)
+                    if font_lang == lang:
+                        return bold_font
+                return None
+        return None
+
+    def word_language(self, lang_code: str) -> int:
+        """The config 'word_lang' for word problems in the language of the sheets. It does not
+        depend on the installed fonts; build_page_layout falls back when the font is missing."""
+        return WORD_LANGUAGES.index(lang_code)
+
+    def create_pdf(self, filepath: str, problems: List[Tuple[str, int]], config: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a precise A4 PDF file. With n_up > 1 the other slots of the sheet hold copies of the
+        worksheet with seeds derived from its own, so neighbours do not share problems or answers."""
+        n_up = config.get('n_up', 1)
+        pages = [(problems, config)]
+        for slot in range(1, n_up):
+            slot_config = dict(config, seed=self.derive_seed(config['seed'], 'slot', slot))
+            pages.append((self.generate_problems(slot_config), slot_config))
+        return self.create_multi_page_pdf(filepath, pages, compact=config.get('compact_pdf', False),
+                                          n_up=n_up, sheet_size=config.get('sheet_size', 'A4'),
+                                          deterministic=config.get('deterministic_pdf', False))
+
+    def create_multi_page_pdf(self, filepath: str, pages: List[Tuple[List[Tuple[str, int]], Dict[str, Any]]],
+                              compact: bool = False, n_up: int = 1, sheet_size: str = 'A4',
+                              deterministic: bool = False) -> Dict[str, Any]:
+        """Create a PDF file with one A4 worksheet page per (problems, config) and return its size.
+
+        compact: compress page streams, draw the page template once as a shared form object,
+        merge lines into one path per style and the text into text objects, and only link
+        the copyright notice on the first page.
+        n_up: impose 1, 2 (side by side, landscape) or 4 (2 x 2) worksheet pages, scaled to fit
+        and centred, on each sheet of sheet_size ('A4' or 'A3'). Every imposed worksheet page
+        becomes a form object on top of the shared page template form.
+        deterministic: write byte-identical files for identical pages (reportlab's invariant mode:
+        fixed creation date, or SOURCE_DATE_EPOCH, and a document ID hashed from the content);
+        the pages' configs should set 'deterministic_pdf' too, for the footer time.
+        """
+        load_reportlab()
+        if n_up not in (1, 2, 4):
+            raise ValueError(f"Worksheets per sheet must be 1, 2 or 4, not {n_up}")
+        if sheet_size not in ('A4', 'A3'):
+            raise ValueError(f"Unsupported sheet size: {sheet_size}")
+        sheet_width, sheet_height = A4 if sheet_size == 'A4' else A3
+        if n_up == 2:
+            sheet_width, sheet_height = sheet_height, sheet_width
+
+        c = canvas.Canvas(filepath, pagesize=(sheet_width, sheet_height), pageCompression=1 if compact else None,
+                          invariant=1 if deterministic else None)
+        forms = set()
+        if n_up == 1 and sheet_size == 'A4':
+            for page_index, (problems, config) in enumerate(pages):
+                layout = self.build_page_layout(problems, config)
+                if compact:
+                    self.draw_compact_page(c, layout, forms, with_links=page_index == 0)
+                else:
+                    self.draw_layout(c, layout)
+                c.showPage()
+        else:
+            cols, rows = {1: (1, 1), 2: (2, 1), 4: (2, 2)}[n_up]
+            cell_width, cell_height = sheet_width / cols, sheet_height / rows
+            scale = min(cell_width / A4[0], cell_height / A4[1])
+            for start in range(0, len(pages), n_up):
+                for slot, (problems, config) in enumerate(pages[start:start + n_up]):
+                    layout = self.build_page_layout(problems, config)
+                    chrome_name = self.define_chrome_form(c, layout, forms)
+                    page_name = f"Page{start + slot}"
+                    c.beginForm(page_name, 0, 0, layout['width'], layout['height'])
+                    c.doForm(chrome_name)
+                    self.draw_layout_compact(c, [item for item in layout['items'] if item['layer'] != 'chrome'])
+                    c.endForm()
+
+                    c.saveState()
+                    c.translate((slot % cols) * cell_width + (cell_width - A4[0] * scale) / 2,
+                                sheet_height - (slot // cols + 1) * cell_height + (cell_height - A4[1] * scale) / 2)
+                    c.scale(scale, scale)
+                    c.doForm(page_name)
+                    c.restoreState()
+                c.showPage()
+
+        # reportlab ASCII85-encodes compressed streams by default, which adds 25% for nothing
+        use_a85 = rl_config.useA85
+        if compact:
+            rl_config.useA85 = 0
+        try:
+            c.save()
+        finally:
+            rl_config.useA85 = use_a85
+
+        size = os.path.getsize(filepath)
+        return {'pages': len(pages), 'sheets': -(-len(pages) // n_up), 'bytes': size,
+                'bytes_per_page': size / max(len(pages), 1)}
+
+    def generate_batch_pages(self, configs: List[Dict[str, Any]],
+                             max_overlap: int = None) -> List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]:
+        """Generate the sheets of a batch, optionally so that no two share more than max_overlap problems.
+
+        A sheet that shares too many with an earlier one is redrawn with the next seed derived
+        from its own, so every sheet is still an ordinary worksheet that its ID regenerates.
+        """
+        if max_overlap is None:
+            return [(self.generate_problems(config), config) for config in configs]
+        if max_overlap < 0:
+            raise ValueError("The overlap cap must be at least 0")
+
+        overlap = OverlapIndex()
+        pages = []
+        for config in configs:
+            best = None
+            for attempt in range(OVERLAP_ATTEMPTS):
+                attempt_config = dict(config, seed=self.derive_seed(config['seed'], attempt)) if attempt else config
+                problems = self.generate_problems(attempt_config)
+                shared = overlap.max_shared(problems)
+                if best is None or shared < best[0]:
+                    best = (shared, problems, attempt_config)
+                if shared <= max_overlap:
+                    break
+            shared, problems, attempt_config = best
+            if shared > max_overlap:
+                raise ValueError(f"Sheet {len(pages) + 1} shares {shared} problems with another sheet at best "
+                                 f"(limit {max_overlap}); allow more overlap or widen the ranges")
+            overlap.add(problems)
+            pages.append((problems, attempt_config))
+        return pages
+
+    def load_roster(self, filepath: str) -> List[Dict[str, str]]:
+        """Load a class roster CSV with a 'name' column (other columns, e.g. 'class', are kept)"""
+        with open(filepath, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            fields = {field.strip().lower(): field for field in reader.fieldnames or []}
+            if 'name' not in fields:
+                raise ValueError(f"The roster {filepath} has no 'name' column")
+            students = [{key: (row[field] or '').strip() for key, field in fields.items()} for row in reader]
+        return [student for student in students if student['name']]
+
+    def build_roster_pages(self, roster: List[Dict[str, str]], config: Dict[str, Any], date: str = None,
+                           max_overlap: int = None) -> List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]:
+        """Generate one personalised worksheet per student, no two sharing more than max_overlap problems if set.
+
+        Each student's seed is derived from the worksheet seed and their name (plus a count for
+        repeated names), so re-running a roster with the same seed gives every student the same sheet.
+        """
+        base_seed = config.get('seed')
+        if base_seed in (None, ''):
+            base_seed = random.SystemRandom().randrange(1 << 32)
+        date = date or datetime.now().strftime('%Y-%m-%d')
+
+        page_configs = []
+        seen = Counter()
+        for student in roster:
+            seen[student['name']] += 1
+            suffix = f"#{seen[student['name']]}" if seen[student['name']] > 1 else ""
+            page_configs.append(dict(config, seed=self.derive_seed(base_seed, student['name'] + suffix),
+                                     student_name=student['name'], date=date))
+        return self.generate_batch_pages(page_configs, max_overlap)
+
+    def create_roster_pdf(self, filepath: str, roster: List[Dict[str, str]], config: Dict[str, Any],
+                          date: str = None, max_overlap: int = None) -> Dict[str, Any]:
+        """Create one PDF with a personalised worksheet per student. The page template is drawn
+        once as a shared form object and each page only adds its problems, name, date and ID."""
+        pages = self.build_roster_pages(roster, config, date, max_overlap)
+        return self.create_multi_page_pdf(filepath, pages, compact=True, n_up=config.get('n_up', 1),
+                                          sheet_size=config.get('sheet_size', 'A4'),
+                                          deterministic=config.get('deterministic_pdf', False))
+
+    def build_page_layout(self, problems: List[Tuple[str, int]], config: Dict[str, Any]) -> Dict[str, Any]:
+        """Compute the geometry of one worksheet page in PDF points (origin bottom-left).
+
+        All renderers (PDF, HTML/SVG) draw from this layout. Items are dicts with a 'kind'
+        (line, round_rect, text, link) and a 'layer': 'chrome' is the page template,
+        'problems' and 'footer' change with every worksheet, and 'student' holds the name
+        and date printed on roster worksheets (config 'student_name' and 'date').
+        """
+        font, bold_font, pdf_lang = self.get_pdf_fonts(self.current_lang)
+        pdf_trans = self.lang_dict[pdf_lang]
+        items = []
+
+        def line(x1, y1, x2, y2, color, line_width, layer='chrome'):
+            items.append({'kind': 'line', 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+                          'color': color, 'width': line_width, 'layer': layer})
+
+        def text(x, y, value, font_name, size, color, align='left', layer='chrome', bold=False):
+            items.append({'kind': 'text', 'x': x, 'y': y, 'text': value, 'font': font_name, 'size': size,
+                          'color': color, 'align': align, 'layer': layer, 'bold': bold})
+
         width, height = A4
 
         margin = 10 * mm
         content_width = width - 2 * margin
         content_height = height - 2 * margin
 
-        # Draw border
-        c.setStrokeColorRGB(0.5, 0.5, 0.5)
-        c.setLineWidth(1)
+        # Border
         pattern_size = 5 * mm
 
         for i in range(int(content_width / (pattern_size + 2))):
             x = margin + i * (pattern_size + 2)
-            c.line(x, height - margin, x + pattern_size, height - margin)
-            c.line(x, margin, x + pattern_size, margin)
+            line(x, height - margin, x + pattern_size, height - margin, '#808080', 1)
+            line(x, margin, x + pattern_size, margin, '#808080', 1)
 
         for i in range(int(content_height / (pattern_size + 2))):
             y = margin + i * (pattern_size + 2)
-            c.line(margin, y, margin, y + pattern_size)
-            c.line(width - margin, y, width - margin, y + pattern_size)
-
-        header_height = 40 * mm
-        title = config['header']
-
-        c.setFont("Helvetica-Bold", 24)
-        title_width = c.stringWidth(title, "Helvetica-Bold", 24)
-        title_x = margin + (content_width - title_width) / 2
+            line(margin, y, margin, y + pattern_size, '#808080', 1)
+            line(width - margin, y, width - margin, y + pattern_size, '#808080', 1)
+
+        # Title and header: the default title is translated, and a typed one gets a font that can
+        # draw it (e.g. a Chinese title on an English sheet)
+        title = self.sheet_title(config, pdf_trans)
+        title_font = self.title_font(title, pdf_lang) or bold_font
+        title_width = pdfmetrics.stringWidth(title, title_font, 24)
         title_y = height - margin - 40
 
-        c.setFillColor(lightgrey)
-        c.setStrokeColor(lightgrey)
-        c.roundRect(title_x - 10, title_y - 8, title_width + 20, 35, 8, fill=1, stroke=0)
-
-        c.setFillColor("black")
-        c.drawString(title_x, title_y, title)
+        items.append({'kind': 'round_rect', 'x': width / 2 - title_width / 2 - 10, 'y': title_y - 8,
+                      'w': title_width + 20, 'h': 35, 'r': 8, 'color': '#D3D3D3', 'layer': 'chrome'})
+        text(width / 2, title_y, title, title_font, 24, '#000000', align='center', bold=True)
 
-        c.setFont("Helvetica", 12)
-        subtitle = "Write the answers as fast as you can, but make sure they are correct!"
-        subtitle_width = c.stringWidth(subtitle, "Helvetica", 12)
-        subtitle_x = margin + (content_width - subtitle_width) / 2
-        c.drawString(subtitle_x, title_y - 30, subtitle)
+        text(width / 2, title_y - 30, pdf_trans['pdf_subtitle'], font, 12, '#000000', align='center')
 
-        c.setFont("Helvetica", 11)
         info_y = title_y - 50
 
-        c.drawString(margin + 20, info_y, "Date: ")
-        c.setLineWidth(1)
-        c.line(margin + 60, info_y - 2, margin + 160, info_y - 2)
+        date_label = pdf_trans['pdf_date']
+        date_line_x = margin + 20 + max(40, pdfmetrics.stringWidth(date_label, font, 11) + 5)
+        text(margin + 20, info_y, date_label, font, 11, '#000000')
+        line(date_line_x, info_y - 2, date_line_x + 100, info_y - 2, '#000000', 1)
 
         name_x = width - margin - 200
-        c.drawString(name_x, info_y, "Name: ")
-        c.line(name_x + 45, info_y - 2, width - margin - 20, info_y - 2)
+        name_label = pdf_trans['pdf_name']
+        text(name_x, info_y, name_label, font, 11, '#000000')
+        name_line_x = name_x + max(45, pdfmetrics.stringWidth(name_label, font, 11) + 5)
+        line(name_line_x, info_y - 2, width - margin - 20, info_y - 2, '#000000', 1)
 
+        if config.get('date'):
+            text(date_line_x + 4, info_y, config['date'], font, 11, '#000000', layer='student')
+        if config.get('student_name'):
+            text(name_line_x + 4, info_y, config['student_name'], font, 11, '#000000', layer='student')
+
+        # Problem grid
         problems_start_y = info_y - 25
         problems_height = problems_start_y - margin - 25
 
-        rows = 18
-        cols = 5
+        rows, cols = self.sheet_grid(config)
         row_height = problems_height / rows
         col_width = content_width / cols
 
-        c.setFont("Helvetica", 11)
-        c.setFillColor(black)
-
+        # Word problems are written in their own language, so they need its font. Without one they
+        # are regenerated in the language the fonts fall back to, and the footer ID is of that sheet
+        problem_font = "Helvetica"
+        if config['mode'] == 'word':
+            word_lang = WORD_LANGUAGES[config['word_lang']]
+            problem_font, _, font_lang = self.get_pdf_fonts(word_lang)
+            if font_lang != word_lang:
+                config = dict(config, word_lang=WORD_LANGUAGES.index(font_lang))
+                problems = self.generate_problems(config)
+
+        # Long problems shrink to fit their cell, down to 9 points, and then wrap onto two lines
+        cell_width = col_width - 12
         for row in range(rows):
             for col in range(cols):
                 idx = row * cols + col
                 if idx < len(problems):
-                    problem_text = problems[idx][0]
-
                     x = margin + col * col_width + 8
                     y = problems_start_y - row * row_height - 15
-
-                    c.drawString(x, y, problem_text)
-
-        c.setStrokeColor(gray)
-        c.setLineWidth(0.3)
+                    lines, size = fit_text(problems[idx][0], problem_font, 11, cell_width, 9)
+                    for line_index, line_text in enumerate(lines):
+                        text(x, y - line_index * size * 1.15, line_text, problem_font, size, '#000000', layer='problems')
 
         for col in range(1, cols):
             x = margin + col * col_width
-            c.line(x, problems_start_y + 5, x, problems_start_y - problems_height)
+            line(x, problems_start_y + 5, x, problems_start_y - problems_height, '#808080', 0.3)
 
         for row in range(6, rows, 6):
             y = problems_start_y - row * row_height + 2
-            c.line(margin, y, margin + content_width, y)
-
-        c.setFont("Helvetica", 8)
-        c.setFillColor(darkgray)
+            line(margin, y, margin + content_width, y, '#808080', 0.3)
 
+        # Footer
         footer_y = margin / 2
 
-        footer_left = self.trans['pdf_footer_left']
-        c.drawString(margin, footer_y, footer_left)
-
-        footer_right = f"{datetime.now().strftime('%Y-%m-%d %H:%M')}"
-        footer_right_width = c.stringWidth(footer_right, "Helvetica", 8)
-        c.drawString(width - margin - footer_right_width, footer_y, footer_right)
+        footer_left = pdf_trans['pdf_footer_left']
+        text(margin, footer_y, footer_left, font, 8, '#A9A9A9')
 
-        copyright_text = self.trans['pdf_copyright']
-        copyright_width = c.stringWidth(copyright_text, "Helvetica", 8)
+        copyright_text = pdf_trans['pdf_copyright']
+        copyright_width = text_width(copyright_text, "Helvetica", 8)
         copyright_x = margin + (content_width - copyright_width) / 2
-
-        c.drawString(copyright_x, footer_y, copyright_text)
-
-        url = "https://on99.co.uk"
-        url_rect = [copyright_x, footer_y - 2, copyright_x + copyright_width, footer_y + 10]
-        c.linkURL(url, url_rect, relative=1)
-
-        c.setFillColor(black)
-
-        c.save()
+        text(copyright_x, footer_y, copyright_text, "Helvetica", 8, '#A9A9A9')
+
+        # The time follows the left text and the ID sits at the right, each shrunk to stay clear of the copyright
+        timestamp = self.footer_timestamp(config)
+        if timestamp:
+            timestamp_x = margin + text_width(footer_left, font, 8) + 10
+            size = fit_font_size(timestamp, "Helvetica", 8, copyright_x - 10 - timestamp_x)
+            text(timestamp_x, footer_y, timestamp, "Helvetica", size, '#A9A9A9', layer='footer')
+        if config.get('seed') not in (None, ''):
+            worksheet_id = f"ID {self.encode_worksheet_id(config)}"
+            size = fit_font_size(worksheet_id, "Helvetica", 8, width - margin - copyright_x - copyright_width - 10)
+            text(width - margin, footer_y, worksheet_id, "Helvetica", size, '#A9A9A9', align='right', layer='footer')
+
+        items.append({'kind': 'link', 'url': "https://on99.co.uk",
+                      'rect': (copyright_x, footer_y - 2, copyright_x + copyright_width, footer_y + 10),
+                      'layer': 'chrome'})
+
+        return {'width': width, 'height': height, 'lang': pdf_lang, 'items': items}
+
+    def footer_timestamp(self, config: Dict[str, Any]) -> str:
+        """The generated-at time in the footer. Deterministic PDFs (config 'deterministic_pdf') print
+        the SOURCE_DATE_EPOCH time if set, else the sheet's date, else nothing"""
+        if not config.get('deterministic_pdf'):
+            return datetime.now().strftime('%Y-%m-%d %H:%M')
+        source_date = os.environ.get('SOURCE_DATE_EPOCH', '').strip()
+        if source_date:
+            return datetime.fromtimestamp(int(source_date), timezone.utc).strftime('%Y-%m-%d %H:%M')
+        return config.get('date') or ''
+
+    def draw_worksheet_page(self, c, problems: List[Tuple[str, int]], config: Dict[str, Any]):
+        """Draw one worksheet page on a reportlab canvas"""
+        self.draw_layout(c, self.build_page_layout(problems, config))
+
+    def draw_layout(self, c, layout: Dict[str, Any]):
+        """Draw a page layout on a reportlab canvas, only emitting state changes when they differ"""
+        state = {}
+
+        def set_state(key, value, apply):
+            if state.get(key) != value:
+                apply(value)
+                state[key] = value
+
+        for item in layout['items']:
+            kind = item['kind']
+            if kind == 'line':
+                set_state('stroke', item['color'], lambda v: c.setStrokeColor(HexColor(v)))
+                set_state('line_width', item['width'], c.setLineWidth)
+                c.line(item['x1'], item['y1'], item['x2'], item['y2'])
+            elif kind == 'text':
+                set_state('font', (item['font'], item['size']), lambda v: c.setFont(*v))
+                set_state('fill', item['color'], lambda v: c.setFillColor(HexColor(v)))
+                if item['align'] == 'center':
+                    c.drawCentredString(item['x'], item['y'], item['text'])
+                elif item['align'] == 'right':
+                    c.drawRightString(item['x'], item['y'], item['text'])
+                else:
+                    c.drawString(item['x'], item['y'], item['text'])
+            elif kind == 'round_rect':
+                set_state('fill', item['color'], lambda v: c.setFillColor(HexColor(v)))
+                c.roundRect(item['x'], item['y'], item['w'], item['h'], item['r'], fill=1, stroke=0)
+            elif kind == 'link':
+                c.linkURL(item['url'], item['rect'], relative=1)
+
+    def define_chrome_form(self, c, layout: Dict[str, Any], forms: set) -> str:
+        """Define the page template of a layout as a form object (once per distinct template)"""
+        chrome = [item for item in layout['items'] if item['layer'] == 'chrome' and item['kind'] != 'link']
+        form_name = "Chrome" + hashlib.sha1(repr(chrome).encode('utf-8')).hexdigest()[:12]
+        if form_name not in forms:
+            c.beginForm(form_name, 0, 0, layout['width'], layout['height'])
+            self.draw_layout_compact(c, chrome)
+            c.endForm()
+            forms.add(form_name)
+        return form_name
+
+    def draw_compact_page(self, c, layout: Dict[str, Any], forms: set, with_links: bool = True):
+        """Draw a page layout with its page template as a form object shared by identical pages"""
+        c.doForm(self.define_chrome_form(c, layout, forms))
+
+        self.draw_layout_compact(c, [
+            item for item in layout['items']
+            if item['layer'] != 'chrome' or (with_links and item['kind'] == 'link')
+        ])
+
+    def draw_layout_compact(self, c, items: List[Dict[str, Any]]):
+        """Draw layout items with a minimal operator stream: one path per line style, shared text objects"""
+        lines = {}
+        for item in items:
+            if item['kind'] == 'line':
+                lines.setdefault((item['color'], item['width']), []).append(item)
+
+        for (color, line_width), group in lines.items():
+            c.setStrokeColor(HexColor(color))
+            c.setLineWidth(line_width)
+            path = c.beginPath()
+            for item in group:
+                path.moveTo(item['x1'], item['y1'])
+                path.lineTo(item['x2'], item['y2'])
+            c.drawPath(path, stroke=1, fill=0)
+
+        text_object = None
+        state = {}
+        origin = (0, 0)
+        for item in items:
+            kind = item['kind']
+            if kind == 'text':
+                if text_object is None:
+                    text_object = c.beginText()
+                    state = {}
+                    origin = None
+                if state.get('font') != (item['font'], item['size']):
+                    text_object.setFont(item['font'], item['size'])
+                    state['font'] = (item['font'], item['size'])
+                if state.get('fill') != item['color']:
+                    text_object.setFillColor(HexColor(item['color']))
+                    state['fill'] = item['color']
+
+                x = item['x']
+                if item['align'] != 'left':
+                    item_width = text_width(item['text'], item['font'], item['size'])
+                    x -= item_width / 2 if item['align'] == 'center' else item_width
+                # Relative moves (Td) between cells are shorter and compress better than absolute Tm
+                if origin is None:
+                    text_object.setTextOrigin(x, item['y'])
+                else:
+                    # (moveCursor takes dy top-down)
+                    text_object.moveCursor(x - origin[0], origin[1] - item['y'])
+                origin = (x, item['y'])
+                text_object.textOut(item['text'])
+            elif kind == 'round_rect':
+                if text_object is not None:
+                    c.drawText(text_object)
+                    text_object = None
+                c.setFillColor(HexColor(item['color']))
+                c.roundRect(item['x'], item['y'], item['w'], item['h'], item['r'], fill=1, stroke=0)
+            elif kind == 'link':
+                c.linkURL(item['url'], item['rect'], relative=1)
+
+        if text_object is not None:
+            c.drawText(text_object)
+
+    def render_svg(self, layout: Dict[str, Any]) -> str:
+        """Render a page layout as a compact SVG document (same coordinates as the PDF, y axis flipped)"""
+        width, height = layout['width'], layout['height']
+
+        def num(value: float) -> str:
+            return f"{value:.2f}".rstrip('0').rstrip('.')
+
+        shapes = []
+        paths = {}
+        texts = []
+        classes = {}
+
+        for item in layout['items']:
+            kind = item['kind']
+            if kind == 'line':
+                # All lines of one stroke style become a single path
+                x1, y1, x2, y2 = item['x1'], height - item['y1'], item['x2'], height - item['y2']
+                if y1 == y2:
+                    segment = f"M{num(x1)} {num(y1)}H{num(x2)}"
+                elif x1 == x2:
+                    segment = f"M{num(x1)} {num(y1)}V{num(y2)}"
+                else:
+                    segment = f"M{num(x1)} {num(y1)}L{num(x2)} {num(y2)}"
+                paths.setdefault((item['color'], item['width']), []).append(segment)
+            elif kind == 'round_rect':
+                shapes.append(f'<rect x="{num(item["x"])}" y="{num(height - item["y"] - item["h"])}" '
+                              f'width="{num(item["w"])}" height="{num(item["h"])}" rx="{num(item["r"])}" '
+                              f'fill="{item["color"]}"/>')
+            elif kind == 'text':
+                style = (item['font'], item['size'], item['color'], item['bold'])
+                class_name = classes.setdefault(style, f"t{len(classes)}")
+                anchor = {'center': ' text-anchor="middle"', 'right': ' text-anchor="end"'}.get(item['align'], '')
+                texts.append(f'<text x="{num(item["x"])}" y="{num(height - item["y"])}" class="{class_name}"'
+                             f'{anchor}>{html.escape(item["text"], quote=False)}</text>')
+            elif kind == 'link':
+                x1, y1, x2, y2 = item['rect']
+                texts.append(f'<a href="{html.escape(item["url"])}"><rect x="{num(x1)}" y="{num(height - y2)}" '
+                             f'width="{num(x2 - x1)}" height="{num(y2 - y1)}" fill-opacity="0"/></a>')
+
+        css = []
+        for (font_name, size, color, bold), class_name in classes.items():
+            family = "Helvetica,Arial,sans-serif" if font_name.startswith("Helvetica") else "sans-serif"
+            css.append(f".{class_name}{{font:{'bold ' if bold else ''}{num(size)}px {family};fill:{color}}}")
+
+        lines = [f'<path d="{"".join(segments)}" stroke="{color}" stroke-width="{num(line_width)}" fill="none"/>'
+                 for (color, line_width), segments in paths.items()]
+
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {num(width)} {num(height)}" '
+                f'width="210mm" height="297mm"><style>{"".join(css)}</style>'
+                + "".join(shapes) + "".join(lines) + "".join(texts) + '</svg>')
+
+    def render_html(self, pages: List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]) -> str:
+        """Render worksheets as one HTML document with an inline SVG per page, printable as A4"""
+        layouts = [self.build_page_layout(problems, config) for problems, config in pages]
+        lang = layouts[0]['lang'] if layouts else 'en'
+        title = html.escape(self.sheet_title(pages[0][1], self.lang_dict[lang])) if pages else ''
+        return (f'<!DOCTYPE html><html lang="{lang}"><head><meta charset="utf-8"><title>{title}</title>'
+                '<style>@page{size:A4;margin:0}body{margin:0}'
+                'svg{display:block;margin:0 auto;background:#fff;break-after:page}</style></head><body>'
+                + "".join(self.render_svg(layout) for layout in layouts) + '</body></html>')
+
+    def create_html(self, filepath: str, problems: List[Tuple[str, int]], config: Dict[str, Any]):
+        """Create an HTML file of the worksheet, laid out exactly like the PDF"""
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(self.render_html([(problems, config)]))
+
+    def create_svg(self, filepath: str, problems: List[Tuple[str, int]], config: Dict[str, Any]):
+        """Create an SVG file of the worksheet, laid out exactly like the PDF"""
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(self.render_svg(self.build_page_layout(problems, config)))
 
     def print_worksheet(self):
         """Print the worksheet"""
@@ -1476,7 +3960,8 @@ class MathWorksheetGenerator:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             temp_pdf = os.path.join(temp_dir, f"speed_trials_print_{timestamp}.pdf")
 
-            self.create_pdf(temp_pdf, self.current_problems, self.get_current_config())
+            self.create_pdf(temp_pdf, self.current_problems, self.get_export_config())
+            self.archive_current_worksheet()
 
             system = platform.system()
 
@@ -1542,16 +4027,656 @@ class MathWorksheetGenerator:
                 parent=self.root
             )
 
+    def normalise_answer(self, value: Any) -> str:
+        """Normalise an answer for comparison ("012 " -> "12", "7 R 05" -> "7r5", "0,50" -> "0.5")"""
+        text = str(value).strip().replace(' ', '').lower()
+        try:
+            return str(int(text))
+        except ValueError:
+            pass
+        if 'r' in text or '/' in text:
+            # Remainders and fractions: each number on its own
+            return "".join(part if part in ('r', '/') else self.normalise_answer(part)
+                           for part in re.split(r'([r/])', text))
+        whole, point, part = text.replace(',', '.').partition('.')
+        sign, whole = ('-', whole[1:]) if whole.startswith('-') else ('', whole)
+        if point and (whole + part).isdigit():
+            part = part.rstrip('0')
+            return f"{sign}{int(whole or '0')}" + (f".{part}" if part else "")
+        return text
+
+    def build_answer_keys(self, worksheet_configs: Dict[str, Dict[str, Any]]) -> Dict[str, List[Tuple[str, str]]]:
+        """Regenerate the answer key of each worksheet: {worksheet id: [(fact, answer), ...]}
+
+        A config of None means the key is a worksheet ID, which is decoded instead.
+        """
+        answer_keys = {}
+        for worksheet_id, worksheet_config in worksheet_configs.items():
+            if worksheet_config is None:
+                config = self.decode_worksheet_id(worksheet_id)
+            else:
+                config = dict(self.config)
+                config.update(worksheet_config)
+            if config.get('seed') in (None, ''):
+                raise ValueError(f"Answer key '{worksheet_id}' has no seed, so its problems cannot be reproduced")
+            for key, default in self.config.items():
+                if isinstance(default, tuple):
+                    config[key] = tuple(config[key])
+
+            answer_keys[worksheet_id] = [
+                (problem_text.rstrip(' =').strip(), self.normalise_answer(answer))
+                for problem_text, answer in self.generate_problems(config)
+            ]
+        return answer_keys
+
+    def load_answer_keys(self, filepath: str) -> Dict[str, List[Tuple[str, str]]]:
+        """Load worksheet configurations from a JSON file ({worksheet id: config} or a list of worksheet IDs)
+        and build their answer keys"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            worksheet_configs = json.load(f)
+        if isinstance(worksheet_configs, list):
+            worksheet_configs = dict.fromkeys(worksheet_configs)
+        return self.build_answer_keys(worksheet_configs)
+
+    def load_submissions(self, filepath: str) -> List[Tuple[str, str, int, str]]:
+        """Load student answers from CSV or JSON rows of (student, worksheet_id, cell, answer)"""
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            if filepath.lower().endswith('.json'):
+                rows = json.load(f)
+            else:
+                rows = csv.DictReader(f)
+            submissions = []
+            for number, row in enumerate(rows, 1):
+                missing = [column for column in SUBMISSION_COLUMNS if column not in row]
+                if missing:
+                    raise ValueError(f"Row {number} of {filepath} has no {', '.join(repr(c) for c in missing)} "
+                                     f"(needs {', '.join(SUBMISSION_COLUMNS)})")
+                try:
+                    cell = int(row['cell'])
+                except (TypeError, ValueError):
+                    raise ValueError(f"Row {number} of {filepath} has a cell that is not a number: {row['cell']!r}")
+                submissions.append((row['student'], row['worksheet_id'], cell, str(row['answer'])))
+            return submissions
+
+    def mark_submissions(self, answer_keys: Dict[str, List[Tuple[str, str]]],
+                         submissions: List[Tuple[str, str, int, str]]) -> Dict[str, Any]:
+        """Mark all submissions at once against the answer keys.
+
+        The answer keys are flattened into one array indexed by (worksheet offset + cell),
+        so marking is a single lookup and element-wise comparison over whole columns.
+        """
+        offsets = {}
+        expected = []
+        facts = []
+        for worksheet_id, key in answer_keys.items():
+            offsets[worksheet_id] = len(expected)
+            expected.extend(answer for _, answer in key)
+            facts.extend(fact for fact, _ in key)
+
+        sizes = {worksheet_id: len(key) for worksheet_id, key in answer_keys.items()}
+        matched = [row for row in submissions if 0 <= row[2] < sizes.get(row[1], 0)]
+
+        students = [row[0] for row in matched]
+        index = [offsets[row[1]] + row[2] for row in matched]
+        given = map(self.normalise_answer, (row[3] for row in matched))
+        correct = list(map(operator.eq, map(expected.__getitem__, index), given))
+        fact_names = list(map(facts.__getitem__, index))
+
+        student_total = Counter(students)
+        student_correct = Counter(compress(students, correct))
+        fact_total = Counter(fact_names)
+        fact_correct = Counter(compress(fact_names, correct))
+
+        def summarise(total: Counter, right: Counter) -> Dict[str, Dict[str, Any]]:
+            return {
+                key: {'correct': right[key], 'total': count, 'accuracy': right[key] / count}
+                for key, count in sorted(total.items())
+            }
+
+        return {
+            'submissions': len(submissions),
+            'marked': len(matched),
+            'unmatched': len(submissions) - len(matched),
+            'correct': sum(correct),
+            'students': summarise(student_total, student_correct),
+            'facts': summarise(fact_total, fact_correct)
+        }
+
+    def write_marking_report(self, results: Dict[str, Any], filepath: str):
+        """Write marking results as JSON, or as CSV rows of (kind, key, correct, total, accuracy)"""
+        with open(filepath, 'w', encoding='utf-8', newline='') as f:
+            if filepath.lower().endswith('.json'):
+                json.dump(results, f, ensure_ascii=False, indent=2)
+                return
+
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'key', 'correct', 'total', 'accuracy'])
+            for kind in ('students', 'facts'):
+                for key, row in results[kind].items():
+                    writer.writerow([kind[:-1], key, row['correct'], row['total'], f"{row['accuracy']:.3f}"])
+
+    def archive_row(self, config: Dict[str, Any], problems: List[Tuple[str, Any]], lang: str,
+                    class_name: str = '', created_at: str = None) -> Tuple[Any, ...]:
+        """Build one archive row: IDs, problem config hash, lookup columns and the zlib-compressed problems"""
+        settings = {key: value for key, value in config.items() if key != 'seed'}
+        settings_json = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+        problems_text = "\n".join(f"{problem_text}\t{answer}" for problem_text, answer in problems)
+        return (
+            self.encode_worksheet_id(config),
+            self.config_hash(config),
+            config['mode'],
+            self.resolve_seed(config['seed']),
+            lang,
+            class_name,
+            created_at or datetime.now().isoformat(timespec='seconds'),
+            settings_json,
+            zlib.compress(problems_text.encode('utf-8'), 9)
+        )
+
+    def open_archive(self, filepath: str):
+        """Open (and create if needed) the SQLite worksheet archive"""
+        connection = sqlite3.connect(filepath)
+        connection.executescript(ARCHIVE_SCHEMA)
+        return connection
+
+    def archive_worksheets(self, filepath: str, rows: List[Tuple[Any, ...]]) -> int:
+        """Insert archive rows (see archive_row) in one transaction; returns the number inserted"""
+        connection = self.open_archive(filepath)
+        try:
+            with connection:
+                connection.executemany(ARCHIVE_INSERT, rows)
+        finally:
+            connection.close()
+        return len(rows)
+
+    def query_archive(self, filepath: str, worksheet_id: str = None, class_name: str = None, mode: str = None,
+                      since: str = None, until: str = None, with_problems: bool = False) -> List[Dict[str, Any]]:
+        """Look up archived worksheets, newest first. since/until are ISO dates or timestamps (until inclusive)"""
+        conditions, params = [], []
+        if worksheet_id:
+            conditions.append("worksheet_id = ?")
+            params.append(self.encode_worksheet_id(self.decode_worksheet_id(worksheet_id)))
+        if class_name:
+            conditions.append("class_name = ?")
+            params.append(class_name)
+        if mode:
+            conditions.append("mode = ?")
+            params.append(mode)
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until:
+            # '~' sorts after every character of an ISO timestamp, so a bare date includes that whole day
+            conditions.append("created_at < ?")
+            params.append(until + "~")
+
+        columns = "worksheet_id, config_hash, mode, seed, lang, class_name, created_at, config"
+        if with_problems:
+            columns += ", problems"
+        query = f"SELECT {columns} FROM worksheets"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC, rowid DESC"
+
+        connection = self.open_archive(filepath)
+        try:
+            connection.row_factory = sqlite3.Row
+            results = [dict(row) for row in connection.execute(query, params)]
+        finally:
+            connection.close()
+
+        for result in results:
+            result['config'] = json.loads(result['config'])
+            if with_problems:
+                lines = zlib.decompress(result['problems']).decode('utf-8').split("\n")
+                result['problems'] = [tuple(line.split("\t", 1)) for line in lines if line]
+        return results
+
+    def expand_job_spec(self, spec: Dict[str, Any], base_dir: str = '',
+                        derive_seeds: bool = True) -> List[Dict[str, Any]]:
+        """Expand a curriculum job spec into tasks, one PDF per job (week and class) with one page per copy.
+
+        Spec format (JSON):
+            {"output_dir": "term1", "seed": 2025, "lang": "en", "compact_pdf": true, "defaults": {"no_negative": true},
+             "jobs": [{"week": 1, "class": "4A", "sample": "B", "copies": 30, "max_overlap": 10},
+                      {"week": 1, "class": "4B", "config": {"mode": "add", "add_range": [0, 20]}, "copies": 28}]}
+
+        "max_overlap" (for the whole spec or one job) caps the problems any two copies of a job share.
+        "deterministic_pdf": true writes byte-identical PDFs for identical tasks (the footer time is
+        then SOURCE_DATE_EPOCH, or left out). Word problems ("mode": "word") are written in "lang"
+        unless a config sets "word_lang". With derive_seeds=False the tasks get no seeds or hash,
+        for callers that only need the task IDs and settings.
+        """
+        self.check_job_spec(spec)
+        output_dir = os.path.join(base_dir, spec.get('output_dir', 'worksheets'))
+        batch_seed = spec.get('seed', 0)
+        tasks = []
+        task_ids = set()
+
+        for job in spec['jobs']:
+            config = dict(self.config)
+            config.update(spec.get('defaults', {}))
+            if 'sample' in job:
+                if job['sample'] not in self.samples:
+                    raise ValueError(f"Unknown sample '{job['sample']}' in job spec")
+                config.update({k: v for k, v in self.samples[job['sample']].items() if k != 'name_key'})
+                label = f"sample_{job['sample']}"
+            else:
+                label = job.get('name', 'custom')
+            config.update(job.get('config', {}))
+            if (config['mode'] == 'word' and 'word_lang' not in spec.get('defaults', {})
+                    and 'word_lang' not in job.get('config', {})):
+                # Word problems are written in the sheet's language unless the spec says otherwise
+                config['word_lang'] = self.word_language(spec.get('lang', self.current_lang))
+            if 'header' in job:
+                config['header'] = job['header']
+            for key, default in self.config.items():
+                if isinstance(default, tuple):
+                    config[key] = tuple(config[key])
+            config['seed'] = None
+
+            week = job.get('week', 0)
+            week_label = f"week{week:02d}" if isinstance(week, int) else f"week{week}"
+            class_name = "".join(c for c in str(job.get('class', 'all')) if c.isalnum() or c in ('-', '_'))
+            task_id = f"{week_label}-{class_name}-{label}"
+            if task_id in task_ids:
+                task_id = f"{task_id}-{len(tasks)}"
+            task_ids.add(task_id)
+
+            task = {
+                'task_id': task_id,
+                'output': os.path.join(output_dir, week_label, f"{task_id}.pdf"),
+                'lang': spec.get('lang', self.current_lang),
+                'compact': spec.get('compact_pdf', False),
+                'config': config,
+                'seeds': [self.derive_seed(batch_seed, task_id, copy) for copy in range(job.get('copies', 1))]
+                if derive_seeds else []
+            }
+            # Only set when used, so existing tasks keep their hash
+            if spec.get('n_up', 1) != 1:
+                task['n_up'] = spec['n_up']
+            if spec.get('sheet_size', 'A4') != 'A4':
+                task['sheet_size'] = spec['sheet_size']
+            if spec.get('deterministic_pdf'):
+                task['deterministic'] = True
+            max_overlap = job.get('max_overlap', spec.get('max_overlap'))
+            if max_overlap is not None:
+                task['max_overlap'] = max_overlap
+            if derive_seeds:
+                task['hash'] = hashlib.sha256(json.dumps(task, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+            # Already part of task_id and the seeds, so left out of the hash
+            task['class'] = class_name
+            task['copies'] = job.get('copies', 1)
+            tasks.append(task)
+
+        return tasks
+
+    def check_job_spec(self, spec: Any):
+        """Raise ValueError naming the first part of a job spec that does not have the expected shape"""
+        if not isinstance(spec, dict):
+            raise ValueError("A job spec must be a JSON object")
+        if not isinstance(spec.get('jobs'), list) or not spec['jobs']:
+            raise ValueError("A job spec needs a non-empty \"jobs\" list")
+        if not isinstance(spec.get('defaults', {}), dict):
+            raise ValueError("\"defaults\" in a job spec must be an object of settings")
+        if spec.get('lang', self.current_lang) not in self.lang_dict:
+            raise ValueError(f"Unknown language '{spec['lang']}' in job spec")
+        for number, job in enumerate(spec['jobs'], 1):
+            if not isinstance(job, dict):
+                raise ValueError(f"Job {number} of the job spec is not an object")
+            if not isinstance(job.get('config', {}), dict):
+                raise ValueError(f"\"config\" of job {number} must be an object of settings")
+            settings = dict(spec.get('defaults', {}), **job.get('config', {}))
+            if 'sample' in job:
+                if job['sample'] not in self.samples:
+                    raise ValueError(f"Unknown sample '{job['sample']}' in job {number}")
+                settings.setdefault('mode', self.samples[job['sample']].get('mode', self.config['mode']))
+            if settings.get('mode', self.config['mode']) not in PROBLEM_TYPES:
+                raise ValueError(f"Unknown problem type '{settings['mode']}' in job {number}")
+            for key, value in settings.items():
+                if isinstance(self.config.get(key), tuple) and not (isinstance(value, (list, tuple)) and len(value) == 2):
+                    raise ValueError(f"\"{key}\" of job {number} must be a [min, max] pair")
+            if not isinstance(job.get('copies', 1), int) or job.get('copies', 1) < 1:
+                raise ValueError(f"\"copies\" of job {number} must be a whole number of at least 1")
+
+    def regenerate_job_sheet(self, filepath: str, task_id: str, copy: int) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+        """Regenerate one copy of a job-spec task from its derived seed, without generating the
+        copies before it (copies of a task with max_overlap depend on each other, so those are
+        regenerated from the worksheet IDs in the manifest instead)"""
+        with open(filepath, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        tasks = {task['task_id']: task for task in self.expand_job_spec(spec, derive_seeds=False)}
+        if task_id not in tasks:
+            raise ValueError(f"Unknown task '{task_id}' in {filepath}")
+        task = tasks[task_id]
+        if not 0 <= copy < task['copies']:
+            raise ValueError(f"Task '{task_id}' has copies 0 to {task['copies'] - 1}")
+        if 'max_overlap' in task:
+            raise ValueError(f"The copies of '{task_id}' are capped by max_overlap; "
+                             f"regenerate them from the worksheet IDs in the manifest")
+        # The same derivation expand_job_spec uses, for this copy only
+        config = dict(task['config'], seed=self.derive_seed(spec.get('seed', 0), task_id, copy))
+        return config, self.generate_problems(config)
+
+    def write_manifest(self, filepath: str, manifest: Dict[str, Any]):
+        """Write a checkpoint manifest atomically, so an interrupted run never leaves it half-written"""
+        temp_path = filepath + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, filepath)
+
+    def run_job_spec(self, filepath: str, workers: int = None) -> Dict[str, Any]:
+        """Render every task of a job spec in parallel, skipping tasks already recorded in the manifest.
+
+        Relative output directories are resolved against the spec file's folder. The manifest
+        (manifest.json in the output directory) is updated after each finished task, so an
+        interrupted run resumes where it stopped. With "archive": "<file>.sqlite3" in the spec,
+        every rendered worksheet is also recorded in that archive, one transaction per task.
+        """
+        with open(filepath, 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        tasks = self.expand_job_spec(spec, os.path.dirname(os.path.abspath(filepath)))
+
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), spec.get('output_dir', 'worksheets'))
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_path = os.path.join(output_dir, 'manifest.json')
+        manifest = {'tasks': {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        finished = manifest['tasks']
+
+        pending = [
+            task for task in tasks
+            if finished.get(task['task_id'], {}).get('hash') != task['hash'] or not os.path.exists(task['output'])
+        ]
+        failed = {}
+        archive = None
+        if spec.get('archive') and pending:
+            archive = self.open_archive(os.path.join(os.path.dirname(os.path.abspath(filepath)), spec['archive']))
+
+        if pending:
+            # Imported here: only batch runs need it, and it slows down opening the window
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=workers or spec.get('workers')) as pool:
+                futures = {pool.submit(render_job_task, task, archive is not None): task for task in pending}
+                for future in as_completed(futures):
+                    task = futures[future]
+                    try:
+                        finished[task['task_id']] = future.result()
+                    except Exception as e:
+                        failed[task['task_id']] = str(e)
+                        continue
+                    archive_rows = finished[task['task_id']].pop('archive_rows', None)
+                    if archive is not None:
+                        with archive:
+                            archive.executemany(ARCHIVE_INSERT, archive_rows)
+                    self.write_manifest(manifest_path, manifest)
+        if archive is not None:
+            archive.close()
+
+        pages = sum(finished[task['task_id']]['pages'] for task in tasks if task['task_id'] in finished)
+        size = sum(finished[task['task_id']]['bytes'] for task in tasks if task['task_id'] in finished)
+        return {
+            'tasks': len(tasks),
+            'pages': pages,
+            'bytes_per_page': size / max(pages, 1),
+            'skipped': len(tasks) - len(pending),
+            'rendered': len(pending) - len(failed),
+            'failed': failed,
+            'manifest': manifest_path
+        }
+
     def run(self):
         """Run the application"""
         self.root.place_window_center()
         self.root.mainloop()
 
 
+# Headless generator of a pipeline worker process, created on its first task
+_worker_app = None
+
+
+def get_worker_app() -> 'MathWorksheetGenerator':
+    """Get the headless generator of this worker process"""
+    global _worker_app
+    if _worker_app is None:
+        _worker_app = MathWorksheetGenerator(headless=True)
+    return _worker_app
+
+
+def render_job_task(task: Dict[str, Any], archive: bool = False) -> Dict[str, Any]:
+    """Render one job-spec task to its PDF (runs in a worker process) and return its manifest entry,
+    plus its archive rows when archive is set"""
+    app = get_worker_app()
+    app.current_lang = task['lang']
+    app.trans = app.lang_dict[task['lang']]
+
+    deterministic = task.get('deterministic', False)
+    configs = [dict(task['config'], seed=seed, deterministic_pdf=deterministic) for seed in task['seeds']]
+    pages = app.generate_batch_pages(configs, task.get('max_overlap'))
+
+    os.makedirs(os.path.dirname(task['output']), exist_ok=True)
+    temp_path = task['output'] + '.part'
+    stats = app.create_multi_page_pdf(temp_path, pages, compact=task['compact'], n_up=task.get('n_up', 1),
+                                      sheet_size=task.get('sheet_size', 'A4'), deterministic=deterministic)
+    os.replace(temp_path, task['output'])
+
+    entry = {
+        'hash': task['hash'],
+        'output': task['output'],
+        'pages': stats['pages'],
+        'bytes': stats['bytes'],
+        'bytes_per_page': round(stats['bytes_per_page']),
+        'worksheet_ids': [app.encode_worksheet_id(config) for _, config in pages]
+    }
+    if archive:
+        created_at = datetime.now().isoformat(timespec='seconds')
+        entry['archive_rows'] = [app.archive_row(config, problems, task['lang'], task.get('class', ''), created_at)
+                                 for problems, config in pages]
+    return entry
+
+
+def verify_task(task: Tuple[int, int, List[str]]) -> Dict[str, Any]:
+    """Generate and check the sheets of one verify-sweep config (runs in a worker process)"""
+    config_seed, seeds, modes = task
+    app = get_worker_app()
+    base_config = app.random_verify_config(config_seed, modes)
+    problems = 0
+    failures = []
+    for seed in range(config_seed * seeds, (config_seed + 1) * seeds):
+        config = dict(base_config, seed=seed)
+        sheet = app.generate_problems(config)
+        problems += len(sheet)
+        errors = app.verify_problems(sheet, config)
+        if errors:
+            failures.append({'worksheet_id': app.encode_worksheet_id(config), 'mode': config['mode'],
+                             'errors': len(errors), 'first_error': errors[0]})
+    return {'sheets': seeds, 'problems': problems, 'failures': failures}
+
+
+def run_command_line(argv: List[str]):
+    """Run a batch tool from the command line without opening the window"""
+    parser = argparse.ArgumentParser(prog="maths_worksheet_generator",
+                                     description="Math Worksheet Generator batch tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    mark_parser = subparsers.add_parser('mark', help="Mark student answers against regenerated answer keys")
+    mark_parser.add_argument('--keys', help="JSON file of {worksheet id: worksheet config} or a list of IDs "
+                                            "(default: decode the worksheet IDs in the submissions)")
+    mark_parser.add_argument('--submissions', required=True,
+                             help="CSV or JSON rows of student, worksheet_id, cell, answer")
+    mark_parser.add_argument('--out', required=True, help="Report file (.csv or .json)")
+
+    roster_parser = subparsers.add_parser('roster', help="One personalised worksheet per student of a roster CSV")
+    roster_parser.add_argument('roster', help="CSV file with a 'name' column")
+    roster_parser.add_argument('--out', required=True, help="PDF file")
+    roster_parser.add_argument('--sample', help="Use a default sample's settings (A-E)")
+    roster_parser.add_argument('--config', help="JSON object of settings, e.g. '{\"mode\": \"mul\"}'")
+    roster_parser.add_argument('--seed', help="Worksheet seed the students' seeds are derived from "
+                                              "(default: random)")
+    roster_parser.add_argument('--date', help="Date printed on every sheet (default: today)")
+    roster_parser.add_argument('--lang', help="Language of the sheet text")
+    roster_parser.add_argument('--deterministic', action='store_true',
+                               help="Byte-identical output for identical inputs (give --seed and --date too)")
+    roster_parser.add_argument('--max-overlap', type=int,
+                               help="Most problems any two students' sheets may share (default: no limit)")
+
+    regenerate_parser = subparsers.add_parser('regenerate', help="Print the problems and answers of a worksheet ID")
+    regenerate_parser.add_argument('worksheet_id', nargs='?', help="Worksheet ID (or use --spec, --task and --copy)")
+    regenerate_parser.add_argument('--spec', help="Job spec of a batch to take one sheet from")
+    regenerate_parser.add_argument('--task', help="Task ID in the job spec, e.g. week01-4A-sample_B")
+    regenerate_parser.add_argument('--copy', type=int, default=0, help="Copy number within the task (default: 0)")
+    regenerate_parser.add_argument('--pdf', help="Also write the worksheet to this PDF file")
+    regenerate_parser.add_argument('--html', help="Also write the worksheet to this HTML file")
+    regenerate_parser.add_argument('--deterministic', action='store_true',
+                                   help="Write a byte-identical PDF each time (footer time: SOURCE_DATE_EPOCH or none)")
+
+    jobs_parser = subparsers.add_parser('run-jobs', help="Render a curriculum job spec (resumes interrupted runs)")
+    jobs_parser.add_argument('spec', help="JSON job spec")
+    jobs_parser.add_argument('--workers', type=int, help="Number of worker processes (default: CPU count)")
+
+    archive_parser = subparsers.add_parser('archive', help="List archived worksheets, newest first")
+    archive_parser.add_argument('--db', default=ARCHIVE_PATH, help=f"Archive file (default: {ARCHIVE_PATH})")
+    archive_parser.add_argument('--id', dest='worksheet_id', help="Worksheet ID")
+    archive_parser.add_argument('--class', dest='class_name', help="Class name")
+    archive_parser.add_argument('--mode', help="Problem type")
+    archive_parser.add_argument('--since', help="First date (YYYY-MM-DD)")
+    archive_parser.add_argument('--until', help="Last date (YYYY-MM-DD)")
+
+    bank_parser = subparsers.add_parser('build-bank', help="Precompute a problem bank file that worksheets with "
+                                                          "\"bank\": <size> sample from")
+    bank_parser.add_argument('--mode', help="Problem type")
+    bank_parser.add_argument('--sample', help="Start from a default sample's settings (A-E)")
+    bank_parser.add_argument('--config', help="JSON object of settings, e.g. '{\"mul_range\": [2, 12]}'")
+    bank_parser.add_argument('--size', type=int, default=100000, help="Number of problems (default: 100000)")
+    bank_parser.add_argument('--dir', help=f"Bank directory (default: {BANK_DIR})")
+
+    verify_parser = subparsers.add_parser('verify', help="Generate sheets with random settings and check "
+                                                         "every problem exactly")
+    verify_parser.add_argument('--configs', type=int, default=1000, help="Number of random configs (default: 1000)")
+    verify_parser.add_argument('--seeds', type=int, default=20, help="Sheets (seeds) per config (default: 20)")
+    verify_parser.add_argument('--first-config', type=int, default=0,
+                               help="Number of the first config, to continue an earlier sweep (default: 0)")
+    verify_parser.add_argument('--mode', action='append', help="Problem type to check (repeatable; default: all)")
+    verify_parser.add_argument('--workers', type=int, help="Number of worker processes (default: CPU count)")
+
+    args = parser.parse_args(argv)
+    app = MathWorksheetGenerator(headless=True)
+
+    if args.command == 'mark':
+        submissions = app.load_submissions(args.submissions)
+        if args.keys:
+            answer_keys = app.load_answer_keys(args.keys)
+        else:
+            answer_keys = app.build_answer_keys(dict.fromkeys(row[1] for row in submissions))
+        results = app.mark_submissions(answer_keys, submissions)
+        app.write_marking_report(results, args.out)
+        print(f"Marked {results['marked']} of {results['submissions']} answers "
+              f"({results['correct']} correct, {results['unmatched']} unmatched). Report: {args.out}")
+
+    elif args.command == 'roster':
+        config = dict(app.config)
+        if args.sample:
+            if args.sample not in app.samples:
+                raise ValueError(f"Unknown sample '{args.sample}'")
+            config.update({k: v for k, v in app.samples[args.sample].items() if k != 'name_key'})
+        overrides = json.loads(args.config) if args.config else {}
+        config.update(overrides)
+        config['seed'] = args.seed
+        if args.deterministic:
+            config['deterministic_pdf'] = True
+        if args.lang:
+            if args.lang not in app.lang_dict:
+                raise ValueError(f"Unknown language '{args.lang}'")
+            app.current_lang = args.lang
+            app.trans = app.lang_dict[args.lang]
+        if config['mode'] == 'word' and 'word_lang' not in overrides:
+            config['word_lang'] = app.word_language(app.current_lang)
+        roster = app.load_roster(args.roster)
+        stats = app.create_roster_pdf(args.out, roster, config, args.date, args.max_overlap)
+        print(f"Wrote {stats['pages']} personalised worksheets ({stats['bytes_per_page']:.0f} bytes/page) to {args.out}")
+
+    elif args.command == 'regenerate':
+        if args.spec:
+            if not args.task:
+                raise ValueError("--spec needs --task")
+            config, problems = app.regenerate_job_sheet(args.spec, args.task, args.copy)
+            print(f"Worksheet ID: {app.encode_worksheet_id(config)}")
+        elif args.worksheet_id:
+            config, problems = app.regenerate_worksheet(args.worksheet_id)
+        else:
+            raise ValueError("Give a worksheet ID or --spec and --task")
+        for idx, (problem_text, answer) in enumerate(problems):
+            print(f"{idx:3d}  {problem_text:<24}{answer}")
+        if args.pdf:
+            app.create_pdf(args.pdf, problems, dict(config, deterministic_pdf=args.deterministic))
+        if args.html:
+            app.create_html(args.html, problems, config)
+
+    elif args.command == 'run-jobs':
+        summary = app.run_job_spec(args.spec, args.workers)
+        print(f"{summary['rendered']} rendered, {summary['skipped']} already done, "
+              f"{len(summary['failed'])} failed of {summary['tasks']} tasks "
+              f"({summary['pages']} pages, {summary['bytes_per_page']:.0f} bytes/page). Manifest: {summary['manifest']}")
+        for task_id, error in summary['failed'].items():
+            print(f"  {task_id}: {error}")
+        if summary['failed']:
+            sys.exit(1)
+
+    elif args.command == 'build-bank':
+        config = dict(app.config)
+        if args.sample:
+            if args.sample not in app.samples:
+                raise ValueError(f"Unknown sample '{args.sample}'")
+            config.update({k: v for k, v in app.samples[args.sample].items() if k != 'name_key'})
+        if args.config:
+            config.update(json.loads(args.config))
+        if args.mode:
+            config['mode'] = args.mode
+        if config['mode'] not in PROBLEM_TYPES:
+            raise ValueError(f"Unknown problem type: {config['mode']}")
+        if args.size < 1:
+            raise ValueError("The bank size must be at least 1")
+        config['bank'] = args.size
+        stats = app.build_problem_bank(config, args.dir)
+        print(f"Wrote {stats['problems']} '{config['mode']}' problems ({stats['record_size']} bytes each) "
+              f"to {stats['path']}. Worksheets with these settings and \"bank\": {args.size} sample from it.")
+
+    elif args.command == 'verify':
+        started = time.perf_counter()
+        summary = app.verify_sweep(args.configs, args.seeds, args.first_config, args.mode, args.workers)
+        elapsed = time.perf_counter() - started
+        print(f"Checked {summary['problems']} problems on {summary['sheets']} sheets in {elapsed:.1f} s "
+              f"({summary['problems'] / max(elapsed, 1e-9):.0f} problems/s): {len(summary['failures'])} failing sheets")
+        for failure in summary['failures']:
+            print(f"  {failure['worksheet_id']}  {failure['mode']:<14}{failure['errors']:3d} errors, "
+                  f"first: {failure['first_error']}")
+        if summary['failures']:
+            sys.exit(1)
+
+    elif args.command == 'archive':
+        rows = app.query_archive(args.db, args.worksheet_id, args.class_name, args.mode, args.since, args.until)
+        for row in rows:
+            print(f"{row['created_at']}  {row['class_name'] or '-':<8}{row['mode']:<12}{row['lang']:<7}{row['worksheet_id']}")
+        print(f"{len(rows)} worksheets")
+
+
 def main():
     """Main function"""
+    multiprocessing.freeze_support()
+    startup_timing = '--startup-timing' in sys.argv
+    argv = [arg for arg in sys.argv[1:] if arg != '--startup-timing']
+    if argv:
+        try:
+            run_command_line(argv)
+        except (ValueError, OSError, ImportError) as e:
+            print(f"Error: {str(e)}")
+            sys.exit(1)
+        return
+
     try:
-        app = MathWorksheetGenerator()
+        app = MathWorksheetGenerator(startup_timing=startup_timing)
         app.run()
     except Exception as e:
         print(f"Program startup failed: {str(e)}")
@@ -0,0 +1,974 @@
+"""Tests of the batch tools of maths_worksheet_generator (run with: python -m pytest)"""
+import json
+import operator
+import os
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+import maths_worksheet_generator as mwg
+
+
+@pytest.fixture(scope='module')
+def app():
+    return mwg.MathWorksheetGenerator(headless=True)
+
+
+def sheet_app(lang):
+    """A headless generator whose sheets are in another language, as the CLI sets one up"""
+    sheet_app = mwg.MathWorksheetGenerator(headless=True)
+    sheet_app.current_lang = lang
+    sheet_app.trans = sheet_app.lang_dict[lang]
+    return sheet_app
+
+
+def write_spec(folder, spec):
+    path = folder / 'spec.json'
+    path.write_text(json.dumps(spec), encoding='utf-8')
+    return str(path)
+
+
+def read_manifest(stats):
+    with open(stats['manifest'], encoding='utf-8') as f:
+        return json.load(f)['tasks']
+
+
+JOB_SPEC = {'seed': 2025, 'lang': 'en', 'compact_pdf': True, 'deterministic_pdf': True, 'jobs': [
+    {'week': 1, 'class': '4A', 'sample': 'B', 'copies': 3},
+    {'week': 1, 'class': '4B', 'config': {'mode': 'add', 'add_range': [0, 20]}, 'copies': 2},
+]}
+
+
+def pdf_text(filepath):
+    pymupdf = pytest.importorskip('pymupdf')
+    with pymupdf.open(filepath) as document:
+        return "".join(page.get_text() for page in document)
+
+
+# PDF text in the sheet's language
+
+def test_traditional_chinese_cid_font_keeps_its_characters(tmp_path, monkeypatch):
+    # Without an installed TrueType font, zh-tw sheets use the built-in MSung-Light CID font
+    monkeypatch.setattr(mwg, '_pdf_fonts_cache', {})
+    monkeypatch.setitem(mwg.PDF_FONT_FILES, 'zh-tw', [])
+    app = sheet_app('zh-tw')
+    config = dict(app.config, mode='word', word_lang=mwg.WORD_LANGUAGES.index('zh-tw'), seed=5)
+    problems = app.generate_problems(config)
+    app.create_pdf(str(tmp_path / 'sheet.pdf'), problems, config)
+    text = pdf_text(tmp_path / 'sheet.pdf').replace('\n', '')
+    assert app.get_pdf_fonts('zh-tw')[0] == 'MSung-Light'
+    assert app.trans['pdf_name'].rstrip(':：') in text
+    assert all(problem_text in text for problem_text, _ in problems[:4])
+
+
+def test_typed_title_gets_a_font_for_its_script(app, tmp_path):
+    config = dict(app.config, header="乘法練習 第三週", seed=5)
+    app.create_pdf(str(tmp_path / 'sheet.pdf'), app.generate_problems(config), config)
+    assert config['header'] in pdf_text(tmp_path / 'sheet.pdf')
+    assert app.title_font("Times tables", 'en') is None
+
+
+def test_default_title_is_translated(tmp_path):
+    app = sheet_app('zh-cn')
+    config = dict(app.config, seed=5)
+    app.create_pdf(str(tmp_path / 'sheet.pdf'), app.generate_problems(config), config)
+    assert app.lang_dict['zh-cn']['pdf_header'] in pdf_text(tmp_path / 'sheet.pdf')
+    assert f"<title>{app.lang_dict['zh-cn']['pdf_header']}</title>" in app.render_html([(app.generate_problems(config), config)])
+
+
+# Worksheet IDs
+
+@pytest.mark.parametrize('settings', [
+    {},
+    {'mode': 'add', 'add_range': (5, 250)},
+    {'mode': 'sub', 'sub_range': (10, 99), 'no_negative': False, 'difficulty': 3},
+    {'mode': 'long_div', 'long_div_range': (3, 9), 'long_div_digits': 4},
+    {'mode': 'word', 'word_lang': 3},
+])
+def test_worksheet_id_round_trip(app, settings):
+    config = dict(app.config, seed=12345, **settings)
+    decoded = app.decode_worksheet_id(app.encode_worksheet_id(config))
+    for key in mwg.PROBLEM_TYPES[config['mode']].config_keys + ('mode', 'seed'):
+        assert decoded[key] == config[key]
+    assert app.generate_problems(decoded) == app.generate_problems(config)
+
+
+def test_worksheet_id_is_read_leniently(app):
+    worksheet_id = app.encode_worksheet_id(dict(app.config, seed=7))
+    sloppy = worksheet_id.lower().replace('0', 'o').replace('1', 'l').replace('-', '')
+    assert app.decode_worksheet_id(sloppy) == app.decode_worksheet_id(worksheet_id)
+
+
+def test_worksheet_id_checksum_rejects_typos(app):
+    worksheet_id = app.encode_worksheet_id(dict(app.config, mode='mul', mul_range=(2, 9), seed=2025))
+    symbols = worksheet_id.replace('-', '')
+    alphabet = mwg.WORKSHEET_ID_ALPHABET
+    for position, symbol in enumerate(symbols):
+        for replacement in alphabet.replace(symbol, ''):
+            changed = symbols[:position] + replacement + symbols[position + 1:]
+            with pytest.raises(ValueError, match='checksum'):
+                app.decode_worksheet_id(changed)
+    for position in range(len(symbols) - 1):
+        first, second = symbols[position:position + 2]
+        if first == second:
+            continue
+        with pytest.raises(ValueError, match='checksum'):
+            app.decode_worksheet_id(symbols[:position] + second + first + symbols[position + 2:])
+
+
+def test_worksheet_id_checksum_tells_every_symbol_apart(app):
+    # 0 and Z (values 0 and 31) are a typo a checksum mod 31 cannot see
+    worksheet_id = app.encode_worksheet_id(dict(app.config, seed=31))
+    symbols = worksheet_id.replace('-', '')
+    assert '0' in symbols
+    for position, symbol in enumerate(symbols):
+        if symbol in '0Z':
+            with pytest.raises(ValueError, match='checksum'):
+                app.decode_worksheet_id(symbols[:position] + '0Z'.replace(symbol, '') + symbols[position + 1:])
+
+
+def test_worksheet_id_without_seed_gets_a_random_one(app):
+    config = dict(app.config, seed=None)
+    decoded = app.decode_worksheet_id(app.encode_worksheet_id(config))
+    assert isinstance(decoded['seed'], int) and decoded['seed'] >= 0
+    assert len({app.resolve_seed(None) for _ in range(5)}) > 1
+
+
+def test_worksheet_id_rejects_unknown_symbols(app):
+    with pytest.raises(ValueError, match='Invalid worksheet ID'):
+        app.decode_worksheet_id('1A4E8-0G1C0-U')
+
+
+# Marking
+
+@pytest.mark.parametrize('given, expected', [
+    ('012 ', '12'), (12, '12'), ('-3', '-3'), ('7 R 5', '7r5'), ('0,50', '0.5'), ('.5', '0.5'),
+    ('-0.50', '-0.5'), ('2.0', '2'), ('3/4', '3/4'), ('abc', 'abc'), ('7 r 05', '7r5'), ('012 R 0', '12r0'),
+    ('03/04', '3/4'), ('error', 'error'),
+])
+def test_normalise_answer(app, given, expected):
+    assert app.normalise_answer(given) == expected
+
+
+def test_mark_submissions(app):
+    answer_keys = {'W1': [('1 + 1', '2'), ('2 x 3', '6')], 'W2': [('5 - 2', '3')]}
+    submissions = [
+        ('ann', 'W1', 0, '2'), ('ann', 'W1', 1, ' 06'),
+        ('bob', 'W1', 0, '3'), ('bob', 'W2', 0, '3.0'),
+        ('bob', 'W2', 5, '1'), ('cy', 'W9', 0, '1'),
+    ]
+    results = app.mark_submissions(answer_keys, submissions)
+    assert (results['submissions'], results['marked'], results['unmatched'], results['correct']) == (6, 4, 2, 3)
+    assert results['students'] == {
+        'ann': {'correct': 2, 'total': 2, 'accuracy': 1.0},
+        'bob': {'correct': 1, 'total': 2, 'accuracy': 0.5},
+    }
+    assert results['facts']['1 + 1'] == {'correct': 1, 'total': 2, 'accuracy': 0.5}
+    assert results['facts']['5 - 2'] == {'correct': 1, 'total': 1, 'accuracy': 1.0}
+
+
+def test_mark_regenerated_answer_key(app, tmp_path):
+    worksheet_id = app.encode_worksheet_id(dict(app.config, mode='div_rem', seed=99))
+    answer_keys = app.build_answer_keys({worksheet_id: None})
+    _, problems = app.regenerate_worksheet(worksheet_id)
+    csv_path = tmp_path / 'answers.csv'
+    csv_path.write_text("student,worksheet_id,cell,answer\n" + "".join(
+        f"ann,{worksheet_id},{cell},{answer}\n" for cell, (_, answer) in enumerate(problems)), encoding='utf-8')
+    results = app.mark_submissions(answer_keys, app.load_submissions(str(csv_path)))
+    assert results['correct'] == results['marked'] == len(problems)
+
+
+def test_load_submissions_rejects_missing_columns(app, tmp_path):
+    csv_path = tmp_path / 'answers.csv'
+    csv_path.write_text("student,cell,answer\nann,0,4\n", encoding='utf-8')
+    with pytest.raises(ValueError, match="'worksheet_id'"):
+        app.load_submissions(str(csv_path))
+
+
+# Exact problem checks
+
+@pytest.mark.parametrize('problem_text, answer, integer_only', [
+    ('8 + 33 = ', 41, True),
+    ('90 ÷ 10 = ', 9, True),
+    ('2 + 3 x 4 = ', 14, True),
+    ('(47 + 39) x 2 = ', 172, True),
+    ('__ - 21 = 6', 27, True),
+    ('804 ÷ 5 = __ r __', '160 r 4', True),
+    ('5/6 - 3/11 = ', '37/66', False),
+    ('6/20 = ', '3/10', False),
+    ('9.3 x 7 = ', '65.1', False),
+])
+def test_check_problem_accepts_valid_problems(problem_text, answer, integer_only):
+    assert mwg.check_problem(problem_text, answer, integer_only)[0] == []
+
+
+@pytest.mark.parametrize('problem_text, answer, integer_only, no_negative, error', [
+    ('2 + 3 x 4 = ', 20, True, False, 'the answer is 14'),
+    ('7 ÷ 2 = ', 3, True, False, 'a division is not exact'),
+    ('4 ÷ 0 = ', 0, True, False, 'division by zero'),
+    ('7 - 9 = ', -2, True, True, 'a step goes below zero'),
+    ('__ + 2 = 6', 5, True, False, 'the sides differ'),
+    ('9 ÷ 2 = __ r __', '3 r 3', True, False, 'not the quotient and remainder'),
+    ('6/20 = ', '6/20', False, False, 'not written in simplest form'),
+    ('0.5 + 0.25 = ', '0.750', False, False, 'not written in simplest form'),
+    ('3 + = ', 3, True, False, 'missing number'),
+])
+def test_check_problem_reports_broken_problems(problem_text, answer, integer_only, no_negative, error):
+    errors = mwg.check_problem(problem_text, answer, integer_only, no_negative)[0]
+    assert any(error in message for message in errors), errors
+
+
+def test_generated_sheets_pass_their_checks(app):
+    for mode in mwg.PROBLEM_TYPES:
+        config = dict(app.config, mode=mode, seed=mode)
+        assert app.verify_problems(app.generate_problems(config), config) == []
+
+
+# Overlap caps
+
+def test_overlap_index_matches_brute_force_count():
+    rng = mwg.random.Random(4)
+    facts = [(f"{a} + {b} = ", a + b) for a in range(6) for b in range(6)]
+    index = mwg.OverlapIndex()
+    accepted = []
+    for _ in range(40):
+        # Repeated facts within a sheet count once
+        candidate = [rng.choice(facts) for _ in range(rng.randint(1, 30))]
+        expected = max((len({text for text, _ in candidate} & {text for text, _ in sheet}) for sheet in accepted),
+                       default=0)
+        assert index.max_shared(candidate) == expected
+        index.add(candidate)
+        accepted.append(candidate)
+
+
+def test_batch_pages_respect_max_overlap(app):
+    configs = [dict(app.config, mode='add', add_range=(0, 30), seed=seed) for seed in range(8)]
+    pages = app.generate_batch_pages(configs, max_overlap=8)
+    sheets = [{text for text, _ in problems} for problems, _ in pages]
+    assert all(len(first & second) <= 8 for i, first in enumerate(sheets) for second in sheets[i + 1:])
+    # Redrawn sheets are ordinary worksheets of their own seed
+    assert all(app.generate_problems(config) == problems for problems, config in pages)
+
+
+# Problem banks
+
+@pytest.mark.parametrize('mode', ['mixed', 'frac_add', 'div_rem'])
+def test_problem_bank_build_and_load(app, tmp_path, mode):
+    config = dict(app.config, mode=mode, bank=500)
+    stats = app.build_problem_bank(config, str(tmp_path))
+    key = app.problem_bank_key(config)
+    bank = mwg.ProblemBank(stats['path'], key)
+    expected = mwg.PROBLEM_TYPES[mode].generate_batch(500, mwg.random.Random(int(key, 16)), config)
+    assert len(bank) == stats['problems'] == 500
+    assert [bank[i] for i in range(len(bank))] == expected
+
+
+def test_problem_bank_rejects_other_settings(app, tmp_path):
+    config = dict(app.config, mode='add', bank=100)
+    stats = app.build_problem_bank(config, str(tmp_path))
+    with pytest.raises(ValueError, match='Not the problem bank'):
+        mwg.ProblemBank(stats['path'], app.problem_bank_key(dict(config, add_range=(0, 20))))
+
+
+def test_worksheets_draw_from_the_bank(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(mwg, 'BANK_DIR', str(tmp_path))
+    config = dict(app.config, mode='mul', bank=200, seed=8)
+    with pytest.raises(ValueError, match='build-bank'):
+        app.generate_problems(config)
+    app.build_problem_bank(config)
+    bank = app.get_problem_bank(config)
+    problems = app.generate_problems(config)
+    assert set(problems) <= {bank[i] for i in range(len(bank))}
+    assert app.generate_problems(app.decode_worksheet_id(app.encode_worksheet_id(config))) == problems
+
+
+# Several worksheets per sheet
+
+def test_one_up_a3_is_scaled_and_centred(app, tmp_path):
+    pymupdf = pytest.importorskip('pymupdf')
+    config = dict(app.config, seed=3, n_up=1, sheet_size='A3')
+    app.create_pdf(str(tmp_path / 'sheet.pdf'), app.generate_problems(config), config)
+    with pymupdf.open(tmp_path / 'sheet.pdf') as document:
+        width = document[0].rect.width
+        blocks = [block[:4] for block in document[0].get_text('blocks')]
+    left, right = min(block[0] for block in blocks), max(block[2] for block in blocks)
+    assert width == pytest.approx(mwg.A3[0], abs=1)
+    assert right - left > 0.85 * width
+    assert left == pytest.approx(width - right, abs=5)
+
+
+@pytest.mark.parametrize('n_up, sheet_size, sheets, landscape', [
+    (2, 'A4', 3, True), (4, 'A4', 2, False), (4, 'A3', 2, False), (1, 'A3', 5, False),
+])
+def test_n_up_sheet_count_and_orientation(app, tmp_path, n_up, sheet_size, sheets, landscape):
+    pymupdf = pytest.importorskip('pymupdf')
+    pages = [(app.generate_problems(config), config) for config in (dict(app.config, seed=seed) for seed in range(5))]
+    stats = app.create_multi_page_pdf(str(tmp_path / 'sheet.pdf'), pages, n_up=n_up, sheet_size=sheet_size)
+    with pymupdf.open(tmp_path / 'sheet.pdf') as document:
+        assert len(document) == stats['sheets'] == sheets and stats['pages'] == 5
+        assert (document[0].rect.width > document[0].rect.height) == landscape
+    with pytest.raises(ValueError, match='1, 2 or 4'):
+        app.create_multi_page_pdf(str(tmp_path / 'bad.pdf'), pages, n_up=3)
+    with pytest.raises(ValueError, match='Unsupported sheet size'):
+        app.create_multi_page_pdf(str(tmp_path / 'bad.pdf'), pages, sheet_size='Letter')
+
+
+@pytest.mark.parametrize('n_up', [2, 4])
+def test_n_up_slots_hold_different_copies(app, tmp_path, n_up):
+    config = dict(app.config, mode='mul', seed=21, n_up=n_up)
+    problems = app.generate_problems(config)
+    app.create_pdf(str(tmp_path / 'sheet.pdf'), problems, config)
+    text = pdf_text(tmp_path / 'sheet.pdf')
+    worksheet_ids = [app.encode_worksheet_id(config)] + [
+        app.encode_worksheet_id(dict(config, seed=app.derive_seed(config['seed'], 'slot', slot)))
+        for slot in range(1, n_up)]
+    assert len(set(worksheet_ids)) == n_up
+    assert all(worksheet_id in text for worksheet_id in worksheet_ids)
+
+
+# Word problems without a font
+
+def test_job_hashes_do_not_depend_on_installed_fonts(app, monkeypatch):
+    spec = {'seed': 3, 'lang': 'hi', 'jobs': [{'name': 'story', 'config': {'mode': 'word'}, 'copies': 2},
+                                              {'name': 'sums', 'config': {'mode': 'add'}, 'copies': 2}]}
+    monkeypatch.setattr(mwg, '_pdf_fonts_cache', {})
+    monkeypatch.setitem(mwg.PDF_FONT_FILES, 'hi', [])
+    without_font = [task['hash'] for task in app.expand_job_spec(spec)]
+    monkeypatch.setitem(mwg._pdf_fonts_cache, 'hi', ('HindiFont', 'HindiFont', 'hi'))
+    assert [task['hash'] for task in app.expand_job_spec(spec)] == without_font
+    assert app.expand_job_spec(spec)[0]['config']['word_lang'] == mwg.WORD_LANGUAGES.index('hi')
+
+
+def test_word_problems_fall_back_to_a_printable_language(app, monkeypatch):
+    monkeypatch.setattr(mwg, '_pdf_fonts_cache', {})
+    monkeypatch.setitem(mwg.PDF_FONT_FILES, 'hi', [])
+    config = dict(app.config, mode='word', word_lang=mwg.WORD_LANGUAGES.index('hi'), seed=4)
+    layout = app.build_page_layout(app.generate_problems(config), config)
+    english = dict(config, word_lang=mwg.WORD_LANGUAGES.index('en'))
+    printed = {item['text'] for item in layout['items'] if item['kind'] == 'text'}
+    assert not any('\u0900' <= char <= '\u097f' for value in printed for char in value)
+    assert f"ID {app.encode_worksheet_id(english)}" in printed
+
+
+# Session history
+
+def test_history_merges_a_burst_of_live_previews(app, monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(mwg.time, 'monotonic', lambda: clock[0])
+    history = mwg.WorksheetHistory()
+    sheets = [(dict(app.config, seed=seed), app.generate_problems(dict(app.config, seed=seed))) for seed in range(5)]
+    history.push(*sheets[0])
+    for config, problems in sheets[1:3]:
+        clock[0] += 1
+        history.push(config, problems, merge=True)
+    # The burst replaced its own entries but not the worksheet generated before it
+    assert len(history) == 2
+    assert history.get(-1)[1]['seed'] == 2 and history.get(0)[1]['seed'] == 0
+    clock[0] += mwg.HISTORY_MERGE_SECONDS
+    history.push(*sheets[3], merge=True)
+    history.push(*sheets[4])
+    assert [history.get(index)[1]['seed'] for index in range(len(history))] == [0, 2, 3, 4]
+    assert history.size == sum(len(record) for _, record in history.entries)
+
+
+def test_history_drops_the_oldest_past_either_limit(app):
+    sheets = [(dict(app.config, seed=seed), app.generate_problems(dict(app.config, seed=seed))) for seed in range(6)]
+    history = mwg.WorksheetHistory(max_entries=4)
+    for config, problems in sheets:
+        history.push(config, problems)
+    history.push(*sheets[-1])
+    assert [history.get(index)[1]['seed'] for index in range(len(history))] == [2, 3, 4, 5]
+    # Recalled exactly, ranges and problems as tuples again
+    created, config, problems = history.get(-1)
+    assert problems == sheets[-1][1] and mwg.datetime.strptime(created, '%H:%M:%S')
+
+    one_record = len(history.entries[-1][1])
+    history = mwg.WorksheetHistory(max_bytes=int(2.5 * one_record))
+    for config, problems in sheets:
+        history.push(config, problems)
+    assert len(history) == 2 and history.size <= history.max_bytes
+
+
+def test_live_previews_are_kept_in_the_history(monkeypatch):
+    app = mwg.MathWorksheetGenerator(headless=True)
+    monkeypatch.setattr(app, 'preview_built', False, raising=False)
+    # No window: the status bar only needs to take the message
+    monkeypatch.setattr(app, 'status_var', SimpleNamespace(set=lambda value: None), raising=False)
+    config = dict(app.config, seed=6)
+    app.live_preview_generation = app.live_preview_requested = 1
+    app.live_preview_results.put((1, config, app.generate_problems(config), None))
+    app.poll_live_preview()
+    assert len(app.history) == 1 and app.history.get(-1)[1]['seed'] == 6
+
+
+# Job specs
+
+def test_job_run_resumes_where_it_stopped(app, tmp_path):
+    path = write_spec(tmp_path, JOB_SPEC)
+    stats = app.run_job_spec(path, workers=2)
+    assert (stats['tasks'], stats['rendered'], stats['skipped'], stats['failed'], stats['pages']) == (2, 2, 0, {}, 5)
+    first_run = read_manifest(stats)
+    stats = app.run_job_spec(path, workers=2)
+    assert (stats['rendered'], stats['skipped']) == (0, 2)
+    assert read_manifest(stats) == first_run
+
+    # A changed job and a lost PDF are rendered again, and only those
+    write_spec(tmp_path, dict(JOB_SPEC, jobs=[dict(JOB_SPEC['jobs'][0], copies=4), JOB_SPEC['jobs'][1]]))
+    os.remove(first_run['week01-4B-custom']['output'])
+    stats = app.run_job_spec(path, workers=2)
+    assert (stats['rendered'], stats['skipped'], stats['pages']) == (2, 0, 6)
+    assert read_manifest(stats)['week01-4B-custom'] == first_run['week01-4B-custom']
+    assert app.run_job_spec(path, workers=2)['skipped'] == 2
+
+
+def test_job_spec_errors_name_the_job(app):
+    with pytest.raises(ValueError, match='"copies" of job 2'):
+        app.expand_job_spec(dict(JOB_SPEC, jobs=[JOB_SPEC['jobs'][0], {'copies': 0}]))
+    with pytest.raises(ValueError, match="Unknown problem type 'algebra' in job 1"):
+        app.expand_job_spec(dict(JOB_SPEC, jobs=[{'config': {'mode': 'algebra'}}]))
+
+
+# HTML and SVG
+
+def test_svg_draws_every_text_of_the_layout(app):
+    from xml.etree import ElementTree
+    config = dict(app.config, mode='frac_add', header="Fractions <week 3> & more", seed=3)
+    layout = app.build_page_layout(app.generate_problems(config), config)
+    svg = ElementTree.fromstring(app.render_svg(layout))
+    assert svg.get('viewBox') == f"0 0 {layout['width']:.2f} {layout['height']:.2f}"
+    texts = sorted("".join(item.itertext()) for item in svg.iter('{http://www.w3.org/2000/svg}text'))
+    assert texts == sorted(item['text'] for item in layout['items'] if item['kind'] == 'text')
+
+
+def test_html_has_one_page_per_worksheet(app):
+    pages = [(app.generate_problems(config), config) for config in (dict(app.config, seed=seed) for seed in range(3))]
+    document = app.render_html(pages)
+    assert document.startswith('<!DOCTYPE html><html lang="en">')
+    assert document.count('<svg ') == 3
+    assert all(f"ID {app.encode_worksheet_id(config)}" in document for _, config in pages)
+
+
+# Compact PDFs
+
+def test_compact_pdf_is_smaller_with_the_same_text(app, tmp_path):
+    pymupdf = pytest.importorskip('pymupdf')
+    pages = [(app.generate_problems(config), config) for config in (dict(app.config, seed=seed) for seed in range(10))]
+    plain = app.create_multi_page_pdf(str(tmp_path / 'plain.pdf'), pages)
+    compact = app.create_multi_page_pdf(str(tmp_path / 'compact.pdf'), pages, compact=True)
+    assert compact['pages'] == plain['pages'] == 10
+    assert compact['bytes'] < plain['bytes'] / 2
+    with pymupdf.open(tmp_path / 'plain.pdf') as plain_pdf, pymupdf.open(tmp_path / 'compact.pdf') as compact_pdf:
+        # Text objects are merged, so the order of the words differs but not the words
+        assert [sorted(page.get_text().split()) for page in compact_pdf] == \
+            [sorted(page.get_text().split()) for page in plain_pdf]
+        assert [len(page.get_links()) for page in compact_pdf] == [1] + [0] * 9
+
+
+# Deferred imports
+
+def test_generating_problems_does_not_load_pdf_or_batch_modules():
+    import subprocess
+    import sys
+    script = (
+        "import sys, maths_worksheet_generator as mwg\n"
+        "app = mwg.MathWorksheetGenerator(headless=True)\n"
+        "app.generate_problems(dict(app.config, seed=1))\n"
+        "print(sorted(name for name in ('reportlab', 'concurrent.futures') if name in sys.modules))\n"
+        "app.build_page_layout(app.generate_problems(dict(app.config, seed=1)), dict(app.config, seed=1))\n"
+        "print('reportlab' in sys.modules)\n"
+    )
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(mwg.__file__))).stdout.split("\n")
+    assert output[:2] == ['[]', 'True']
+
+
+# Problem type plugins
+
+@pytest.mark.parametrize('mode', list(mwg.PROBLEM_TYPES))
+def test_problem_types_draw_only_from_their_rng(app, mode):
+    problem_type = mwg.PROBLEM_TYPES[mode]
+    config = dict(app.config, mode=mode)
+    batch = problem_type.generate_batch(40, mwg.random.Random(11), config)
+    mwg.random.seed(1)
+    assert len(batch) == 40
+    assert problem_type.generate_batch(40, mwg.random.Random(11), config) == batch
+
+
+def test_registered_plugin_makes_worksheets(app, monkeypatch):
+    monkeypatch.setattr(mwg, 'PROBLEM_TYPES', dict(mwg.PROBLEM_TYPES))
+    monkeypatch.setattr(mwg, 'PROBLEM_TYPE_CODES', dict(mwg.PROBLEM_TYPE_CODES))
+
+    @mwg.register_problem_type
+    class Doubles(mwg.ProblemType):
+        key = 'doubles'
+        id_code = 99
+        grid = (10, 4)
+
+        def generate_batch(self, n, rng, config):
+            return [(f"{a} + {a} = ", a + a) for a in (rng.randint(1, 20) for _ in range(n))]
+
+    config = dict(app.config, mode='doubles', seed=3)
+    problems = app.generate_problems(config)
+    assert len(problems) == 40 and app.verify_problems(problems, config) == []
+    assert app.decode_worksheet_id(app.encode_worksheet_id(config))['mode'] == 'doubles'
+    with pytest.raises(ValueError, match='Duplicate problem type ID code 99'):
+        mwg.register_problem_type(type('Twin', (Doubles,), {'key': 'twin'}))
+
+
+# Fractions and decimals
+
+def test_fraction_tables_match_fraction_arithmetic():
+    tables = mwg.FractionTables(3, 15)
+    assert [(n, d) for _, n, d in tables.proper] == [
+        (n, d) for d in range(3, 16) for n in range(1, d) if mwg.Fraction(n, d).denominator == d]
+    assert all(text == str(mwg.Fraction(n, d)) for text, n, d in tables.proper)
+    for denominator in (3, 8, 12, 15):
+        assert tables.reduced(denominator) == [str(mwg.Fraction(n, denominator)) for n in range(2 * denominator + 1)]
+    assert all(tables.lcm[b][d] == b * d // mwg.math.gcd(b, d) for b in range(3, 16) for d in range(3, 16))
+
+
+OPERATIONS = {'+': operator.add, '-': operator.sub, 'x': operator.mul}
+
+
+@pytest.mark.parametrize('settings', [
+    {'mode': 'frac_add', 'frac_range': (2, 12), 'no_negative': True},
+    {'mode': 'frac_add', 'frac_range': (5, 30), 'no_negative': False},
+    {'mode': 'decimal', 'dec_range': (0, 20), 'dec_places': 1, 'no_negative': True},
+    {'mode': 'decimal', 'dec_range': (3, 999), 'dec_places': 3, 'no_negative': False},
+])
+def test_fraction_and_decimal_answers_are_exact(app, settings):
+    for seed in range(5):
+        for problem_text, answer in app.generate_problems(dict(app.config, seed=seed, **settings)):
+            left, op, right, _ = problem_text.split()
+            expected = OPERATIONS[op](mwg.Fraction(left), mwg.Fraction(right))
+            assert mwg.Fraction(answer) == expected, problem_text
+            assert not (settings.get('no_negative') and expected < 0), problem_text
+            # Answers are written in their simplest form: lowest terms, no trailing zeros
+            if settings['mode'] == 'frac_add':
+                assert answer == str(expected)
+            else:
+                assert not ('.' in answer and answer.endswith('0')) and not answer.endswith('.')
+
+
+def test_simplify_problems_reduce_to_their_answer(app):
+    for problem_text, answer in app.generate_problems(dict(app.config, mode='frac_simplify', frac_range=(2, 20), seed=4)):
+        fraction = problem_text.split()[0]
+        assert str(mwg.Fraction(fraction)) == answer != fraction
+
+
+# Division with remainders
+
+def division_parts(problem_text, answer):
+    dividend, _, divisor = problem_text.split()[:3]
+    quotient, _, remainder = answer.split()
+    return int(dividend), int(divisor), int(quotient), int(remainder)
+
+
+@pytest.mark.parametrize('div_range', [(1, 12), (2, 2), (5, 50)])
+def test_remainder_problems_have_a_remainder(app, div_range):
+    for problem_text, answer in app.generate_problems(dict(app.config, mode='div_rem', div_range=div_range, seed=1)):
+        dividend, divisor, quotient, remainder = division_parts(problem_text, answer)
+        assert dividend == quotient * divisor + remainder and 0 < remainder < divisor
+        assert div_range[0] <= quotient <= div_range[1] and max(2, div_range[0]) <= divisor <= max(2, div_range[1])
+
+
+@pytest.mark.parametrize('digits, long_div_range', [(2, (2, 12)), (2, (50, 99)), (3, (7, 7)), (5, (11, 99))])
+def test_long_division_dividends_have_the_digits(app, digits, long_div_range):
+    config = dict(app.config, mode='long_div', long_div_digits=digits, long_div_range=long_div_range, seed=2)
+    for problem_text, answer in app.generate_problems(config):
+        dividend, divisor, quotient, remainder = division_parts(problem_text, answer)
+        assert dividend == quotient * divisor + remainder and 0 <= remainder < divisor
+        assert len(str(dividend)) == digits
+        assert min(long_div_range[0], 10 ** (digits - 1)) <= divisor <= min(long_div_range[1], 10 ** (digits - 1))
+
+
+# Multi-step expressions
+
+def evaluate_expression(node, high):
+    """Evaluate an expression tree with exact fractions, checking every value stays in 1..high"""
+    import ast
+    if isinstance(node, ast.Constant):
+        value = mwg.Fraction(node.value)
+    else:
+        left, right = evaluate_expression(node.left, high), evaluate_expression(node.right, high)
+        value = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+                 ast.Div: operator.truediv}[type(node.op)](left, right)
+    assert value.denominator == 1 and 1 <= value <= high
+    return value
+
+
+@pytest.mark.parametrize('expr_operands, expr_max', [((2, 2), 10), ((3, 4), 100), ((5, 5), 999)])
+def test_multi_step_expressions_stay_in_bounds(app, expr_operands, expr_max):
+    import ast
+    config = dict(app.config, mode='multi_step', expr_operands=expr_operands, expr_max=expr_max)
+    for seed in range(3):
+        for problem_text, answer in app.generate_problems(dict(config, seed=seed)):
+            expression = problem_text.rstrip('= ').replace('x', '*').replace('÷', '/')
+            tree = ast.parse(expression, mode='eval').body
+            assert evaluate_expression(tree, expr_max) == answer, problem_text
+            assert expr_operands[0] <= len(mwg.re.findall(r"\d+", expression)) <= expr_operands[1]
+
+
+def test_factor_pairs_match_brute_force():
+    pairs = mwg.get_factor_pairs(60)
+    assert all(pairs[value] == [(a, value // a) for a in range(2, value // 2 + 1) if value % a == 0 and value // a >= 2]
+               for value in range(61))
+
+
+# Difficulty
+
+def test_difficulty_scores_count_digits_and_carries():
+    # 5 + 4: two digits; 58 + 67: four digits and two carries; 40 - 17: four digits and a borrow;
+    # 3 - 5: two digits, a borrow and a negative answer
+    assert mwg.difficulty_scores('+', [5, 58], [4, 67]) == [2, 8]
+    assert mwg.difficulty_scores('-', [40, 3], [17, 5]) == [6, 6]
+    # A pair scores the same whatever it is scored with
+    assert mwg.difficulty_scores('-', [3, 999], [5, 1]) == [6, 4]
+    assert mwg.difficulty_scores('x', [2, 7], [10, 8]) == [2, 8]
+
+
+def test_stratified_sample_hits_the_target_shares():
+    buckets = [[('easy', i) for i in range(5)], [('medium', i) for i in range(5)], [('hard', i) for i in range(5)]]
+    sample = mwg.stratified_sample(buckets, (0.6, 0.3, 0.1), 90, mwg.random.Random(1))
+    assert Counter(level for level, _ in sample) == {'easy': 54, 'medium': 27, 'hard': 9}
+    # An empty third passes its share on to the others
+    sample = mwg.stratified_sample([buckets[0], [], buckets[2]], (0.2, 0.6, 0.2), 10, mwg.random.Random(1))
+    assert Counter(level for level, _ in sample) == {'easy': 5, 'hard': 5}
+
+
+@pytest.mark.parametrize('mode, op, key', [('add', '+', 'add_range'), ('mul', 'x', 'mul_range')])
+def test_harder_settings_make_harder_sheets(app, mode, op, key):
+    mean_scores = []
+    for difficulty in (1, 2, 3):
+        problems = app.generate_problems(dict(app.config, mode=mode, difficulty=difficulty, seed=5))
+        operands = [list(map(int, mwg.re.findall(r"\d+", text)[:2])) for text, _ in problems]
+        scores = mwg.difficulty_scores(op, [a for a, _ in operands], [b for _, b in operands])
+        mean_scores.append(sum(scores) / len(scores))
+    assert mean_scores == sorted(mean_scores) and mean_scores[0] < mean_scores[2]
+
+
+# Preview canvas
+
+class RecordingCanvas:
+    """Stands in for the preview's Tk canvas (there is no display here), keeping the items by tag"""
+
+    def __init__(self):
+        self.items = []
+        self.drawn = 0
+
+    def create(self, kind, *args, tags=None, **options):
+        self.items.append((kind, tags, options))
+        self.drawn += 1
+
+    def __getattr__(self, name):
+        if name.startswith('create_'):
+            return lambda *args, **options: self.create(name[7:], *args, **options)
+        raise AttributeError(name)
+
+    def delete(self, tag):
+        self.items = [item for item in self.items if tag != 'all' and item[1] != tag]
+
+    def config(self, **options):
+        pass
+
+
+def test_preview_redraws_only_what_changed(monkeypatch):
+    app = mwg.MathWorksheetGenerator(headless=True)
+    canvas = RecordingCanvas()
+    monkeypatch.setattr(app, 'preview_canvas', canvas, raising=False)
+    monkeypatch.setattr(app, 'preview_chrome_key', None, raising=False)
+    layouts = [app.build_page_layout(app.generate_problems(config), config)
+               for config in (dict(app.config, seed=seed) for seed in range(2))]
+
+    app.draw_preview(layouts[0])
+    texts = [options['text'] for kind, _, options in canvas.items if kind == 'text']
+    assert sorted(texts) == sorted(item['text'] for item in layouts[0]['items'] if item['kind'] == 'text')
+    chrome_items = sum(tags == 'chrome' for _, tags, _ in canvas.items)
+
+    # Same page template: the chrome stays, only the sheet's own items are drawn again
+    drawn = canvas.drawn
+    app.draw_preview(layouts[1])
+    sheet_items = [item for item in layouts[1]['items'] if item['layer'] != 'chrome']
+    assert canvas.drawn - drawn == len(sheet_items)
+    assert sum(tags == 'chrome' for _, tags, _ in canvas.items) == chrome_items
+    assert sorted(options['text'] for kind, tags, options in canvas.items if tags == 'sheet') == \
+        sorted(item['text'] for item in sheet_items if item['kind'] == 'text')
+
+
+# Worksheet archive
+
+def test_archive_lookups(app, tmp_path):
+    archive = str(tmp_path / 'archive.sqlite3')
+    sheets = [(dict(app.config, mode=mode, seed=seed), class_name, created_at)
+              for mode, seed, class_name, created_at in [('add', 1, '4A', '2025-09-01T09:00:00'),
+                                                         ('mul', 2, '4A', '2025-09-02T09:00:00'),
+                                                         ('mul', 3, '4B', '2025-09-02T15:30:00'),
+                                                         ('div_rem', 4, '4B', '2025-09-03T09:00:00')]]
+    rows = [app.archive_row(config, app.generate_problems(config), 'en', class_name, created_at)
+            for config, class_name, created_at in sheets]
+    assert app.archive_worksheets(archive, rows) == 4
+
+    def seeds(**query):
+        return [row['seed'] for row in app.query_archive(archive, **query)]
+
+    assert seeds() == [4, 3, 2, 1]
+    assert seeds(class_name='4A') == [2, 1]
+    assert seeds(mode='mul') == [3, 2]
+    assert seeds(since='2025-09-02', until='2025-09-02') == [3, 2]
+    assert seeds(class_name='4B', until='2025-09-02') == [3]
+    worksheet_id = app.encode_worksheet_id(sheets[3][0])
+    found = app.query_archive(archive, worksheet_id=worksheet_id.lower().replace('-', ''), with_problems=True)
+    assert [row['worksheet_id'] for row in found] == [worksheet_id]
+    assert found[0]['problems'] == [(text, str(answer)) for text, answer in app.generate_problems(sheets[3][0])]
+    assert found[0]['config_hash'] == app.config_hash(sheets[3][0]) and 'seed' not in found[0]['config']
+
+
+def test_job_run_archives_every_copy(app, tmp_path):
+    stats = app.run_job_spec(write_spec(tmp_path, dict(JOB_SPEC, archive='archive.sqlite3')), workers=1)
+    rows = app.query_archive(str(tmp_path / 'archive.sqlite3'))
+    assert sorted(row['worksheet_id'] for row in rows) == sorted(
+        worksheet_id for entry in read_manifest(stats).values() for worksheet_id in entry['worksheet_ids'])
+    assert Counter(row['class_name'] for row in rows) == {'4A': 3, '4B': 2}
+
+
+# Class rosters
+
+def test_load_roster(app, tmp_path):
+    path = tmp_path / 'roster.csv'
+    path.write_text("﻿Name,Class\nAnn Lee,4A\n ,4A\nBo,4B\n", encoding='utf-8')
+    assert app.load_roster(str(path)) == [{'name': 'Ann Lee', 'class': '4A'}, {'name': 'Bo', 'class': '4B'}]
+    path.write_text("student,class\nAnn,4A\n", encoding='utf-8')
+    with pytest.raises(ValueError, match="no 'name' column"):
+        app.load_roster(str(path))
+
+
+def test_roster_sheets_follow_the_student_not_the_order(app):
+    config = dict(app.config, mode='mul', seed=77)
+    names = [{'name': name} for name in ('Ann', 'Bo', 'Ann', 'Cy')]
+    pages = app.build_roster_pages(names, config, date='2025-09-01')
+    assert [page_config['student_name'] for _, page_config in pages] == ['Ann', 'Bo', 'Ann', 'Cy']
+    assert len({page_config['seed'] for _, page_config in pages}) == 4
+    # Another student in the roster, or another order, leaves everyone's sheet as it was
+    reordered = app.build_roster_pages([{'name': name} for name in ('Dee', 'Cy', 'Ann', 'Bo', 'Ann')], config,
+                                       date='2025-09-01')
+    assert sorted(map(repr, pages)) == sorted(map(repr, reordered[1:]))
+
+
+def test_roster_pdf_prints_every_name(app, tmp_path):
+    roster = [{'name': 'Ann Lee'}, {'name': 'Bo Chan'}, {'name': 'Cy Dale'}]
+    stats = app.create_roster_pdf(str(tmp_path / 'roster.pdf'), roster, dict(app.config, seed=5), date='2025-09-01')
+    text = pdf_text(tmp_path / 'roster.pdf')
+    assert stats['pages'] == 3
+    assert all(student['name'] in text for student in roster) and '2025-09-01' in text
+
+
+# Reproducible batches
+
+def test_job_sheets_do_not_depend_on_workers_or_job_order(app, tmp_path):
+    runs = []
+    for workers, jobs in ((1, JOB_SPEC['jobs']), (4, JOB_SPEC['jobs'][::-1])):
+        folder = tmp_path / f"workers{workers}"
+        folder.mkdir()
+        runs.append(read_manifest(app.run_job_spec(write_spec(folder, dict(JOB_SPEC, jobs=jobs)), workers=workers)))
+    assert {task_id: entry['worksheet_ids'] for task_id, entry in runs[0].items()} == \
+        {task_id: entry['worksheet_ids'] for task_id, entry in runs[1].items()}
+    for task_id, entry in runs[0].items():
+        with open(entry['output'], 'rb') as first, open(runs[1][task_id]['output'], 'rb') as second:
+            assert first.read() == second.read()
+
+
+def test_more_copies_keep_the_earlier_seeds(app):
+    seeds = {task['task_id']: task['seeds'] for task in app.expand_job_spec(JOB_SPEC)}
+    more = dict(JOB_SPEC, jobs=[dict(job, copies=job['copies'] + 3) for job in JOB_SPEC['jobs']])
+    for task in app.expand_job_spec(more):
+        assert task['seeds'][:len(seeds[task['task_id']])] == seeds[task['task_id']]
+        assert len(set(task['seeds'])) == len(task['seeds'])
+    # A different batch seed gives different sheets
+    assert app.expand_job_spec(dict(JOB_SPEC, seed=2026))[0]['seeds'] != seeds['week01-4A-sample_B']
+
+
+def test_regenerated_job_sheets_match_the_manifest(app, tmp_path):
+    path = write_spec(tmp_path, JOB_SPEC)
+    for task_id, entry in read_manifest(app.run_job_spec(path, workers=2)).items():
+        for copy, worksheet_id in enumerate(entry['worksheet_ids']):
+            config, problems = app.regenerate_job_sheet(path, task_id, copy)
+            assert app.encode_worksheet_id(config) == worksheet_id
+            assert problems == app.regenerate_worksheet(worksheet_id)[1]
+    with pytest.raises(ValueError, match='copies 0 to 1'):
+        app.regenerate_job_sheet(path, 'week01-4B-custom', 2)
+
+
+# Deterministic PDFs
+
+def test_deterministic_pdfs_are_byte_identical(app, tmp_path, monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1756713600')
+    config = dict(app.config, mode='mixed', seed=9, deterministic_pdf=True)
+    problems = app.generate_problems(config)
+    variants = {'plain': {}, 'compact': {'compact_pdf': True}, '2-up': {'n_up': 2},
+                '4-up-a3': {'n_up': 4, 'sheet_size': 'A3'}}
+
+    def render(run):
+        for name, settings in variants.items():
+            app.create_pdf(str(tmp_path / f"{name}-{run}.pdf"), problems, dict(config, **settings))
+        app.create_roster_pdf(str(tmp_path / f"roster-{run}.pdf"), [{'name': 'Ann'}, {'name': 'Bo'}], config,
+                              date='2025-09-01')
+
+    render(1)
+    # Past a second boundary, so a creation date would differ
+    mwg.time.sleep(1.1)
+    render(2)
+    for name in list(variants) + ['roster']:
+        assert (tmp_path / f"{name}-1.pdf").read_bytes() == (tmp_path / f"{name}-2.pdf").read_bytes(), name
+    assert '2025-09-01 08:00' in pdf_text(tmp_path / 'plain-1.pdf')
+    # The document ID follows the content
+    app.create_pdf(str(tmp_path / 'other.pdf'), app.generate_problems(dict(config, seed=10)), dict(config, seed=10))
+    assert (tmp_path / 'other.pdf').read_bytes()[-200:] != (tmp_path / 'plain-1.pdf').read_bytes()[-200:]
+
+
+# Fitting text
+
+@pytest.fixture(scope='module')
+def cjk_font(app):
+    font, _, font_lang = app.get_pdf_fonts('zh-cn')
+    if font_lang != 'zh-cn':
+        pytest.skip("No Chinese PDF font")
+    return font
+
+
+def test_text_width_matches_reportlab(cjk_font):
+    samples = [("12 + 345 = ", 'Helvetica'), ("(47 + 39) x 2 = ", 'Helvetica-Bold'), ("", 'Helvetica'),
+               ("小明有 12 个苹果，吃了 5 个。", cjk_font), ("x", cjk_font)]
+    for _ in range(2):
+        # Measured again from the memo on the second pass
+        for text, font in samples:
+            assert mwg.text_width(text, font, 11) == pytest.approx(mwg.pdfmetrics.stringWidth(text, font, 11))
+
+
+def test_fit_font_size_is_the_largest_half_point_that_fits():
+    mwg.load_reportlab()
+    text = "Zoe puts 12 stickers into 6 bags, the same number in each."
+    assert mwg.fit_font_size("1 + 1 = ", 'Helvetica', 11, 100) == 11
+    size = mwg.fit_font_size(text, 'Helvetica', 11, 150)
+    assert size < 11 and size * 2 == int(size * 2)
+    assert mwg.text_width(text, 'Helvetica', size) <= 150 < mwg.text_width(text, 'Helvetica', size + 0.5)
+
+
+@pytest.mark.parametrize('text, expected_lines', [
+    ("7 + 8 = ", ["7 + 8 = "]),
+    ("Ava has 42 stickers and gives 21 away. How many are left?",
+     ["Ava has 42 stickers and gives", "21 away. How many are left?"]),
+    ("Work out (47 + 39) x 2 and then take away 15 = ", ["Work out (47 + 39) x 2", "and then take away 15 ="]),
+])
+def test_fit_text_splits_long_problems_in_two(text, expected_lines):
+    mwg.load_reportlab()
+    lines, size = mwg.fit_text(text, 'Helvetica', 11, 160, 9)
+    assert lines == expected_lines
+    assert all(mwg.text_width(line, 'Helvetica', size) <= 160 for line in lines)
+
+
+def test_cjk_text_wraps_after_phrases_and_keeps_punctuation_attached(cjk_font):
+    text = "小明有十二个苹果，吃了五个。还剩几个？"
+    # Split at the comma, not in the middle of the more balanced "吃了五个"
+    lines, size = mwg.fit_text(text, cjk_font, 11, 110, 9)
+    assert lines == ["小明有十二个苹果，", "吃了五个。还剩几个？"] and size == 11
+    text += "（答）"
+    assert all(text[start] not in mwg.NO_LINE_START and text[end - 1] not in mwg.NO_LINE_END
+               for end, start in mwg.line_breaks(text))
+
+
+# Live preview
+
+class ManualRoot:
+    """Stands in for the Tk root's timers: callbacks run when the test says so"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.next_id = 0
+
+    def after(self, delay, callback):
+        self.next_id += 1
+        self.jobs[self.next_id] = callback
+        return self.next_id
+
+    def after_cancel(self, job_id):
+        del self.jobs[job_id]
+
+    def run_until(self, done, timeout=5.0):
+        deadline = mwg.time.monotonic() + timeout
+        while not done() and mwg.time.monotonic() < deadline:
+            jobs, self.jobs = self.jobs, {}
+            for callback in jobs.values():
+                callback()
+            mwg.time.sleep(0.005)
+        return done()
+
+
+@pytest.fixture
+def live_app(monkeypatch):
+    app = mwg.MathWorksheetGenerator(headless=True)
+    monkeypatch.setattr(app, 'root', ManualRoot(), raising=False)
+    monkeypatch.setattr(app, 'preview_built', False, raising=False)
+    monkeypatch.setattr(app, 'status_var', SimpleNamespace(set=lambda value: None), raising=False)
+    app.current_config = None
+    return app
+
+
+def test_live_preview_debounces_a_burst_of_edits(live_app, monkeypatch):
+    configs = iter([dict(live_app.config, seed=seed) for seed in range(10)])
+    monkeypatch.setattr(live_app, 'get_worksheet_config', lambda: next(configs))
+    for _ in range(3):
+        live_app.schedule_live_preview()
+    assert len(live_app.root.jobs) == 1
+    assert live_app.root.run_until(lambda: live_app.current_config is not None)
+    # One burst, one generation: the first config the timer read
+    assert live_app.live_preview_generation == 1 and live_app.current_config['seed'] == 0
+    assert live_app.current_problems == live_app.generate_problems(dict(live_app.config, seed=0))
+    assert not live_app.live_preview_polling and not live_app.root.jobs
+
+
+def test_cancelled_live_preview_is_not_shown(live_app, monkeypatch):
+    monkeypatch.setattr(live_app, 'get_worksheet_config', lambda: dict(live_app.config, seed=1))
+    live_app.start_live_preview()
+    live_app.cancel_live_preview()
+    assert live_app.root.run_until(lambda: not live_app.live_preview_polling)
+    assert live_app.current_config is None and len(live_app.history) == 0
+
+
+# Word problem templates
+
+def test_word_template_agrees_with_numbers_and_gender():
+    language = mwg.get_word_language('en')
+    template = mwg.WordTemplate('add', "{name} has {a} {item#a}. {He} gets {b} more.", language)
+    sam, mia = language['names'][0], language['names'][1]
+    apple = language['items'][0]
+    assert template.fill((1, 2, sam, apple, None)) == "Sam has 1 apple. He gets 2 more."
+    assert template.fill((3, 2, mia, apple, None)) == "Mia has 3 apples. She gets 2 more."
+    assert template.pattern.fullmatch("Mia has 3 apples. She gets 2 more.")['b'] == '2'
+
+
+@pytest.mark.parametrize('text, error', [
+    ("{name} has {a} apples.", 'without both'),
+    ("{name} has {a} {item#a} and {b} {thing}.", 'not in the word table'),
+    ("{name} has {a} {item.shiny} and {b} more.", 'has no such form'),
+])
+def test_word_template_rejects_broken_templates(text, error):
+    with pytest.raises(ValueError, match=error):
+        mwg.WordTemplate('add', text, mwg.get_word_language('en'))
+
+
+def test_derived_word_forms():
+    assert mwg.korean_particle_forms({'one': '사과'}) == {'topic': '사과는', 'subject': '사과가', 'object': '사과를'}
+    assert mwg.korean_particle_forms({'one': '연필', 'counter': '개'})['subject'] == '연필이'
+    assert mwg.korean_particle_forms({'one': '연필', 'counter': '개'})['counter_object'] == '개를'
+    assert mwg.french_elision_forms({'one': 'autocollant', 'other': 'autocollants'}) == {'de': "d'autocollants"}
+    assert mwg.french_elision_forms({'one': 'pomme', 'other': 'pommes'}) == {'de': 'de pommes'}
+
+
+@pytest.mark.parametrize('lang', mwg.WORD_LANGUAGES)
+def test_word_problems_in_every_language(app, lang):
+    config = dict(app.config, mode='word', word_lang=mwg.WORD_LANGUAGES.index(lang), seed=lang)
+    problems = app.generate_problems(config)
+    assert len(problems) == 20 and len({text for text, _ in problems}) > 15
+    assert app.verify_problems(problems, config) == []
+    assert all('{' not in text and '}' not in text for text, _ in problems)